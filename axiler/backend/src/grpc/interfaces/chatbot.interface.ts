@@ -3,6 +3,7 @@ export interface ChatRequest {
   message: string;
   user_id: string;
   conversation_id?: string;
+  bypass_cache?: boolean;
 }
 
 export interface ChatResponse {
@@ -12,22 +13,39 @@ export interface ChatResponse {
   error?: string;
 }
 
+export interface BatchChatRequest {
+  items: ChatRequest[];
+  max_parallel?: number;
+}
+
+export interface BatchChatResult {
+  index: number;
+  thread_id: string;
+  content: string;
+  error?: string;
+}
+
 export interface HistoryRequest {
   thread_id: string;
   user_id?: string;
   conversation_id?: string;
+  limit?: number;
+  before_seq?: number;
+  after_seq?: number;
 }
 
 export interface HistoryResponse {
   thread_id: string;
   messages: Message[];
   error?: string;
+  has_more?: boolean;
 }
 
 export interface Message {
   role: string; // "human" or "ai"
   content: string;
   timestamp: number;
+  seq?: number;
 }
 
 export interface ClearRequest {
@@ -44,12 +62,15 @@ export interface ClearResponse {
 
 export interface UserConversationsRequest {
   user_id: string;
+  limit?: number;
+  cursor?: string;
 }
 
 export interface UserConversationsResponse {
   user_id: string;
   conversations: Conversation[];
   error?: string;
+  next_cursor?: string;
 }
 
 export interface Conversation {
@@ -61,17 +82,56 @@ export interface Conversation {
   message_count: number;
 }
 
+export interface ExportRequest {
+  user_id?: string;
+  since?: number;
+  until?: number;
+  cursor?: string;
+}
+
+export interface ExportChunk {
+  data: Buffer; // newline-delimited JSON records, one per message
+  cursor?: string;
+  records?: number;
+  error?: string;
+}
+
+export interface ImportResponse {
+  threads: number;
+  messages: number;
+  skipped: number;
+  failed: number;
+  error?: string;
+}
+
 export interface HealthCheckRequest {
 }
 
 export interface HealthCheckResponse {
   status: string;
+  in_flight?: number;
+  queued?: number;
+  max_in_flight?: number;
+  max_queue?: number;
+  saturation?: number;
+}
+
+export interface MetricsRequest {
+}
+
+export interface MetricsResponse {
+  text: string;
 }
 
 export interface ChatbotService {
   streamChat(request: ChatRequest): any;
   getHistory(request: HistoryRequest): Promise<HistoryResponse>;
+  streamHistory(request: HistoryRequest): any;
+  batchChat(request: BatchChatRequest): any;
   clearConversation(request: ClearRequest): Promise<ClearResponse>;
   getUserConversations(request: UserConversationsRequest): Promise<UserConversationsResponse>;
+  exportConversations(request: ExportRequest): any;
+  importConversations(chunks: any): any;
   healthCheck(request: HealthCheckRequest): Promise<HealthCheckResponse>;
+  getMetrics(request: MetricsRequest): Promise<MetricsResponse>;
 }
@@ -7,14 +7,21 @@ import {
   ChatbotService,
   ChatRequest,
   ChatResponse,
+  BatchChatRequest,
+  BatchChatResult,
   HistoryRequest,
   HistoryResponse,
   ClearRequest,
   ClearResponse,
   UserConversationsRequest,
   UserConversationsResponse,
+  ExportRequest,
+  ExportChunk,
+  ImportResponse,
   HealthCheckRequest,
   HealthCheckResponse,
+  MetricsRequest,
+  MetricsResponse,
 } from '../interfaces/chatbot.interface';
 
 @Injectable()
@@ -49,6 +56,20 @@ export class ChatbotClientService implements OnModuleInit {
     return this.chatbotService.getHistory(request);
   }
 
+  streamHistory(request: HistoryRequest): Observable<HistoryResponse> {
+    if (!this.chatbotService) {
+      throw new Error('Chatbot service not available');
+    }
+    return this.chatbotService.streamHistory(request);
+  }
+
+  batchChat(request: BatchChatRequest): Observable<BatchChatResult> {
+    if (!this.chatbotService) {
+      throw new Error('Chatbot service not available');
+    }
+    return this.chatbotService.batchChat(request);
+  }
+
   async clearConversation(request: ClearRequest): Promise<ClearResponse> {
     if (!this.chatbotService) {
       throw new Error('Chatbot service not available');
@@ -63,6 +84,20 @@ export class ChatbotClientService implements OnModuleInit {
     return this.chatbotService.getUserConversations(request);
   }
 
+  exportConversations(request: ExportRequest): Observable<ExportChunk> {
+    if (!this.chatbotService) {
+      throw new Error('Chatbot service not available');
+    }
+    return this.chatbotService.exportConversations(request);
+  }
+
+  importConversations(chunks: Observable<ExportChunk>): Observable<ImportResponse> {
+    if (!this.chatbotService) {
+      throw new Error('Chatbot service not available');
+    }
+    return this.chatbotService.importConversations(chunks);
+  }
+
   async healthCheck(request: HealthCheckRequest): Promise<HealthCheckResponse> {
     if (!this.chatbotService) {
       throw new Error('Chatbot service not available');
@@ -70,6 +105,13 @@ export class ChatbotClientService implements OnModuleInit {
     return this.chatbotService.healthCheck(request);
   }
 
+  async getMetrics(request: MetricsRequest): Promise<MetricsResponse> {
+    if (!this.chatbotService) {
+      throw new Error('Chatbot service not available');
+    }
+    return this.chatbotService.getMetrics(request);
+  }
+
   // Utility method to create thread_id
   createThreadId(userId: string, conversationId: string = 'main'): string {
     return `${userId}_${conversationId}`;
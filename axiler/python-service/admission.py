@@ -0,0 +1,345 @@
+import asyncio
+import fnmatch
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Optional
+
+# Lanes: chat turns of interactive callers (StreamChat) and offline work
+# (BatchChat items) are admitted with separate limits
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+class AdmissionRejected(Exception):
+    """Raised when a chat turn is refused because the server is saturated."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+def _parse_weights(spec: str) -> list:
+    """Parse ADMISSION_USER_WEIGHTS, e.g. "vip-*=4,batch-*=0.25"."""
+    weights = []
+    for entry in spec.split(","):
+        if entry.strip():
+            pattern, _, weight = entry.rpartition("=")
+            weights.append((pattern.strip(), max(0.01, float(weight))))
+    return weights
+
+class _TokenBucket:
+    """Refills at rate per second up to burst; the caller holds the controller's lock."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, amount: float) -> float:
+        """Seconds until amount can be taken (0 = now); more than burst only needs a full bucket."""
+        missing = min(amount, self.burst) - self.tokens
+        return max(0.0, missing / self.rate)
+
+class _Waiter:
+    """A turn waiting for a slot, woken when it is granted one."""
+
+    def __init__(self, wake: Callable[[], None]):
+        self.wake = wake
+        self.granted = False
+        self.abandoned = False
+
+class _Lane:
+    """Slots of one lane and its queue, ordered by weighted fair share."""
+
+    def __init__(self, max_in_flight: int, max_queue: int, max_wait: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queued = 0
+        # (start tag, sequence, waiter) of every queued turn
+        self.heap = []
+        # Start-time fair queueing: the lane's virtual time is the start tag of
+        # the turn admitted last; a user's next turn starts where their last
+        # queued one finishes, so a user with many queued turns falls behind
+        # users with few
+        self.virtual_time = 0.0
+        self.finish_tags = {}  # user id -> finish tag of their last queued turn
+        # Moving average of how long a turn holds its slot
+        self.turn_seconds = 0.0
+
+class AdmissionController:
+    """
+    Bounds the number of chat turns talking to the model at once.
+
+    Interactive turns and background (batch) turns have separate lanes, each
+    with its own concurrency limit and bounded queue, so a spike of batch
+    work never takes the slots of interactive callers. Turns beyond a lane's
+    limit wait for at most its max_wait seconds; when the queue is full, or
+    the wait runs out, the turn is rejected with a retry-after hint derived
+    from recent turn durations, so callers back off instead of piling up
+    behind a slow model.
+
+    Queued turns are admitted in weighted fair order across users rather than
+    first come, first served: one user with many turns waiting does not delay
+    the single turn of another. Each turn costs its estimated prompt tokens,
+    divided by the user's weight (ADMISSION_USER_WEIGHTS).
+
+    Per-user token buckets optionally bound each user's rate of turns and of
+    prompt tokens. Interactive turns over the rate are rejected with a
+    retry-after hint; background turns wait for their tokens.
+    """
+
+    def __init__(self):
+        # Turns allowed to run the graph (and call the model) concurrently
+        self.max_in_flight = max(1, int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "16")))
+        # Turns allowed to wait for a slot; further ones are rejected at once
+        self.max_queue = max(0, int(os.getenv("ADMISSION_MAX_QUEUE", "32")))
+        # Seconds a turn may wait for a slot before it is rejected
+        self.max_wait = float(os.getenv("ADMISSION_MAX_WAIT", "5"))
+        self._lanes = {
+            INTERACTIVE: _Lane(self.max_in_flight, self.max_queue, self.max_wait),
+            BACKGROUND: _Lane(
+                max(1, int(os.getenv("ADMISSION_BACKGROUND_MAX_IN_FLIGHT", "4"))),
+                max(0, int(os.getenv("ADMISSION_BACKGROUND_MAX_QUEUE", "256"))),
+                float(os.getenv("ADMISSION_BACKGROUND_MAX_WAIT", "300")),
+            ),
+        }
+
+        # Per-user limits: turns per second and estimated prompt tokens per second (0 = unlimited)
+        self.user_rate = float(os.getenv("ADMISSION_USER_RATE", "0"))
+        self.user_burst = float(os.getenv("ADMISSION_USER_BURST", "10"))
+        self.user_token_rate = float(os.getenv("ADMISSION_USER_TOKEN_RATE", "0"))
+        self.user_token_burst = float(os.getenv("ADMISSION_USER_TOKEN_BURST", "8000"))
+        self.user_weights = _parse_weights(os.getenv("ADMISSION_USER_WEIGHTS", ""))
+        self._buckets = {}  # user id -> (turn bucket, token bucket)
+
+        self.admitted = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+    @contextmanager
+    def blocking_slot(self, user_id: str = "", lane: str = INTERACTIVE, tokens: int = 0):
+        """
+        Hold a slot for the duration of a turn, waiting on the calling thread.
+
+        Args:
+            user_id: User the turn is for; turns are shared fairly across users
+            lane: INTERACTIVE or BACKGROUND
+            tokens: Estimated prompt tokens of the turn
+
+        Raises:
+            AdmissionRejected: The user is over their rate, the lane's queue is
+                full or no slot freed up within the lane's max_wait
+        """
+        self._throttle(user_id, lane, tokens)
+        with self._cond:
+            waiter = self._admit_or_queue(user_id, lane, tokens, self._cond.notify_all)
+            if waiter is not None:
+                deadline = time.monotonic() + self._lanes[lane].max_wait
+                while not waiter.granted:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._abandon(lane, waiter, "Timed out waiting for capacity")
+                    self._cond.wait(remaining)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._release(lane, time.monotonic() - start)
+
+    slot = blocking_slot
+
+    def stats(self) -> dict:
+        """
+        Current load.
+
+        Returns:
+            in_flight and queued turns of the interactive lane and its limits,
+            the same for the background lane (prefixed "background_"), admitted,
+            rejected and rate_limited totals, and saturation: the share of the
+            interactive in-flight plus queue capacity in use (1.0 means new
+            turns are rejected)
+        """
+        with self._lock:
+            stats = {}
+            for name, lane in self._lanes.items():
+                prefix = "" if name == INTERACTIVE else f"{name}_"
+                stats.update({
+                    f"{prefix}in_flight": lane.in_flight,
+                    f"{prefix}queued": lane.queued,
+                    f"{prefix}max_in_flight": lane.max_in_flight,
+                    f"{prefix}max_queue": lane.max_queue,
+                })
+            lane = self._lanes[INTERACTIVE]
+            capacity = lane.max_in_flight + lane.max_queue
+            stats.update({
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "rate_limited": self.rate_limited,
+                "saturation": round(min(1.0, (lane.in_flight + lane.queued) / capacity), 3),
+            })
+            return stats
+
+    def _throttle(self, user_id: str, lane: str, tokens: int):
+        """Take the turn from the user's buckets, waiting (background) or rejecting (interactive) when empty."""
+        if self.user_rate <= 0 and self.user_token_rate <= 0:
+            return
+        while True:
+            with self._lock:
+                wait = self._take(user_id, tokens)
+                if wait > 0 and lane == INTERACTIVE:
+                    self.rejected += 1
+                    self.rate_limited += 1
+                    raise AdmissionRejected("Rate limit exceeded", min(60, max(1, math.ceil(wait))))
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    # The helpers below must be called with self._lock held
+
+    def _take(self, user_id: str, tokens: int) -> float:
+        """Take one turn and its tokens from the user's buckets; returns the seconds to wait instead, if any."""
+        buckets = self._buckets.get(user_id)
+        if buckets is None:
+            if len(self._buckets) >= 10000:
+                self._prune_buckets()
+            buckets = self._buckets[user_id] = (
+                _TokenBucket(self.user_rate, self.user_burst) if self.user_rate > 0 else None,
+                _TokenBucket(self.user_token_rate, self.user_token_burst) if self.user_token_rate > 0 else None,
+            )
+        now = time.monotonic()
+        wait = 0.0
+        for bucket, amount in zip(buckets, (1, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait(amount))
+        if wait <= 0:
+            for bucket, amount in zip(buckets, (1, tokens)):
+                if bucket is not None:
+                    bucket.tokens -= min(amount, bucket.burst)
+        return wait
+
+    def _prune_buckets(self):
+        # Users whose buckets have refilled are indistinguishable from new ones
+        now = time.monotonic()
+        for user_id, buckets in list(self._buckets.items()):
+            for bucket in buckets:
+                if bucket is not None:
+                    bucket.refill(now)
+            if all(bucket is None or bucket.tokens >= bucket.burst for bucket in buckets):
+                del self._buckets[user_id]
+
+    def _weight(self, user_id: str) -> float:
+        for pattern, weight in self.user_weights:
+            if fnmatch.fnmatchcase(user_id, pattern):
+                return weight
+        return 1.0
+
+    def _admit_or_queue(self, user_id: str, lane_name: str, tokens: int, wake: Callable[[], None]) -> Optional[_Waiter]:
+        """Take a free slot (returns None) or queue the turn (returns its waiter)."""
+        lane = self._lanes[lane_name]
+        if lane.in_flight < lane.max_in_flight and lane.queued == 0:
+            self._acquire(lane)
+            return None
+        if lane.queued >= lane.max_queue:
+            raise self._reject(lane, "Server is at capacity")
+        start = max(lane.virtual_time, lane.finish_tags.get(user_id, 0.0))
+        lane.finish_tags[user_id] = start + max(1, tokens) / self._weight(user_id)
+        waiter = _Waiter(wake)
+        heapq.heappush(lane.heap, (start, next(self._sequence), waiter))
+        lane.queued += 1
+        return waiter
+
+    def _grant(self, lane: _Lane):
+        """Hand free slots to the queued turns with the lowest start tags."""
+        while lane.in_flight < lane.max_in_flight and lane.heap:
+            start, _, waiter = heapq.heappop(lane.heap)
+            if waiter.abandoned:
+                continue
+            lane.virtual_time = start
+            lane.queued -= 1
+            waiter.granted = True
+            self._acquire(lane)
+            waiter.wake()
+        if not lane.heap:
+            # Nobody is waiting: fair shares start over
+            lane.finish_tags.clear()
+
+    def _abandon(self, lane_name: str, waiter: _Waiter, reason: str = "") -> Optional[AdmissionRejected]:
+        """Remove a turn that gave up waiting from the queue; with a reason, it is rejected."""
+        lane = self._lanes[lane_name]
+        waiter.abandoned = True
+        lane.queued -= 1
+        return self._reject(lane, reason) if reason else None
+
+    def _acquire(self, lane: _Lane):
+        lane.in_flight += 1
+        self.admitted += 1
+
+    def _release(self, lane_name: str, seconds: Optional[float] = None):
+        lane = self._lanes[lane_name]
+        lane.in_flight -= 1
+        if seconds is not None:
+            lane.turn_seconds = seconds if not lane.turn_seconds else 0.8 * lane.turn_seconds + 0.2 * seconds
+        self._grant(lane)
+
+    def _reject(self, lane: _Lane, reason: str) -> AdmissionRejected:
+        self.rejected += 1
+        # Time for the turns ahead of a new caller to drain through the slots
+        backlog = (lane.in_flight + lane.queued) / lane.max_in_flight
+        retry_after = min(60, max(1, math.ceil(backlog * lane.turn_seconds)))
+        return AdmissionRejected(reason, retry_after)
+
+class AsyncAdmissionController(AdmissionController):
+    """
+    AdmissionController for the grpc.aio server, waiting on the event loop.
+
+    Batch items run on worker threads and still take their background slots
+    with blocking_slot().
+    """
+
+    @asynccontextmanager
+    async def slot(self, user_id: str = "", lane: str = INTERACTIVE, tokens: int = 0):
+        """Async variant of AdmissionController.slot()."""
+        # Interactive turns are never made to wait for their buckets, so this does not block
+        self._throttle(user_id, lane, tokens)
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        wake = lambda: loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+        with self._lock:
+            waiter = self._admit_or_queue(user_id, lane, tokens, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(granted, self._lanes[lane].max_wait)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    # Unless the slot was granted just as the wait ran out
+                    if not waiter.granted:
+                        raise self._abandon(lane, waiter, "Timed out waiting for capacity")
+            except asyncio.CancelledError:
+                # The caller went away while waiting
+                with self._lock:
+                    if waiter.granted:
+                        self._release(lane)
+                    else:
+                        self._abandon(lane, waiter)
+                raise
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._release(lane, time.monotonic() - start)
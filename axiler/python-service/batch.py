@@ -0,0 +1,318 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from langchain_core.messages import HumanMessage
+
+from admission import BACKGROUND, AdmissionController, AdmissionRejected
+from cancellation import CancelToken
+from context_window import estimate_tokens, message_text
+from memory import TurnMessages, memory_manager
+
+logger = logging.getLogger(__name__)
+
+def batch_item(index: int, message: str, user_id: str, conversation_id: str = "",
+               thread_id: str = "", bypass_cache: bool = False) -> dict:
+    """
+    Normalize one batch item.
+
+    Args:
+        index: Position of the item in the batch, echoed in its result
+        message: User's message
+        user_id: User identifier
+        conversation_id: Conversation identifier (default: "main")
+        thread_id: Thread identifier (default: "<user_id>_<conversation_id>")
+        bypass_cache: Always ask the model, ignoring cached replies
+
+    Returns:
+        Item dictionary accepted by BatchRunner.start()
+    """
+    user_id = (user_id or "").strip()
+    conversation_id = conversation_id or "main"
+    return {
+        "index": index,
+        "thread_id": thread_id or f"{user_id}_{conversation_id}",
+        "user_id": user_id,
+        "conversation_id": conversation_id,
+        "message": message or "",
+        "bypass_cache": bool(bypass_cache),
+    }
+
+def _result(item: dict, content: str = "", error: str = "", seconds: float = 0.0) -> dict:
+    return {
+        "index": item["index"],
+        "thread_id": item["thread_id"],
+        "content": content,
+        "error": error,
+        "seconds": round(seconds, 3),
+    }
+
+class RateLimiter:
+    """Token bucket limiting how many batch items per second reach the model."""
+
+    def __init__(self, rate: float):
+        """
+        Args:
+            rate: Items per second, with bursts of up to one second's worth; 0 disables the limit
+        """
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cancel_token: CancelToken) -> bool:
+        """
+        Wait for a token.
+
+        Returns:
+            True once a token was taken, False if the batch was cancelled meanwhile
+        """
+        if self.rate <= 0:
+            return not cancel_token.cancelled
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return not cancel_token.cancelled
+                wait = (1 - self._tokens) / self.rate
+            if cancel_token.sleep(wait):
+                return False
+
+class _TurnWriter:
+    """Records finished turns in the conversation catalog in groups, one transaction each."""
+
+    def __init__(self, group_size: int):
+        self.group_size = max(1, group_size)
+        self._turns = []
+        self._lock = threading.Lock()
+        # Held while a group is taken and written, so groups commit in the
+        # order they were filled
+        self._flush_lock = threading.Lock()
+
+    def add(self, turn: tuple):
+        with self._lock:
+            self._turns.append(turn)
+            full = len(self._turns) >= self.group_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                turns, self._turns = self._turns, []
+            memory_manager.record_turns(turns)
+
+class BatchRun:
+    """
+    A batch in progress.
+
+    Results are returned in the order items finish, one per item. Items that
+    had not started when the batch was cancelled report an error instead.
+    """
+
+    def __init__(self, runner: "BatchRunner", items: list, max_parallel: int, cancel_token: CancelToken):
+        self.total = len(items)
+        self.cancel_token = cancel_token
+        self._runner = runner
+        self._results = queue.Queue()
+        self._delivered = 0
+        self._limiter = RateLimiter(runner.rate)
+        self._writer = _TurnWriter(runner.write_group)
+
+        # Items of one thread run in order on one worker; threads run in parallel
+        threads = OrderedDict()
+        for item in items:
+            threads.setdefault(item["thread_id"], []).append(item)
+        self._work = queue.Queue()
+        for thread_items in threads.values():
+            self._work.put(thread_items)
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"batch-{i}", daemon=True)
+            for i in range(min(max_parallel, len(threads)))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def get(self) -> Optional[dict]:
+        """
+        Wait for the next finished item.
+
+        Returns:
+            The item's result (index, thread_id, content, error, seconds), or
+            None once every item has reported
+        """
+        if self._delivered >= self.total:
+            return None
+        result = self._results.get()
+        self._delivered += 1
+        return result
+
+    def __iter__(self) -> Iterator[dict]:
+        while True:
+            result = self.get()
+            if result is None:
+                return
+            yield result
+
+    def close(self):
+        """Cancel what has not finished, wait for the workers and record pending turns."""
+        if self._delivered < self.total:
+            self.cancel_token.cancel("cancelled")
+        for worker in self._workers:
+            worker.join()
+        self._writer.flush()
+
+    def _worker(self):
+        while True:
+            try:
+                thread_items = self._work.get_nowait()
+            except queue.Empty:
+                return
+            for item in thread_items:
+                self._results.put(self._run_item(item))
+
+    def _run_item(self, item: dict) -> dict:
+        if not item["message"]:
+            return _result(item, error="message is required")
+        if not item["user_id"]:
+            return _result(item, error="user_id is required")
+        if not self._limiter.acquire(self.cancel_token):
+            return _result(item, error=f"Batch cancelled: {self.cancel_token.reason}")
+
+        start = time.perf_counter()
+        scheduler = self._runner.scheduler
+        if scheduler is None:
+            return self._run_turn(item, start)
+        # Keys of chat turns are never equal to this, so items are not coalesced with them
+        ran, result = scheduler.call(item["thread_id"], ("batch", id(self), item["index"]),
+                                     lambda: self._run_turn(item, start), self.cancel_token)
+        if ran:
+            return result
+        if self.cancel_token.cancelled:
+            return _result(item, error=f"Batch cancelled: {self.cancel_token.reason}",
+                           seconds=time.perf_counter() - start)
+        return _result(item, error="Another message is already being processed for this thread",
+                       seconds=time.perf_counter() - start)
+
+    def _run_turn(self, item: dict, start: float) -> dict:
+        try:
+            config = {"configurable": {"thread_id": item["thread_id"], "user_id": item["user_id"],
+                                       "cancel_token": self.cancel_token}}
+            if item["bypass_cache"]:
+                config["configurable"]["bypass_cache"] = True
+            received_at = datetime.now(timezone.utc)
+            config["configurable"]["received_at"] = received_at
+            message = HumanMessage(content=item["message"])
+
+            # No tokens are streamed, and durability="exit" writes one
+            # checkpoint per item instead of one per graph step
+            turn = TurnMessages()
+            with self._runner.slot(item["user_id"], estimate_tokens([message])):
+                try:
+                    for values in self._runner.graph.stream({"messages": [message]}, config,
+                                                            stream_mode="values", durability="exit"):
+                        turn.update(values)
+                finally:
+                    # Also records the user's message of an item that failed
+                    self._writer.add((item["thread_id"], item["user_id"], item["conversation_id"],
+                                      turn.messages, turn.added, received_at))
+            last = turn.messages[-1]
+            # A turn cancelled before the model produced text keeps only the user's message
+            reply = message_text(last.content) if last.type == "ai" else ""
+
+            error = ""
+            if self.cancel_token.cancelled:
+                error = f"Response truncated: {self.cancel_token.reason}"
+            return _result(item, reply, error, time.perf_counter() - start)
+
+        except AdmissionRejected as e:
+            return _result(item, error=f"{e} (retry after {e.retry_after}s)", seconds=time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Error in batch item {item['index']} for thread_id {item['thread_id']}: {str(e)}")
+            return _result(item, error=f"Internal server error: {str(e)}", seconds=time.perf_counter() - start)
+
+class BatchRunner:
+    """
+    Runs many chat turns through the graph for offline jobs.
+
+    Items are run with bounded parallelism and an optional rate limit on the
+    model, without streaming tokens. Catalog and history writes of finished
+    turns are grouped into shared transactions. A failing item is reported in
+    its own result and does not affect the rest of the batch.
+    """
+
+    def __init__(self, graph, admission: Optional[AdmissionController] = None, scheduler=None):
+        """
+        Args:
+            graph: Compiled chatbot graph with a sync checkpointer
+            admission: Admission controller of the server; items take slots in
+                its background lane, so batches never hold interactive slots
+            scheduler: Thread scheduler of the server (see ThreadScheduler.call()
+                in grpc_server.py); each item runs as a turn of its thread, so it
+                never races the thread's chat turns or other batches on the checkpoint
+        """
+        self.graph = graph
+        self.admission = admission
+        self.scheduler = scheduler
+        # Items running at once; a request may ask for fewer
+        self.max_parallel = max(1, int(os.getenv("BATCH_MAX_PARALLEL", "8")))
+        # Items per second sent to the model (0 = unlimited)
+        self.rate = float(os.getenv("BATCH_RATE_LIMIT", "0"))
+        # Finished turns recorded per catalog transaction
+        self.write_group = int(os.getenv("BATCH_WRITE_GROUP", "50"))
+
+    def slot(self, user_id: str, tokens: int):
+        """Hold a background admission slot for one item (no limit without an admission controller)."""
+        if self.admission is None:
+            return nullcontext()
+        return self.admission.blocking_slot(user_id, BACKGROUND, tokens)
+
+    def start(self, items: list, max_parallel: int = 0, cancel_token: Optional[CancelToken] = None) -> BatchRun:
+        """
+        Start running a batch.
+
+        Args:
+            items: Item dictionaries from batch_item()
+            max_parallel: Items run at once, capped at BATCH_MAX_PARALLEL (0 = the cap)
+            cancel_token: Stops the batch when cancelled or past its deadline
+
+        Returns:
+            The running batch; close() it when done
+        """
+        parallel = min(max_parallel, self.max_parallel) if max_parallel > 0 else self.max_parallel
+        return BatchRun(self, items, parallel, cancel_token or CancelToken())
+
+def read_batch_file(path: str) -> list:
+    """
+    Read batch items from a JSON Lines file.
+
+    Each line is an object with "message" and "user_id", and optionally
+    "conversation_id", "thread_id" and "bypass_cache".
+    """
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            items.append(batch_item(
+                len(items),
+                entry.get("message", ""),
+                entry.get("user_id", ""),
+                entry.get("conversation_id", ""),
+                entry.get("thread_id", ""),
+                entry.get("bypass_cache", False),
+            ))
+    return items
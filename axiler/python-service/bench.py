@@ -0,0 +1,241 @@
+"""
+Load test and benchmark for the gRPC service.
+
+Starts `main.py grpc` in a subprocess with the stub model backend, drives
+StreamChat, GetHistory and GetUserConversations at each concurrency level
+and prints (or writes) a JSON report that can be compared across commits:
+
+    python bench.py --concurrency 1,8,32 --duration 10 --out bench.json
+    python bench.py --database-url postgresql://... --aio
+
+Without --database-url the server runs on the in-memory checkpointer.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+
+import grpc
+
+import chatbot_pb2
+import chatbot_pb2_grpc
+
+RPCS = ("StreamChat", "GetHistory", "GetUserConversations")
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def summarize(rpc: str, concurrency: int, seconds: float, latencies: list, first_chunks: list, errors: int) -> dict:
+    """Throughput and latency percentiles (in milliseconds) of one benchmark level."""
+    result = {
+        "rpc": rpc,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / seconds, 2) if seconds else 0.0,
+    }
+    for p in (50, 95, 99):
+        result[f"latency_p{p}_ms"] = round(percentile(latencies, p) * 1000, 2)
+    if rpc == "StreamChat":
+        for p in (50, 95, 99):
+            result[f"ttft_p{p}_ms"] = round(percentile(first_chunks, p) * 1000, 2)
+    return result
+
+class Workload:
+    """Requests of one run; every worker chats on its own thread so turns never queue behind each other."""
+
+    def __init__(self, run_id: str, users: int):
+        self.run_id = run_id
+        self.users = users
+
+    def user_id(self, worker: int) -> str:
+        return f"bench{self.run_id}u{worker % self.users}"
+
+    def thread(self, worker: int):
+        user_id = self.user_id(worker)
+        conversation_id = f"w{worker}"
+        return f"{user_id}_{conversation_id}", user_id, conversation_id
+
+async def _stream_chat(stub, workload: Workload, worker: int, n: int, first_chunks: list):
+    thread_id, user_id, conversation_id = workload.thread(worker)
+    start = time.perf_counter()
+    first = None
+    async for response in stub.StreamChat(chatbot_pb2.ChatRequest(
+            thread_id=thread_id, user_id=user_id, conversation_id=conversation_id,
+            message=f"benchmark message {n} from worker {worker}")):
+        if response.error:
+            raise RuntimeError(response.error)
+        if first is None and response.content:
+            first = time.perf_counter() - start
+    if first is not None:
+        first_chunks.append(first)
+
+async def _get_history(stub, workload: Workload, worker: int, n: int, first_chunks: list):
+    thread_id, user_id, conversation_id = workload.thread(worker)
+    response = await stub.GetHistory(chatbot_pb2.HistoryRequest(
+        thread_id=thread_id, user_id=user_id, conversation_id=conversation_id))
+    if response.error:
+        raise RuntimeError(response.error)
+
+async def _get_user_conversations(stub, workload: Workload, worker: int, n: int, first_chunks: list):
+    response = await stub.GetUserConversations(chatbot_pb2.UserConversationsRequest(
+        user_id=workload.user_id(worker)))
+    if response.error:
+        raise RuntimeError(response.error)
+
+CALLS = {
+    "StreamChat": _stream_chat,
+    "GetHistory": _get_history,
+    "GetUserConversations": _get_user_conversations,
+}
+
+async def run_level(stub, workload: Workload, rpc: str, concurrency: int, duration: float, warmup: float) -> dict:
+    """
+    Call one RPC from `concurrency` workers in a closed loop.
+
+    Requests completing during the warmup are not measured.
+    """
+    call = CALLS[rpc]
+    latencies, first_chunks = [], []
+    errors = 0
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def worker(index: int):
+        nonlocal errors
+        n = 0
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            chunks = []
+            try:
+                await call(stub, workload, index, n, chunks)
+                failed = False
+            except (grpc.RpcError, RuntimeError):
+                failed = True
+            n += 1
+            if start < measure_from:
+                continue
+            if failed:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+                first_chunks.extend(chunks)
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - max(measure_from, started)
+    return summarize(rpc, concurrency, min(elapsed, duration) or elapsed, latencies, first_chunks, errors)
+
+def start_server(port: int, args) -> subprocess.Popen:
+    """Start `main.py grpc` with the stub model; the environment is passed through otherwise."""
+    env = dict(os.environ)
+    env.update({
+        "CHAT_MODEL_BACKEND": "stub",
+        "STUB_MODEL_LATENCY": str(args.latency),
+        "STUB_MODEL_TOKENS_PER_SECOND": str(args.token_rate),
+        "STUB_MODEL_REPLY_TOKENS": str(args.reply_tokens),
+        # An empty URL makes MemoryManager fall back to MemorySaver
+        "DATABASE_URL": args.database_url,
+    })
+    command = [sys.executable, "main.py", "grpc", str(port)] + (["--aio"] if args.aio else [])
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+async def wait_ready(stub, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            response = await stub.HealthCheck(chatbot_pb2.HealthCheckRequest(), timeout=1)
+            if response.status == "SERVING":
+                return
+        except grpc.RpcError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Server did not become ready")
+        await asyncio.sleep(0.2)
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+async def run(args) -> dict:
+    server = start_server(args.port, args)
+    try:
+        async with grpc.aio.insecure_channel(f"localhost:{args.port}") as channel:
+            stub = chatbot_pb2_grpc.ChatbotServiceStub(channel)
+            await wait_ready(stub)
+            workload = Workload(uuid.uuid4().hex[:8], args.users)
+            results = []
+            # StreamChat runs first at each level so the read RPCs find the threads it created
+            for concurrency in args.concurrency:
+                for rpc in args.rpcs:
+                    result = await run_level(stub, workload, rpc, concurrency, args.duration, args.warmup)
+                    print(json.dumps(result), file=sys.stderr)
+                    results.append(result)
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "meta": {
+            "commit": _commit(),
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "server_mode": "aio" if args.aio else "sync",
+            "storage": "postgres" if args.database_url else "memory",
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "users": args.users,
+            "stub_model": {
+                "latency_s": args.latency,
+                "tokens_per_second": args.token_rate,
+                "reply_tokens": args.reply_tokens,
+            },
+        },
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chatbot gRPC service with a stub model")
+    parser.add_argument("--concurrency", default="1,8,32",
+                        help="Comma-separated concurrency levels (default: 1,8,32)")
+    parser.add_argument("--rpcs", default=",".join(RPCS), help="Comma-separated RPCs to drive (default: all)")
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds per RPC and level")
+    parser.add_argument("--warmup", type=float, default=1, help="Unmeasured seconds before each level")
+    parser.add_argument("--users", type=int, default=10, help="Distinct user ids the workers spread over")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub model seconds to first token")
+    parser.add_argument("--token-rate", type=float, default=50, help="Stub model tokens per second")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="Stub model tokens per reply")
+    parser.add_argument("--database-url", default="", help="PostgreSQL URL (default: in-memory checkpointer)")
+    parser.add_argument("--aio", action="store_true", help="Benchmark the grpc.aio server")
+    parser.add_argument("--port", type=int, default=50151)
+    parser.add_argument("--server-log", default="", help="File for the server's output")
+    parser.add_argument("--out", default="", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.rpcs = [rpc for rpc in RPCS if rpc in args.rpcs.split(",")]
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark of checkpoint encodings.
+
+Encodes and decodes the messages channel of synthetic threads with
+LangGraph's default serializer (the current format) and with
+CompactSerializer for every available codec, and prints (or writes) a JSON
+report of the encoded size and the encode/decode time:
+
+    python bench_serde.py --turns 10,100,500 --out serde.json
+    python bench_serde.py --codecs zlib,zstd --threshold 1024
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from serializer import CompactSerializer, get_codec
+
+# Words the synthetic messages are made of; repetitive like real chat text
+_WORDS = (
+    "the conversation memory service stores every message of a thread in a checkpoint so that "
+    "replies can use the earlier turns and users can read their history later on any device"
+).split()
+
+def make_messages(turns: int, seed: int = 0) -> list:
+    """A thread of `turns` user messages and model replies, with reply metadata like Gemini's."""
+    rng = random.Random(seed)
+    messages = []
+    for turn in range(turns):
+        question = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(5, 40)))
+        reply = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(40, 300)))
+        messages.append(HumanMessage(content=question, id=f"human-{turn}"))
+        messages.append(AIMessage(
+            content=reply,
+            id=f"ai-{turn}",
+            response_metadata={"finish_reason": "STOP", "model_name": "gemini-2.5-flash"},
+            usage_metadata={"input_tokens": 40 * turn + 20, "output_tokens": len(reply) // 4,
+                            "total_tokens": 40 * turn + 20 + len(reply) // 4},
+        ))
+    return messages
+
+def time_per_call(fn, repeat: int) -> float:
+    """Best-of-three mean seconds per call of fn."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+def measure(name: str, serde, messages: list, repeat: int) -> dict:
+    """Encoded size and encode/decode time of one serializer."""
+    encoded = serde.dumps_typed(messages)
+    decoded = serde.loads_typed(encoded)
+    if [m.content for m in decoded] != [m.content for m in messages]:
+        raise AssertionError(f"{name} did not round-trip")
+    return {
+        "format": name,
+        "type": encoded[0],
+        "bytes": len(encoded[1]),
+        "encode_us": round(time_per_call(lambda: serde.dumps_typed(messages), repeat) * 1e6, 1),
+        "decode_us": round(time_per_call(lambda: serde.loads_typed(encoded), repeat) * 1e6, 1),
+    }
+
+def available_codecs(names: list) -> list:
+    codecs = []
+    for name in names:
+        try:
+            codecs.append(get_codec(name))
+        except ValueError as e:
+            print(f"Skipping {name}: {e}", file=sys.stderr)
+    return codecs
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpoint encoding micro-benchmark")
+    parser.add_argument("--turns", default="10,100,500", help="Comma-separated thread lengths, in turns")
+    parser.add_argument("--codecs", default="zlib,zstd,lz4", help="Comma-separated codecs to compare")
+    parser.add_argument("--threshold", type=int, default=4096, help="CompactSerializer compression threshold")
+    parser.add_argument("--repeat", type=int, default=0, help="Calls per timing (0 = scaled to the thread length)")
+    parser.add_argument("--out", default="", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    codecs = available_codecs([name for name in args.codecs.split(",") if name])
+    results = []
+    for turns in (int(t) for t in args.turns.split(",") if t):
+        messages = make_messages(turns)
+        repeat = args.repeat or max(3, 2000 // turns)
+        serializers = [("default", JsonPlusSerializer())]
+        serializers += [(f"compact-{codec.name}", CompactSerializer(codec=codec, threshold=args.threshold))
+                        for codec in codecs]
+        baseline = None
+        for name, serde in serializers:
+            result = {"turns": turns, **measure(name, serde, messages, repeat)}
+            baseline = baseline or result
+            result["size_ratio"] = round(result["bytes"] / baseline["bytes"], 3)
+            results.append(result)
+            print(f"{turns:>5} turns  {name:<14} {result['bytes']:>9} B  "
+                  f"encode {result['encode_us']:>9.1f} us  decode {result['decode_us']:>9.1f} us  "
+                  f"size x{result['size_ratio']}", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "threshold": args.threshold,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
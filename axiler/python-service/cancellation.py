@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import AsyncIterator, Optional
+
+class CancelToken:
+    """
+    Tells a running turn to stop generating.
+
+    Set when every caller of the turn has gone away, or once the turn's
+    deadline has passed. Passed to the chatbot node as the "cancel_token"
+    configurable, which stops reading the model stream and keeps what has
+    been generated so far as a truncated reply.
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        """
+        Args:
+            deadline: time.monotonic() value after which the turn is cancelled, or None
+        """
+        self.deadline = deadline
+        self.reason = None
+        self._event = threading.Event()
+        self._waiters = []  # (loop, asyncio.Event) of coroutines in wait()
+        self._future = None
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str = "cancelled"):
+        """Cancel the turn; the first reason given is kept."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            waiters, self._waiters = self._waiters, []
+            future = self._future
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+        if future is not None:
+            future.set_result(reason)
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline_exceeded")
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline, or None without one."""
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def sleep(self, seconds: float) -> bool:
+        """Block for up to `seconds`; returns True as soon as the token is cancelled."""
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self._event.wait(remaining)
+        else:
+            self._event.wait(seconds)
+        return self.cancelled
+
+    def future(self) -> Future:
+        """
+        A future that completes once the token is cancelled.
+
+        Lets blocking code wait for other futures and the token together. The
+        deadline does not complete it: use remaining() as the wait's timeout.
+        """
+        with self._lock:
+            if self._future is None:
+                self._future = Future()
+                if self._event.is_set():
+                    self._future.set_result(self.reason)
+            return self._future
+
+    async def wait(self):
+        """Return once the token is cancelled or its deadline has passed."""
+        event = asyncio.Event()
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._waiters.append((asyncio.get_running_loop(), event))
+        try:
+            await asyncio.wait_for(event.wait(), self.remaining())
+        except asyncio.TimeoutError:
+            self.cancel("deadline_exceeded")
+        finally:
+            with self._lock:
+                self._waiters = [w for w in self._waiters if w[1] is not event]
+
+async def next_or_cancel(iterator: AsyncIterator, token: CancelToken):
+    """
+    Await the next item of an async iterator unless the token fires first.
+
+    Unlike checking the token between items, this also interrupts a model
+    stream that has stalled.
+
+    Returns:
+        The next item, or None if the token fired (the pending read is cancelled)
+
+    Raises:
+        StopAsyncIteration: The iterator is exhausted
+    """
+    next_item = asyncio.ensure_future(iterator.__anext__())
+    cancelled = asyncio.ensure_future(token.wait())
+    try:
+        await asyncio.wait({next_item, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        cancelled.cancel()
+    if next_item.done():
+        return next_item.result()
+    next_item.cancel()
+    try:
+        await next_item
+    except (asyncio.CancelledError, StopAsyncIteration):
+        pass
+    return None
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rchatbot.proto\x12\x07\x63hatbot\"[\n\x0b\x43hatRequest\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07user_id\x18\x03 \x01(\t\x12\x17\n\x0f\x63onversation_id\x18\x04 \x01(\t\"V\n\x0c\x43hatResponse\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\t\x12\x13\n\x0bis_complete\x18\x03 \x01(\x08\x12\r\n\x05\x65rror\x18\x04 \x01(\t\"M\n\x0eHistoryRequest\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\x12\x17\n\x0f\x63onversation_id\x18\x03 \x01(\t\"W\n\x0fHistoryResponse\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\"\n\x08messages\x18\x02 \x03(\x0b\x32\x10.chatbot.Message\x12\r\n\x05\x65rror\x18\x03 \x01(\t\";\n\x07Message\x12\x0c\n\x04role\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\t\x12\x11\n\ttimestamp\x18\x03 \x01(\x03\"K\n\x0c\x43learRequest\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\x12\x17\n\x0f\x63onversation_id\x18\x03 \x01(\t\"B\n\rClearResponse\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\r\n\x05\x65rror\x18\x03 \x01(\t\"+\n\x18UserConversationsRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\"i\n\x19UserConversationsResponse\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12,\n\rconversations\x18\x02 \x03(\x0b\x32\x15.chatbot.Conversation\x12\r\n\x05\x65rror\x18\x03 \x01(\t\"\x93\x01\n\x0c\x43onversation\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x17\n\x0f\x63onversation_id\x18\x02 \x01(\t\x12\x15\n\rfirst_message\x18\x03 \x01(\t\x12\x12\n\ncreated_at\x18\x04 \x01(\x03\x12\x15\n\rlast_activity\x18\x05 \x01(\x03\x12\x15\n\rmessage_count\x18\x06 \x01(\x05\"\x14\n\x12HealthCheckRequest\"%\n\x13HealthCheckResponse\x12\x0e\n\x06status\x18\x01 \x01(\t2\xfb\x02\n\x0e\x43hatbotService\x12;\n\nStreamChat\x12\x14.chatbot.ChatRequest\x1a\x15.chatbot.ChatResponse0\x01\x12?\n\nGetHistory\x12\x17.chatbot.HistoryRequest\x1a\x18.chatbot.HistoryResponse\x12\x42\n\x11\x43learConversation\x12\x15.chatbot.ClearRequest\x1a\x16.chatbot.ClearResponse\x12]\n\x14GetUserConversations\x12!.chatbot.UserConversationsRequest\x1a\".chatbot.UserConversationsResponse\x12H\n\x0bHealthCheck\x12\x1b.chatbot.HealthCheckRequest\x1a\x1c.chatbot.HealthCheckResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rchatbot.proto\x12\x07\x63hatbot\"q\n\x0b\x43hatRequest\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07user_id\x18\x03 \x01(\t\x12\x17\n\x0f\x63onversation_id\x18\x04 \x01(\t\x12\x14\n\x0c\x62ypass_cache\x18\x05 \x01(\x08\"V\n\x0c\x43hatResponse\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\t\x12\x13\n\x0bis_complete\x18\x03 \x01(\x08\x12\r\n\x05\x65rror\x18\x04 \x01(\t\"M\n\x10\x42\x61tchChatRequest\x12#\n\x05items\x18\x01 \x03(\x0b\x32\x14.chatbot.ChatRequest\x12\x14\n\x0cmax_parallel\x18\x02 \x01(\x05\"S\n\x0f\x42\x61tchChatResult\x12\r\n\x05index\x18\x01 \x01(\x05\x12\x11\n\tthread_id\x18\x02 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x03 \x01(\t\x12\r\n\x05\x65rror\x18\x04 \x01(\t\"\x83\x01\n\x0eHistoryRequest\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\x12\x17\n\x0f\x63onversation_id\x18\x03 \x01(\t\x12\r\n\x05limit\x18\x04 \x01(\x05\x12\x12\n\nbefore_seq\x18\x05 \x01(\x03\x12\x11\n\tafter_seq\x18\x06 \x01(\x03\"i\n\x0fHistoryResponse\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\"\n\x08messages\x18\x02 \x03(\x0b\x32\x10.chatbot.Message\x12\r\n\x05\x65rror\x18\x03 \x01(\t\x12\x10\n\x08has_more\x18\x04 \x01(\x08\"H\n\x07Message\x12\x0c\n\x04role\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\t\x12\x11\n\ttimestamp\x18\x03 \x01(\x03\x12\x0b\n\x03seq\x18\x04 \x01(\x03\"K\n\x0c\x43learRequest\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07user_id\x18\x02 \x01(\t\x12\x17\n\x0f\x63onversation_id\x18\x03 \x01(\t\"B\n\rClearResponse\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\r\n\x05\x65rror\x18\x03 \x01(\t\"J\n\x18UserConversationsRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\r\n\x05limit\x18\x02 \x01(\x05\x12\x0e\n\x06\x63ursor\x18\x03 \x01(\t\"~\n\x19UserConversationsResponse\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12,\n\rconversations\x18\x02 \x03(\x0b\x32\x15.chatbot.Conversation\x12\r\n\x05\x65rror\x18\x03 \x01(\t\x12\x13\n\x0bnext_cursor\x18\x04 \x01(\t\"\x93\x01\n\x0c\x43onversation\x12\x11\n\tthread_id\x18\x01 \x01(\t\x12\x17\n\x0f\x63onversation_id\x18\x02 \x01(\t\x12\x15\n\rfirst_message\x18\x03 \x01(\t\x12\x12\n\ncreated_at\x18\x04 \x01(\x03\x12\x15\n\rlast_activity\x18\x05 \x01(\x03\x12\x15\n\rmessage_count\x18\x06 \x01(\x05\"N\n\rExportRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\r\n\x05since\x18\x02 \x01(\x03\x12\r\n\x05until\x18\x03 \x01(\x03\x12\x0e\n\x06\x63ursor\x18\x04 \x01(\t\"K\n\x0b\x45xportChunk\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\x12\x0e\n\x06\x63ursor\x18\x02 \x01(\t\x12\x0f\n\x07records\x18\x03 \x01(\x05\x12\r\n\x05\x65rror\x18\x04 \x01(\t\"c\n\x0eImportResponse\x12\x0f\n\x07threads\x18\x01 \x01(\x05\x12\x10\n\x08messages\x18\x02 \x01(\x03\x12\x0f\n\x07skipped\x18\x03 \x01(\x05\x12\x0e\n\x06\x66\x61iled\x18\x04 \x01(\x05\x12\r\n\x05\x65rror\x18\x05 \x01(\t\"\x14\n\x12HealthCheckRequest\"\x86\x01\n\x13HealthCheckResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x11\n\tin_flight\x18\x02 \x01(\x05\x12\x0e\n\x06queued\x18\x03 \x01(\x05\x12\x15\n\rmax_in_flight\x18\x04 \x01(\x05\x12\x11\n\tmax_queue\x18\x05 \x01(\x05\x12\x12\n\nsaturation\x18\x06 \x01(\x02\"\x10\n\x0eMetricsRequest\"\x1f\n\x0fMetricsResponse\x12\x0c\n\x04text\x18\x01 \x01(\t2\xd5\x05\n\x0e\x43hatbotService\x12;\n\nStreamChat\x12\x14.chatbot.ChatRequest\x1a\x15.chatbot.ChatResponse0\x01\x12?\n\nGetHistory\x12\x17.chatbot.HistoryRequest\x1a\x18.chatbot.HistoryResponse\x12\x44\n\rStreamHistory\x12\x17.chatbot.HistoryRequest\x1a\x18.chatbot.HistoryResponse0\x01\x12\x42\n\tBatchChat\x12\x19.chatbot.BatchChatRequest\x1a\x18.chatbot.BatchChatResult0\x01\x12\x42\n\x11\x43learConversation\x12\x15.chatbot.ClearRequest\x1a\x16.chatbot.ClearResponse\x12]\n\x14GetUserConversations\x12!.chatbot.UserConversationsRequest\x1a\".chatbot.UserConversationsResponse\x12\x45\n\x13\x45xportConversations\x12\x16.chatbot.ExportRequest\x1a\x14.chatbot.ExportChunk0\x01\x12\x46\n\x13ImportConversations\x12\x14.chatbot.ExportChunk\x1a\x17.chatbot.ImportResponse(\x01\x12H\n\x0bHealthCheck\x12\x1b.chatbot.HealthCheckRequest\x1a\x1c.chatbot.HealthCheckResponse\x12?\n\nGetMetrics\x12\x17.chatbot.MetricsRequest\x1a\x18.chatbot.MetricsResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -32,29 +32,43 @@ _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'chatbot_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
   _globals['_CHATREQUEST']._serialized_start=26
-  _globals['_CHATREQUEST']._serialized_end=117
-  _globals['_CHATRESPONSE']._serialized_start=119
-  _globals['_CHATRESPONSE']._serialized_end=205
-  _globals['_HISTORYREQUEST']._serialized_start=207
-  _globals['_HISTORYREQUEST']._serialized_end=284
-  _globals['_HISTORYRESPONSE']._serialized_start=286
-  _globals['_HISTORYRESPONSE']._serialized_end=373
-  _globals['_MESSAGE']._serialized_start=375
-  _globals['_MESSAGE']._serialized_end=434
-  _globals['_CLEARREQUEST']._serialized_start=436
-  _globals['_CLEARREQUEST']._serialized_end=511
-  _globals['_CLEARRESPONSE']._serialized_start=513
-  _globals['_CLEARRESPONSE']._serialized_end=579
-  _globals['_USERCONVERSATIONSREQUEST']._serialized_start=581
-  _globals['_USERCONVERSATIONSREQUEST']._serialized_end=624
-  _globals['_USERCONVERSATIONSRESPONSE']._serialized_start=626
-  _globals['_USERCONVERSATIONSRESPONSE']._serialized_end=731
-  _globals['_CONVERSATION']._serialized_start=734
-  _globals['_CONVERSATION']._serialized_end=881
-  _globals['_HEALTHCHECKREQUEST']._serialized_start=883
-  _globals['_HEALTHCHECKREQUEST']._serialized_end=903
-  _globals['_HEALTHCHECKRESPONSE']._serialized_start=905
-  _globals['_HEALTHCHECKRESPONSE']._serialized_end=942
-  _globals['_CHATBOTSERVICE']._serialized_start=945
-  _globals['_CHATBOTSERVICE']._serialized_end=1324
+  _globals['_CHATREQUEST']._serialized_end=139
+  _globals['_CHATRESPONSE']._serialized_start=141
+  _globals['_CHATRESPONSE']._serialized_end=227
+  _globals['_BATCHCHATREQUEST']._serialized_start=229
+  _globals['_BATCHCHATREQUEST']._serialized_end=306
+  _globals['_BATCHCHATRESULT']._serialized_start=308
+  _globals['_BATCHCHATRESULT']._serialized_end=391
+  _globals['_HISTORYREQUEST']._serialized_start=394
+  _globals['_HISTORYREQUEST']._serialized_end=525
+  _globals['_HISTORYRESPONSE']._serialized_start=527
+  _globals['_HISTORYRESPONSE']._serialized_end=632
+  _globals['_MESSAGE']._serialized_start=634
+  _globals['_MESSAGE']._serialized_end=706
+  _globals['_CLEARREQUEST']._serialized_start=708
+  _globals['_CLEARREQUEST']._serialized_end=783
+  _globals['_CLEARRESPONSE']._serialized_start=785
+  _globals['_CLEARRESPONSE']._serialized_end=851
+  _globals['_USERCONVERSATIONSREQUEST']._serialized_start=853
+  _globals['_USERCONVERSATIONSREQUEST']._serialized_end=927
+  _globals['_USERCONVERSATIONSRESPONSE']._serialized_start=929
+  _globals['_USERCONVERSATIONSRESPONSE']._serialized_end=1055
+  _globals['_CONVERSATION']._serialized_start=1058
+  _globals['_CONVERSATION']._serialized_end=1205
+  _globals['_EXPORTREQUEST']._serialized_start=1207
+  _globals['_EXPORTREQUEST']._serialized_end=1285
+  _globals['_EXPORTCHUNK']._serialized_start=1287
+  _globals['_EXPORTCHUNK']._serialized_end=1362
+  _globals['_IMPORTRESPONSE']._serialized_start=1364
+  _globals['_IMPORTRESPONSE']._serialized_end=1463
+  _globals['_HEALTHCHECKREQUEST']._serialized_start=1465
+  _globals['_HEALTHCHECKREQUEST']._serialized_end=1485
+  _globals['_HEALTHCHECKRESPONSE']._serialized_start=1488
+  _globals['_HEALTHCHECKRESPONSE']._serialized_end=1622
+  _globals['_METRICSREQUEST']._serialized_start=1624
+  _globals['_METRICSREQUEST']._serialized_end=1640
+  _globals['_METRICSRESPONSE']._serialized_start=1642
+  _globals['_METRICSRESPONSE']._serialized_end=1673
+  _globals['_CHATBOTSERVICE']._serialized_start=1676
+  _globals['_CHATBOTSERVICE']._serialized_end=2401
 # @@protoc_insertion_point(module_scope)
@@ -45,6 +45,16 @@ class ChatbotServiceStub(object):
                 request_serializer=chatbot__pb2.HistoryRequest.SerializeToString,
                 response_deserializer=chatbot__pb2.HistoryResponse.FromString,
                 _registered_method=True)
+        self.StreamHistory = channel.unary_stream(
+                '/chatbot.ChatbotService/StreamHistory',
+                request_serializer=chatbot__pb2.HistoryRequest.SerializeToString,
+                response_deserializer=chatbot__pb2.HistoryResponse.FromString,
+                _registered_method=True)
+        self.BatchChat = channel.unary_stream(
+                '/chatbot.ChatbotService/BatchChat',
+                request_serializer=chatbot__pb2.BatchChatRequest.SerializeToString,
+                response_deserializer=chatbot__pb2.BatchChatResult.FromString,
+                _registered_method=True)
         self.ClearConversation = channel.unary_unary(
                 '/chatbot.ChatbotService/ClearConversation',
                 request_serializer=chatbot__pb2.ClearRequest.SerializeToString,
@@ -55,11 +65,26 @@ class ChatbotServiceStub(object):
                 request_serializer=chatbot__pb2.UserConversationsRequest.SerializeToString,
                 response_deserializer=chatbot__pb2.UserConversationsResponse.FromString,
                 _registered_method=True)
+        self.ExportConversations = channel.unary_stream(
+                '/chatbot.ChatbotService/ExportConversations',
+                request_serializer=chatbot__pb2.ExportRequest.SerializeToString,
+                response_deserializer=chatbot__pb2.ExportChunk.FromString,
+                _registered_method=True)
+        self.ImportConversations = channel.stream_unary(
+                '/chatbot.ChatbotService/ImportConversations',
+                request_serializer=chatbot__pb2.ExportChunk.SerializeToString,
+                response_deserializer=chatbot__pb2.ImportResponse.FromString,
+                _registered_method=True)
         self.HealthCheck = channel.unary_unary(
                 '/chatbot.ChatbotService/HealthCheck',
                 request_serializer=chatbot__pb2.HealthCheckRequest.SerializeToString,
                 response_deserializer=chatbot__pb2.HealthCheckResponse.FromString,
                 _registered_method=True)
+        self.GetMetrics = channel.unary_unary(
+                '/chatbot.ChatbotService/GetMetrics',
+                request_serializer=chatbot__pb2.MetricsRequest.SerializeToString,
+                response_deserializer=chatbot__pb2.MetricsResponse.FromString,
+                _registered_method=True)
 
 
 class ChatbotServiceServicer(object):
@@ -80,6 +105,20 @@ class ChatbotServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamHistory(self, request, context):
+        """Stream conversation history page by page, newest messages first
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchChat(self, request, context):
+        """Run many chat turns for offline jobs; one result is streamed per item as it finishes
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def ClearConversation(self, request, context):
         """Clear conversation
         """
@@ -94,6 +133,20 @@ class ChatbotServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ExportConversations(self, request, context):
+        """Stream conversations as newline-delimited JSON records, resumable from a cursor
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ImportConversations(self, request_iterator, context):
+        """Import conversations streamed in the ExportConversations format
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def HealthCheck(self, request, context):
         """Health check
         """
@@ -101,6 +154,13 @@ class ChatbotServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetMetrics(self, request, context):
+        """Service metrics in Prometheus text format
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ChatbotServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -114,6 +174,16 @@ def add_ChatbotServiceServicer_to_server(servicer, server):
                     request_deserializer=chatbot__pb2.HistoryRequest.FromString,
                     response_serializer=chatbot__pb2.HistoryResponse.SerializeToString,
             ),
+            'StreamHistory': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamHistory,
+                    request_deserializer=chatbot__pb2.HistoryRequest.FromString,
+                    response_serializer=chatbot__pb2.HistoryResponse.SerializeToString,
+            ),
+            'BatchChat': grpc.unary_stream_rpc_method_handler(
+                    servicer.BatchChat,
+                    request_deserializer=chatbot__pb2.BatchChatRequest.FromString,
+                    response_serializer=chatbot__pb2.BatchChatResult.SerializeToString,
+            ),
             'ClearConversation': grpc.unary_unary_rpc_method_handler(
                     servicer.ClearConversation,
                     request_deserializer=chatbot__pb2.ClearRequest.FromString,
@@ -124,11 +194,26 @@ def add_ChatbotServiceServicer_to_server(servicer, server):
                     request_deserializer=chatbot__pb2.UserConversationsRequest.FromString,
                     response_serializer=chatbot__pb2.UserConversationsResponse.SerializeToString,
             ),
+            'ExportConversations': grpc.unary_stream_rpc_method_handler(
+                    servicer.ExportConversations,
+                    request_deserializer=chatbot__pb2.ExportRequest.FromString,
+                    response_serializer=chatbot__pb2.ExportChunk.SerializeToString,
+            ),
+            'ImportConversations': grpc.stream_unary_rpc_method_handler(
+                    servicer.ImportConversations,
+                    request_deserializer=chatbot__pb2.ExportChunk.FromString,
+                    response_serializer=chatbot__pb2.ImportResponse.SerializeToString,
+            ),
             'HealthCheck': grpc.unary_unary_rpc_method_handler(
                     servicer.HealthCheck,
                     request_deserializer=chatbot__pb2.HealthCheckRequest.FromString,
                     response_serializer=chatbot__pb2.HealthCheckResponse.SerializeToString,
             ),
+            'GetMetrics': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetMetrics,
+                    request_deserializer=chatbot__pb2.MetricsRequest.FromString,
+                    response_serializer=chatbot__pb2.MetricsResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'chatbot.ChatbotService', rpc_method_handlers)
@@ -195,6 +280,60 @@ class ChatbotService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def StreamHistory(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/chatbot.ChatbotService/StreamHistory',
+            chatbot__pb2.HistoryRequest.SerializeToString,
+            chatbot__pb2.HistoryResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchChat(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/chatbot.ChatbotService/BatchChat',
+            chatbot__pb2.BatchChatRequest.SerializeToString,
+            chatbot__pb2.BatchChatResult.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def ClearConversation(request,
             target,
@@ -249,6 +388,60 @@ class ChatbotService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def ExportConversations(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/chatbot.ChatbotService/ExportConversations',
+            chatbot__pb2.ExportRequest.SerializeToString,
+            chatbot__pb2.ExportChunk.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ImportConversations(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/chatbot.ChatbotService/ImportConversations',
+            chatbot__pb2.ExportChunk.SerializeToString,
+            chatbot__pb2.ImportResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def HealthCheck(request,
             target,
@@ -275,3 +468,30 @@ class ChatbotService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def GetMetrics(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/chatbot.ChatbotService/GetMetrics',
+            chatbot__pb2.MetricsRequest.SerializeToString,
+            chatbot__pb2.MetricsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
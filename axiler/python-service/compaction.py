@@ -0,0 +1,261 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from memory import memory_manager
+
+logger = logging.getLogger(__name__)
+
+# Keep the newest `keep` checkpoints of each thread/namespace in the batch.
+# checkpoint_id is a time-ordered uuid6, so it doubles as the creation order.
+DELETE_CHECKPOINTS_SQL = """
+WITH ranked AS (
+    SELECT thread_id, checkpoint_ns, checkpoint_id,
+           row_number() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+    FROM checkpoints
+    WHERE thread_id = ANY(%(threads)s)
+), deleted AS (
+    DELETE FROM checkpoints c
+    USING ranked r
+    WHERE c.thread_id = r.thread_id
+      AND c.checkpoint_ns = r.checkpoint_ns
+      AND c.checkpoint_id = r.checkpoint_id
+      AND r.rn > %(keep)s
+    RETURNING pg_column_size(c.*) AS size
+)
+SELECT count(*), coalesce(sum(size), 0) FROM deleted
+"""
+
+# Pending writes of checkpoints older than the oldest one still kept
+DELETE_WRITES_SQL = """
+WITH deleted AS (
+    DELETE FROM checkpoint_writes w
+    WHERE w.thread_id = ANY(%(threads)s)
+      AND w.checkpoint_id < (
+          SELECT min(c.checkpoint_id) FROM checkpoints c
+          WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = w.checkpoint_ns
+      )
+    RETURNING pg_column_size(w.*) AS size
+)
+SELECT count(*), coalesce(sum(size), 0) FROM deleted
+"""
+
+# Channel values no kept checkpoint points at. A blob is only removed when a
+# newer version of its channel is referenced, so blobs written by a put() that
+# has not inserted its checkpoint row yet are never touched.
+DELETE_BLOBS_SQL = """
+WITH deleted AS (
+    DELETE FROM checkpoint_blobs b
+    WHERE b.thread_id = ANY(%(threads)s)
+      AND NOT EXISTS (
+          SELECT 1 FROM checkpoints c
+          WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+            AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+      )
+      AND EXISTS (
+          SELECT 1 FROM checkpoints c
+          WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+            AND c.checkpoint -> 'channel_versions' ->> b.channel > b.version
+      )
+    RETURNING pg_column_size(b.*) AS size
+)
+SELECT count(*), coalesce(sum(size), 0) FROM deleted
+"""
+
+# Rows of threads that have no checkpoint at all (e.g. cleared before
+# ClearConversation removed blobs and writes)
+ORPHAN_THREADS_SQL = """
+SELECT thread_id FROM (
+    SELECT DISTINCT thread_id FROM checkpoint_blobs
+    UNION
+    SELECT DISTINCT thread_id FROM checkpoint_writes
+) t
+WHERE NOT EXISTS (SELECT 1 FROM checkpoints c WHERE c.thread_id = t.thread_id)
+LIMIT %s
+"""
+
+DELETE_ORPHANS_SQL = """
+WITH orphans AS (
+    SELECT unnest(%(threads)s::text[]) AS thread_id
+    EXCEPT
+    SELECT thread_id FROM checkpoints WHERE thread_id = ANY(%(threads)s)
+), blobs AS (
+    DELETE FROM checkpoint_blobs b USING orphans o
+    WHERE b.thread_id = o.thread_id
+    RETURNING pg_column_size(b.*) AS size
+), writes AS (
+    DELETE FROM checkpoint_writes w USING orphans o
+    WHERE w.thread_id = o.thread_id
+    RETURNING pg_column_size(w.*) AS size
+)
+SELECT (SELECT count(*) FROM blobs), (SELECT count(*) FROM writes),
+       (SELECT coalesce(sum(size), 0) FROM blobs) + (SELECT coalesce(sum(size), 0) FROM writes)
+"""
+
+class CompactionReport:
+    """Rows and bytes reclaimed by a compaction pass."""
+
+    def __init__(self):
+        self.threads = 0
+        self.checkpoints = 0
+        self.writes = 0
+        self.blobs = 0
+        # Sum of pg_column_size() of the deleted rows. Disk space is returned
+        # to the OS only after (auto)vacuum.
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "threads": self.threads,
+            "checkpoints": self.checkpoints,
+            "writes": self.writes,
+            "blobs": self.blobs,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 3),
+        }
+
+    def __str__(self):
+        return (f"{self.checkpoints} checkpoints, {self.writes} writes and {self.blobs} blobs "
+                f"({self.bytes / 1024:.1f} KiB) across {self.threads} threads in {self.seconds:.1f}s")
+
+class CheckpointCompactor:
+    """
+    Prunes the LangGraph checkpoint tables.
+
+    Keeps the newest `keep` checkpoints of every thread and removes the writes
+    and blobs that only older checkpoints referenced. Work is done in batches
+    of threads, one transaction each, with a pause between batches so the job
+    does not compete with live traffic.
+    """
+
+    def __init__(self, keep: Optional[int] = None, batch_size: Optional[int] = None,
+                 batch_pause: Optional[float] = None, orphan_grace: Optional[float] = None):
+        """
+        Args:
+            keep: Checkpoints kept per thread (COMPACTION_KEEP_CHECKPOINTS, default 3)
+            batch_size: Threads per delete batch (COMPACTION_BATCH_SIZE, default 200)
+            batch_pause: Seconds to sleep between batches (COMPACTION_BATCH_PAUSE, default 0.1)
+            orphan_grace: Seconds a thread must have had no checkpoint before its
+                leftover rows are deleted (COMPACTION_ORPHAN_GRACE, default 60)
+        """
+        self.keep = max(1, keep if keep is not None else int(os.getenv("COMPACTION_KEEP_CHECKPOINTS", "3")))
+        self.batch_size = batch_size or int(os.getenv("COMPACTION_BATCH_SIZE", "200"))
+        self.batch_pause = batch_pause if batch_pause is not None else float(os.getenv("COMPACTION_BATCH_PAUSE", "0.1"))
+        self.orphan_grace = orphan_grace if orphan_grace is not None else float(os.getenv("COMPACTION_ORPHAN_GRACE", "60"))
+        # thread_id -> time it was first seen without any checkpoint
+        self._orphan_candidates = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, wait_for_orphans: bool = False) -> CompactionReport:
+        """
+        Run one full compaction pass.
+
+        Args:
+            wait_for_orphans: Sleep through the orphan grace period so orphaned
+                rows found in this pass are deleted now (used by `main.py compact`).
+                The background job instead deletes them on a later pass.
+
+        Returns:
+            CompactionReport with the rows and bytes reclaimed
+        """
+        report = CompactionReport()
+        pool = memory_manager.pool
+        if pool is None:
+            logger.warning("Checkpoint compaction requires the PostgreSQL checkpointer")
+            return report
+
+        start = time.perf_counter()
+        last_thread = ""
+        while not self._stop.is_set():
+            with pool.connection() as conn:
+                rows = conn.execute(
+                    "SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id > %s ORDER BY thread_id LIMIT %s",
+                    (last_thread, self.batch_size),
+                ).fetchall()
+            if not rows:
+                break
+            threads = [row[0] for row in rows]
+            last_thread = threads[-1]
+            self._compact_batch(pool, threads, report)
+            self._stop.wait(self.batch_pause)
+
+        self._sweep_orphans(pool, report, wait_for_orphans)
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def _compact_batch(self, pool, threads: list, report: CompactionReport):
+        params = {"threads": threads, "keep": self.keep}
+        with pool.connection() as conn, conn.transaction():
+            for sql, field in ((DELETE_CHECKPOINTS_SQL, "checkpoints"),
+                               (DELETE_WRITES_SQL, "writes"),
+                               (DELETE_BLOBS_SQL, "blobs")):
+                count, size = conn.execute(sql, params).fetchone()
+                setattr(report, field, getattr(report, field) + count)
+                report.bytes += size
+        report.threads += len(threads)
+
+    def _sweep_orphans(self, pool, report: CompactionReport, wait: bool):
+        with pool.connection() as conn:
+            found = [row[0] for row in conn.execute(ORPHAN_THREADS_SQL, (self.batch_size * 10,)).fetchall()]
+
+        now = time.monotonic()
+        # Forget candidates that got a checkpoint (or were cleaned up) meanwhile
+        self._orphan_candidates = {t: self._orphan_candidates.get(t, now) for t in found}
+        if wait and found:
+            self._stop.wait(self.orphan_grace)
+            now = time.monotonic()
+
+        expired = [t for t, seen in self._orphan_candidates.items() if now - seen >= self.orphan_grace]
+        for i in range(0, len(expired), self.batch_size):
+            batch = expired[i:i + self.batch_size]
+            with pool.connection() as conn, conn.transaction():
+                blobs, writes, size = conn.execute(DELETE_ORPHANS_SQL, {"threads": batch}).fetchone()
+            report.blobs += blobs
+            report.writes += writes
+            report.bytes += size
+            for thread_id in batch:
+                self._orphan_candidates.pop(thread_id, None)
+            self._stop.wait(self.batch_pause)
+
+    def start_background(self, interval: float):
+        """
+        Run compaction passes every `interval` seconds in a daemon thread.
+
+        Args:
+            interval: Seconds between the end of one pass and the start of the next
+        """
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    report = self.run_once()
+                    logger.info(f"🧹 Checkpoint compaction reclaimed {report}")
+                except Exception as e:
+                    logger.error(f"Error in checkpoint compaction: {str(e)}")
+
+        self._thread = threading.Thread(target=loop, name="checkpoint-compaction", daemon=True)
+        self._thread.start()
+        logger.info(f"🧹 Checkpoint compaction every {interval:.0f}s, keeping {self.keep} checkpoints per thread")
+
+    def stop(self):
+        """Stop the background thread, interrupting a pass between batches."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def start_background_compaction() -> Optional[CheckpointCompactor]:
+    """
+    Start background compaction if COMPACTION_INTERVAL (seconds) is set.
+
+    Returns:
+        The running compactor, or None when compaction is disabled
+    """
+    interval = float(os.getenv("COMPACTION_INTERVAL", "0"))
+    if interval <= 0 or memory_manager.pool is None:
+        return None
+    compactor = CheckpointCompactor()
+    compactor.start_background(interval)
+    return compactor
@@ -0,0 +1,124 @@
+import os
+from typing import List
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+def message_text(content) -> str:
+    """Flatten message content (plain string or list of content blocks) to text."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content or []:
+        if isinstance(block, str):
+            parts.append(block)
+        elif isinstance(block, dict) and block.get("type", "text") == "text":
+            parts.append(block.get("text", ""))
+    return "".join(parts)
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    """
+    Cheaply estimate the prompt size of a list of messages.
+
+    Uses ~4 characters per token plus a small per-message overhead. This is
+    deliberately local: asking Gemini to count tokens would cost a request.
+    """
+    return sum(len(message_text(m.content)) // 4 + 4 for m in messages)
+
+class ContextPolicy:
+    """
+    Controls how much of a thread is sent to the model on each turn.
+
+    The full transcript always stays in the graph state (and in GetHistory);
+    only the prompt built from it is bounded.
+    """
+
+    def __init__(self):
+        # Token budget for the prompt sent to the model, summary included
+        self.max_tokens = int(os.getenv("CONTEXT_MAX_TOKENS", "8000"))
+        # Fold older turns into a running summary instead of only dropping them
+        self.summarize = os.getenv("CONTEXT_SUMMARIZE", "false").lower() in ("1", "true", "yes")
+        # Summarize once the unsummarized part of the thread grows past this size
+        self.summary_trigger_tokens = int(os.getenv("CONTEXT_SUMMARY_TRIGGER_TOKENS", str(self.max_tokens // 2)))
+        # Most recent messages that are always kept verbatim when summarizing
+        self.keep_messages = max(1, int(os.getenv("CONTEXT_KEEP_MESSAGES", "6")))
+
+    def build_prompt(self, state) -> List[BaseMessage]:
+        """
+        Build the messages to send to the model for this turn.
+
+        Args:
+            state: Graph state with messages, summary and summarized_count
+
+        Returns:
+            The running summary (if any) followed by the most recent messages
+            that fit in the token budget
+        """
+        messages = state["messages"][state.get("summarized_count", 0):]
+        prompt = []
+        budget = self.max_tokens
+        if state.get("summary"):
+            summary = SystemMessage(content=f"Summary of the earlier conversation:\n{state['summary']}")
+            prompt.append(summary)
+            budget -= estimate_tokens([summary])
+        return prompt + self.trim(messages, budget)
+
+    def trim(self, messages: List[BaseMessage], budget: int) -> List[BaseMessage]:
+        """Keep the newest messages that fit in budget, starting on a human turn."""
+        kept = []
+        used = 0
+        for message in reversed(messages):
+            cost = estimate_tokens([message])
+            # The newest message is always sent, even if it alone exceeds the budget
+            if kept and used + cost > budget:
+                break
+            kept.append(message)
+            used += cost
+        kept.reverse()
+
+        # Don't open the window on a dangling AI reply
+        while len(kept) > 1 and not isinstance(kept[0], HumanMessage):
+            kept.pop(0)
+        return kept
+
+    def needs_summary(self, state) -> bool:
+        """Whether the unsummarized tail of the thread has outgrown the trigger size."""
+        if not self.summarize:
+            return False
+        pending = state["messages"][state.get("summarized_count", 0):]
+        if len(pending) <= self.keep_messages or estimate_tokens(pending) <= self.summary_trigger_tokens:
+            return False
+        return self.summary_cutoff(state) > state.get("summarized_count", 0)
+
+    def summary_cutoff(self, state) -> int:
+        """
+        Index up to which messages are folded into the summary.
+
+        Leaves at least keep_messages verbatim and cuts right before a human
+        message so the remaining window starts on a full turn.
+        """
+        messages = state["messages"]
+        cutoff = max(state.get("summarized_count", 0), len(messages) - self.keep_messages)
+        while cutoff > state.get("summarized_count", 0) and not isinstance(messages[cutoff], HumanMessage):
+            cutoff -= 1
+        return cutoff
+
+    def summary_prompt(self, state, cutoff: int) -> List[BaseMessage]:
+        """Messages asking the model to fold messages[summarized_count:cutoff] into the summary."""
+        lines = []
+        for message in state["messages"][state.get("summarized_count", 0):cutoff]:
+            role = "User" if message.type == "human" else "Assistant"
+            lines.append(f"{role}: {message_text(message.content)}")
+
+        instructions = (
+            "You maintain a running summary of a conversation between a user and an assistant. "
+            "Rewrite the summary so it also covers the new messages below. Keep facts, names, "
+            "decisions and open questions; drop pleasantries. Reply with the summary only."
+        )
+        current = state.get("summary") or "(no summary yet)"
+        return [
+            SystemMessage(content=instructions),
+            HumanMessage(content=f"Current summary:\n{current}\n\nNew messages:\n" + "\n".join(lines)),
+        ]
+
+# Create a global instance
+context_policy = ContextPolicy()
@@ -1,16 +1,134 @@
+import logging
 import os
+import threading
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Check if API key is loaded
-if not os.environ.get("GOOGLE_API_KEY"):
-    raise ValueError("GOOGLE_API_KEY not found in environment variables. Please check your .env file.")
+logger = logging.getLogger(__name__)
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+# "gemini" (default) or "stub": a deterministic local model for benchmarks
+# and development that needs no API key (see stub_model.py)
+MODEL_BACKEND = os.getenv("CHAT_MODEL_BACKEND", "gemini").lower()
 
-model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=os.environ.get("GOOGLE_API_KEY")
-)
\ No newline at end of file
+def _parse_models(spec: str) -> Dict[str, str]:
+    """Parse CHAT_MODELS, e.g. "flash=gemini-2.5-flash,lite=gemini-2.5-flash-lite"."""
+    models = {}
+    for entry in spec.split(","):
+        if entry.strip():
+            name, _, model = entry.partition("=")
+            models[name.strip()] = (model or name).strip()
+    if not models:
+        raise ValueError("CHAT_MODELS does not name any model")
+    return models
+
+class ModelRegistry:
+    """
+    Chat models by name.
+
+    Clients are created on first use and shared by every caller. The first
+    configured model is the default: it answers the turns the router does not
+    send elsewhere (see model_router.py) and writes summaries.
+    """
+
+    def __init__(self, models: Dict[str, str]):
+        """
+        Args:
+            models: Mapping of registry name to Gemini model
+        """
+        self.models = models
+        self.default = next(iter(models))
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        return list(self.models)
+
+    def get(self, name: Optional[str] = None):
+        """
+        Get a chat model, creating its client on first use.
+
+        Args:
+            name: Registry name (None = the default model)
+
+        Returns:
+            The chat model
+
+        Raises:
+            KeyError: No model is registered under this name
+        """
+        name = name or self.default
+        client = self._clients.get(name)
+        if client is None:
+            if name not in self.models:
+                raise KeyError(f"Unknown chat model '{name}' (known: {', '.join(self.models)})")
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self._clients[name] = _create_model(name, self.models[name])
+        return client
+
+def _create_model(name: str, model_name: str):
+    if MODEL_BACKEND == "stub":
+        from stub_model import StubChatModel
+
+        return StubChatModel.from_env(name)
+
+    # Check if API key is loaded
+    if not os.environ.get("GOOGLE_API_KEY"):
+        raise ValueError("GOOGLE_API_KEY not found in environment variables. Please check your .env file.")
+
+    # Imported here: the Gemini client library is slow to import
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=model_name,
+        google_api_key=os.environ.get("GOOGLE_API_KEY"),
+        # Timeouts and retries are handled by model_executor.py
+        max_retries=0
+    )
+
+# Global model registry: CHAT_MODELS lists "name=gemini-model" pairs, default first
+model_registry = ModelRegistry(_parse_models(os.getenv("CHAT_MODELS", "flash=gemini-2.5-flash")))
+
+# Registry name of the model that hedged requests are sent to (see
+# model_executor.py); unset sends them to the model of the original request
+HEDGE_MODEL = os.getenv("MODEL_HEDGE_MODEL", "")
+
+def get_model(name: Optional[str] = None):
+    """
+    Get a chat model, creating its client on first use.
+
+    Args:
+        name: Registry name (None = the default model, see CHAT_MODELS)
+
+    Returns:
+        The chat model
+    """
+    return model_registry.get(name)
+
+def get_hedge_model(name: Optional[str] = None):
+    """
+    Get the model that hedged requests are sent to.
+
+    Args:
+        name: Registry name of the model the original request went to
+
+    Returns:
+        The MODEL_HEDGE_MODEL model, or the original model when it is not set
+    """
+    return model_registry.get(HEDGE_MODEL or name)
+
+def warm_model():
+    """
+    Create the default model's client ahead of the first request.
+
+    With MODEL_WARMUP enabled a one-word prompt is also sent, so the HTTP
+    connection to the model API is open before the service reports ready.
+    """
+    model = get_model()
+    if os.getenv("MODEL_WARMUP", "false").lower() in ("1", "true", "yes"):
+        model.invoke("Hi")
+        logger.info("🔥 Model connection warmed up")
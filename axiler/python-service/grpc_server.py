@@ -2,23 +2,667 @@ import grpc
 import asyncio
 from concurrent import futures
 import logging
+import os
+import signal
+import sys
+import threading
 import time
-from typing import Iterator, Optional
+from collections import deque
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple
 
 import chatbot_pb2
 import chatbot_pb2_grpc
 from langchain_core.messages import HumanMessage
-from googleGenai import model
-from memory import memory_manager
-from main import graph
+from context_window import estimate_tokens, message_text
+from googleGenai import warm_model
+from memory import TurnMessages, memory_manager
+from compaction import start_background_compaction
+from llm_cache import response_cache
+from model_executor import model_executor
+from admission import INTERACTIVE, AdmissionController, AdmissionRejected, AsyncAdmissionController
+from cancellation import CancelToken
+from batch import BatchRunner, batch_item
+from transfer import ConversationImporter, export_chunks, export_records
+from metrics import AsyncMetricsInterceptor, MetricsInterceptor, registry, start_metrics_server
+from profiling import enable_admin_endpoints
+from tracing import span, trace_request
+from main import build_graph, get_graph
+from startup import AsyncReadinessInterceptor, ReadinessInterceptor, Startup
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Messages per StreamHistory page when the request does not set a limit
+HISTORY_PAGE_SIZE = 100
+
+def _resolve_config(thread_id: str, user_id: str, conversation_id: str) -> dict:
+    """
+    Build the LangGraph configuration for a request.
+    
+    Args:
+        thread_id: Thread identifier sent by the client
+        user_id: User identifier
+        conversation_id: Conversation identifier
+    
+    Returns:
+        Configuration dictionary for LangGraph checkpointing
+    """
+    # Get conversation configuration
+    config = memory_manager.get_conversation_config(user_id, conversation_id)
+    
+    # Override thread_id if provided explicitly
+    if thread_id != f"{user_id}_{conversation_id}":
+        config = {"configurable": {"thread_id": thread_id}}
+    return config
+
+def _chat_config(request: chatbot_pb2.ChatRequest, user_id: str, conversation_id: str) -> dict:
+    """Build the LangGraph configuration for a chat turn, including per-request options."""
+    config = _resolve_config(request.thread_id, user_id, conversation_id)
+    # Selects the user's routing settings (see model_router.py)
+    config["configurable"]["user_id"] = user_id
+    if request.bypass_cache:
+        # Read by the chatbot node (see main._cache_key)
+        config["configurable"]["bypass_cache"] = True
+    return config
+
+def _validate_chat_request(request: chatbot_pb2.ChatRequest) -> Optional[chatbot_pb2.ChatResponse]:
+    """
+    Validate the required fields of a ChatRequest.
+    
+    Returns:
+        An error ChatResponse to send back, or None if the request is valid
+    """
+    if not request.thread_id:
+        return chatbot_pb2.ChatResponse(
+            thread_id="",
+            content="",
+            is_complete=True,
+            error="thread_id is required"
+        )
+    
+    if not request.message:
+        return chatbot_pb2.ChatResponse(
+            thread_id=request.thread_id,
+            content="",
+            is_complete=True,
+            error="message is required"
+        )
+    
+    if not (request.user_id.strip() if request.user_id else ""):
+        return chatbot_pb2.ChatResponse(
+            thread_id=request.thread_id,
+            content="",
+            is_complete=True,
+            error="user_id is required"
+        )
+    return None
+
+def _state_history(snapshot) -> list:
+    """
+    Convert the messages of a graph state snapshot to history entries, oldest first.
+    
+    Only used without the PostgreSQL history table; every message then carries
+    the time of the snapshot's checkpoint.
+    """
+    timestamp = int(datetime.fromisoformat(snapshot.created_at).timestamp()) if snapshot.created_at else 0
+    history = []
+    for i, msg in enumerate(snapshot.values.get("messages", [])):
+        history.append({
+            'seq': i + 1,
+            'role': "human" if msg.type == "human" else "ai",
+            'content': message_text(msg.content),
+            'timestamp': timestamp
+        })
+    return history
+
+def _page_history(history: list, limit: int, before_seq: int, after_seq: int):
+    """Apply MemoryManager.get_history_page() paging to in-memory history entries."""
+    selected = [m for m in reversed(history)
+                if (before_seq <= 0 or m['seq'] < before_seq) and m['seq'] > after_seq]
+    if limit > 0 and len(selected) > limit:
+        return selected[:limit], True
+    return selected, False
+
+def _history_response(thread_id: str, request: chatbot_pb2.HistoryRequest, page) -> chatbot_pb2.HistoryResponse:
+    """Build a HistoryResponse from a (newest-first messages, has_more) page."""
+    messages, has_more = page
+    if request.limit <= 0 and not request.before_seq and not request.after_seq:
+        # Unpaged requests keep receiving the whole thread oldest first
+        messages = list(reversed(messages))
+    return chatbot_pb2.HistoryResponse(
+        thread_id=thread_id,
+        messages=[chatbot_pb2.Message(**m) for m in messages],
+        error="",
+        has_more=has_more
+    )
+
+def _clear_thread(thread_id: str, user_id: str, conversation_id: str):
+    """Clear a thread, splitting custom thread ids into user and conversation parts."""
+    # Use memory manager to clear conversation
+    if thread_id == f"{user_id}_{conversation_id}":
+        memory_manager.clear_conversation(user_id, conversation_id)
+    else:
+        # If thread_id is custom, extract user and conversation parts or use defaults
+        parts = thread_id.split('_', 1)
+        if len(parts) == 2:
+            memory_manager.clear_conversation(parts[0], parts[1])
+        else:
+            memory_manager.clear_conversation("default", thread_id)
+
+def _conversations_to_proto(conversations: list) -> list:
+    """Convert conversation summaries from the memory manager to protobuf messages."""
+    proto_conversations = []
+    for conv in conversations:
+        proto_conv = chatbot_pb2.Conversation(
+            thread_id=conv['thread_id'],
+            conversation_id=conv['conversation_id'],
+            first_message=conv['first_message'],
+            created_at=conv['created_at'],
+            last_activity=conv['last_activity'],
+            message_count=conv['message_count']
+        )
+        proto_conversations.append(proto_conv)
+    return proto_conversations
+
+def _export_records(request: chatbot_pb2.ExportRequest) -> Iterator[dict]:
+    """Records selected by an ExportRequest (see transfer.export_records())."""
+    since = datetime.fromtimestamp(request.since, timezone.utc) if request.since else None
+    until = datetime.fromtimestamp(request.until, timezone.utc) if request.until else None
+    return export_records(request.user_id.strip(), since, until, request.cursor)
+
+def _import_response(importer: Optional[ConversationImporter], error: str = "") -> chatbot_pb2.ImportResponse:
+    stats = importer.stats if importer is not None else {}
+    return chatbot_pb2.ImportResponse(**stats, error=error)
+
+def _deadline(context) -> Optional[float]:
+    """The RPC's deadline as a time.monotonic() value, or None without one."""
+    remaining = context.time_remaining()
+    return None if remaining is None else time.monotonic() + remaining
+
+def _truncation_error(thread_id: str, cancel_token: CancelToken) -> str:
+    if not cancel_token.cancelled:
+        return ""
+    logger.info(f"Chat turn for thread_id {thread_id} stopped early: {cancel_token.reason}")
+    return f"Response truncated: {cancel_token.reason}"
+
+def _batch_items(request: chatbot_pb2.BatchChatRequest) -> list:
+    return [
+        batch_item(i, item.message, item.user_id, item.conversation_id, item.thread_id, item.bypass_cache)
+        for i, item in enumerate(request.items)
+    ]
+
+def _batch_result(result: dict) -> chatbot_pb2.BatchChatResult:
+    return chatbot_pb2.BatchChatResult(
+        index=result["index"],
+        thread_id=result["thread_id"],
+        content=result["content"],
+        error=result["error"]
+    )
+
+def _health_response(admission: AdmissionController, startup: Startup) -> chatbot_pb2.HealthCheckResponse:
+    stats = admission.stats()
+    return chatbot_pb2.HealthCheckResponse(
+        # Not ready until the pool, model client and graph have been set up
+        status="SERVING" if startup.ready else "NOT_SERVING",
+        in_flight=stats["in_flight"],
+        queued=stats["queued"],
+        max_in_flight=stats["max_in_flight"],
+        max_queue=stats["max_queue"],
+        saturation=stats["saturation"]
+    )
+
+def _service_metrics(servicer) -> Callable:
+    """Scrape-time collector exporting the stats kept by the servicer's components."""
+    def collect():
+        admission = servicer.admission.stats()
+        for lane, prefix in (("interactive", ""), ("background", "background_")):
+            yield ("chatbot_admission_in_flight", "Chat turns holding an admission slot", {"lane": lane},
+                   admission[f"{prefix}in_flight"])
+            yield ("chatbot_admission_queued", "Chat turns waiting for an admission slot", {"lane": lane},
+                   admission[f"{prefix}queued"])
+        yield ("chatbot_admission_saturation", "Share of admission capacity in use", {}, admission["saturation"])
+        yield ("chatbot_admission_rejected", "Chat turns rejected by admission control since start", {},
+               admission["rejected"])
+        yield ("chatbot_admission_rate_limited", "Chat turns rejected for exceeding their user's rate since start",
+               {}, admission["rate_limited"])
+        for name, value in servicer.scheduler.stats().items():
+            yield ("chatbot_scheduler_turns", "Chat scheduler counters since start, and threads with turns",
+                   {"stat": name}, value)
+        for name, value in response_cache.stats().items():
+            yield ("chatbot_llm_cache", "LLM response cache counters since start, entries and hit ratio",
+                   {"stat": name}, value)
+        for name, value in model_executor.stats().items():
+            yield ("chatbot_model_executor", "Model calls, attempts, retries, timeouts, hedges and their "
+                   "winners and extra tokens since start, and hedge rate", {"stat": name}, value)
+        for (kind, model), stats in model_executor.latency_stats().items():
+            for name, value in stats.items():
+                yield ("chatbot_model_recent_latency_seconds", "Recent time to first chunk (stream) or reply "
+                       "(invoke) of each model, and its current hedge delay",
+                       {"kind": kind, "model": model, "stat": name}, value)
+        for pool, stats in memory_manager.pool_stats().items():
+            for name in ("pool_size", "pool_available", "requests_waiting"):
+                yield ("chatbot_db_pool", "Database connection pool state", {"pool": pool, "stat": name},
+                       stats.get(name, 0))
+        for name, value in memory_manager.writer_stats().items():
+            yield ("chatbot_checkpoint_write_behind", "Write-behind checkpoint queue: pending writes, lag "
+                   "of the oldest one in seconds and counters since start", {"stat": name}, value)
+        for name, value in memory_manager.state_cache_stats().items():
+            yield ("chatbot_state_cache", "Conversation state cache counters since start, entries, bytes "
+                   "and hit ratio", {"stat": name}, value)
+    return collect
+
+def _prompt_tokens(request: chatbot_pb2.ChatRequest) -> int:
+    """Estimated tokens of the user's message, charged to the user by admission control."""
+    return estimate_tokens([HumanMessage(content=request.message)])
+
+def _turn_key(request: chatbot_pb2.ChatRequest) -> tuple:
+    """Requests with equal keys on the same thread are duplicates of one turn."""
+    return (request.user_id.strip(), request.conversation_id or "main", request.message, request.bypass_cache)
+
+def _busy_response(thread_id: str) -> chatbot_pb2.ChatResponse:
+    return chatbot_pb2.ChatResponse(
+        thread_id=thread_id,
+        content="",
+        is_complete=True,
+        error="Another message is already being processed for this thread"
+    )
+
+def _log_turn_error(turn, error: Exception):
+    if isinstance(error, AdmissionRejected):
+        logger.warning(f"Rejected chat request for thread_id {turn.thread_id}: {error} "
+                       f"(retry after {error.retry_after}s)")
+    else:
+        logger.error(f"Error in chat turn for thread_id {turn.thread_id}: {str(error)}")
+
+def _join_turn(turn, deadline: Optional[float]):
+    turn.subscribers += 1
+    if deadline is None or turn.cancel_token.deadline is None:
+        turn.cancel_token.deadline = None
+    else:
+        turn.cancel_token.deadline = max(turn.cancel_token.deadline, deadline)
+
+def _leave_turn(turn):
+    turn.subscribers -= 1
+    # Checking .cancelled first records a passed deadline as the reason
+    if turn.subscribers == 0 and not turn.done and not turn.cancel_token.cancelled:
+        turn.cancel_token.cancel("cancelled")
+
+class _Turn:
+    """
+    A chat turn and the responses it has produced so far.
+    
+    Every caller coalesced onto the turn reads the same responses from the
+    start, so a duplicate that joins late still receives the full reply.
+    """
+    
+    def __init__(self, thread_id: str, key: tuple, produce: Callable, deadline: Optional[float]):
+        self.thread_id = thread_id
+        self.key = key
+        self.produce = produce
+        self.responses = []
+        self.done = False
+        # Exception that ended the turn before it produced a response
+        self.error = None
+        self.subscribers = 1
+        # Fired once every caller has gone away or the latest deadline has passed
+        self.cancel_token = CancelToken(deadline)
+        # Set once the turn no longer holds its thread
+        self.retired = threading.Event()
+        self._cond = threading.Condition()
+    
+    def join(self, deadline: Optional[float]):
+        """Attach another caller, extending the deadline to cover it."""
+        with self._cond:
+            _join_turn(self, deadline)
+    
+    def leave(self):
+        """Detach a caller; the turn is cancelled when the last one leaves early."""
+        with self._cond:
+            _leave_turn(self)
+    
+    def publish(self, response: chatbot_pb2.ChatResponse):
+        with self._cond:
+            self.responses.append(response)
+            self._cond.notify_all()
+    
+    def finish(self):
+        with self._cond:
+            self.done = True
+            self._cond.notify_all()
+    
+    def subscribe(self, context) -> Iterator[chatbot_pb2.ChatResponse]:
+        """Yield the turn's responses as they are produced, until it finishes or the caller goes away."""
+        # Wake the waiting loop below as soon as the RPC is cancelled or times out
+        context.add_callback(self._wake)
+        i = 0
+        try:
+            while True:
+                with self._cond:
+                    while i >= len(self.responses) and not self.done:
+                        if not context.is_active():
+                            return
+                        self._cond.wait(1.0)
+                    if i >= len(self.responses):
+                        return
+                    response = self.responses[i]
+                i += 1
+                yield response
+        finally:
+            self.leave()
+    
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+class _Hold:
+    """Stands in for the responses of a turn run by ThreadScheduler.call(), which runs no code of its own."""
+    
+    def __init__(self, entered: threading.Event, released: futures.Future):
+        self.entered = entered
+        self.released = released
+
+class _Lane:
+    """The running turn of one thread and the turns queued behind it."""
+    
+    def __init__(self):
+        self.active = None
+        self.queued = deque()
+    
+    def turns(self):
+        if self.active is not None:
+            yield self.active
+        yield from self.queued
+
+class ThreadScheduler:
+    """
+    Runs at most one chat turn per thread at a time.
+    
+    A turn submitted while another one is running on the same thread is
+    queued behind it, or rejected under the "reject" policy. An exact
+    duplicate of a running or queued turn (same user, conversation, message
+    and options) is not run again: its caller is attached to the existing
+    turn and receives the same stream. Turns of different threads never wait
+    for each other.
+    
+    Turns run on a bounded pool of worker threads, independent of the
+    callers, so a caller that disconnects neither aborts the turn for the
+    other callers nor leaves the thread's checkpoint half-written.
+    """
+    
+    turn_class = _Turn
+    
+    def __init__(self, workers: int = 48):
+        """
+        Args:
+            workers: Threads running turns, unless CHAT_TURN_WORKERS is set
+                (0 = no pool, for subclasses that run turns elsewhere)
+        """
+        # "queue" waits for the running turn, "reject" fails the request at once
+        self.policy = os.getenv("CHAT_BUSY_POLICY", "queue").lower()
+        # Turns allowed to wait behind the running one, per thread
+        self.max_queued = int(os.getenv("CHAT_MAX_QUEUED_TURNS", "4"))
+        workers = int(os.getenv("CHAT_TURN_WORKERS", "0")) or workers
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="turn") if workers else None
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "coalesced": 0, "queued": 0, "rejected": 0,
+                       "cancelled": 0, "deadline_exceeded": 0}
+    
+    def submit(self, thread_id: str, key: tuple, produce: Callable[[CancelToken], Iterator],
+               deadline: Optional[float] = None) -> Optional[_Turn]:
+        """
+        Schedule a turn.
+        
+        Args:
+            thread_id: Thread the turn belongs to
+            key: Identity of the turn, see _turn_key()
+            produce: Function taking the turn's CancelToken and returning its
+                responses (an async iterator for AsyncThreadScheduler)
+            deadline: time.monotonic() value after which the caller no longer
+                waits for the turn, or None
+        
+        Returns:
+            The turn to subscribe to (possibly an existing duplicate), or None
+            if the thread is busy and the turn was rejected
+        """
+        with self._lock:
+            lane = self._lanes.setdefault(thread_id, _Lane())
+            for turn in lane.turns():
+                if turn.key == key and not turn.cancel_token.cancelled:
+                    turn.join(deadline)
+                    self._stats["coalesced"] += 1
+                    logger.info(f"Coalesced duplicate chat request for thread_id: {thread_id}")
+                    return turn
+            
+            turn = self.turn_class(thread_id, key, produce, deadline)
+            if lane.active is None:
+                lane.active = turn
+            elif self.policy == "reject" or len(lane.queued) >= self.max_queued:
+                self._stats["rejected"] += 1
+                logger.info(f"Rejected chat request for busy thread_id: {thread_id}")
+                return None
+            else:
+                lane.queued.append(turn)
+                self._stats["queued"] += 1
+                logger.info(f"Queued chat request behind the running turn of thread_id: {thread_id}")
+                return turn
+        
+        self._start(turn)
+        return turn
+    
+    def call(self, thread_id: str, key: tuple, fn: Callable[[], object],
+             cancel_token: CancelToken) -> Tuple[bool, object]:
+        """
+        Run fn on the calling thread as a turn of thread_id.
+        
+        For work outside the chat RPCs (batch items): fn starts once the
+        thread's earlier turns have finished, and later turns wait for it.
+        
+        Args:
+            thread_id: Thread the turn belongs to
+            key: Identity of the turn; never equal to a chat turn's key
+            fn: The work to run
+            cancel_token: Stops waiting for the thread; fn is not run then
+        
+        Returns:
+            (True, fn's result), or (False, None) if fn was not run because the
+            thread was busy and the turn rejected, or cancel_token was cancelled
+        """
+        entered = threading.Event()
+        released = futures.Future()
+        turn = self._submit_held(thread_id, key, entered, released, cancel_token.deadline)
+        if turn is None:
+            return False, None
+        try:
+            while not entered.wait(0.1):
+                if cancel_token.cancelled:
+                    # Drops the turn unrun if it is still queued; no need to wait for the thread
+                    self._leave(turn)
+                    return False, None
+                if turn.done:
+                    return False, None
+            if cancel_token.cancelled:
+                return False, None
+            return True, fn()
+        finally:
+            released.set_result(None)
+            if entered.is_set():
+                # The caller's next turn of the thread must not find this one still running
+                turn.retired.wait()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["busy_threads"] = len(self._lanes)
+        return stats
+    
+    def _submit_held(self, thread_id: str, key: tuple, entered: threading.Event,
+                     released: futures.Future, deadline: Optional[float]) -> Optional[_Turn]:
+        """Submit a turn that only holds the thread from entered until released, see call()."""
+        return self.submit(thread_id, key, _Hold(entered, released), deadline)
+    
+    def _leave(self, turn: _Turn):
+        turn.leave()
+    
+    def _start(self, turn: _Turn):
+        with self._lock:
+            self._stats["started"] += 1
+        if isinstance(turn.produce, _Hold):
+            # The caller of call() does the work on its own thread
+            turn.produce.entered.set()
+            turn.produce.released.add_done_callback(lambda _: self._retire(turn))
+            return
+        self._executor.submit(self._run, turn)
+    
+    def _run(self, turn: _Turn):
+        try:
+            for response in turn.produce(turn.cancel_token):
+                turn.publish(response)
+        except Exception as e:
+            turn.error = e
+            _log_turn_error(turn, e)
+        finally:
+            self._retire(turn)
+    
+    def _retire(self, turn: _Turn):
+        turn.finish()
+        self._advance(turn)
+    
+    def _count_cancellation(self, turn):
+        if turn.cancel_token.reason is not None:
+            with self._lock:
+                self._stats[turn.cancel_token.reason] += 1
+    
+    def _advance(self, turn):
+        """Start the next queued turn of a thread once its running turn has finished."""
+        self._count_cancellation(turn)
+        with self._lock:
+            lane = self._lanes[turn.thread_id]
+            # Queued turns whose callers all left meanwhile are dropped unrun
+            while lane.queued and lane.queued[0].cancel_token.cancelled:
+                dropped = lane.queued.popleft()
+                dropped.finish()
+                dropped.retired.set()
+                self._stats[dropped.cancel_token.reason] += 1
+            lane.active = lane.queued.popleft() if lane.queued else None
+            if lane.active is None:
+                del self._lanes[turn.thread_id]
+            next_turn = lane.active
+        turn.retired.set()
+        if next_turn is not None:
+            self._start(next_turn)
+
+class _AsyncTurn:
+    """asyncio counterpart of _Turn."""
+    
+    def __init__(self, thread_id: str, key: tuple, produce: Callable, deadline: Optional[float]):
+        self.thread_id = thread_id
+        self.key = key
+        self.produce = produce
+        self.responses = []
+        self.done = False
+        self.error = None
+        self.subscribers = 1
+        self.cancel_token = CancelToken(deadline)
+        self.retired = threading.Event()
+        self.task = None
+        self._changed = asyncio.Event()
+    
+    def join(self, deadline: Optional[float]):
+        _join_turn(self, deadline)
+    
+    def leave(self):
+        _leave_turn(self)
+    
+    def publish(self, response: chatbot_pb2.ChatResponse):
+        self.responses.append(response)
+        self._changed.set()
+    
+    def finish(self):
+        self.done = True
+        self._changed.set()
+    
+    async def subscribe(self) -> AsyncIterator[chatbot_pb2.ChatResponse]:
+        """Yield the turn's responses as they are produced, until it finishes."""
+        i = 0
+        try:
+            while True:
+                while i >= len(self.responses) and not self.done:
+                    self._changed.clear()
+                    await self._changed.wait()
+                if i >= len(self.responses):
+                    return
+                response = self.responses[i]
+                i += 1
+                yield response
+        finally:
+            # Also reached when grpc.aio cancels the handler (client gone or deadline)
+            self.leave()
+
+class AsyncThreadScheduler(ThreadScheduler):
+    """ThreadScheduler for the grpc.aio server: turns run as tasks on the serving loop."""
+    
+    turn_class = _AsyncTurn
+    
+    def __init__(self):
+        super().__init__(workers=0)
+        # Serving loop, which call() submits to from other threads
+        self.loop = None
+    
+    def _submit_held(self, thread_id: str, key: tuple, entered: threading.Event,
+                     released: futures.Future, deadline: Optional[float]) -> Optional[_AsyncTurn]:
+        async def produce(cancel_token: CancelToken) -> AsyncIterator:
+            entered.set()
+            await asyncio.wrap_future(released)
+            return
+            yield
+        
+        async def submit():
+            return self.submit(thread_id, key, produce, deadline)
+        return asyncio.run_coroutine_threadsafe(submit(), self.loop).result()
+    
+    def _leave(self, turn: _AsyncTurn):
+        self.loop.call_soon_threadsafe(turn.leave)
+    
+    def _start(self, turn: _AsyncTurn):
+        with self._lock:
+            self._stats["started"] += 1
+        turn.task = asyncio.get_running_loop().create_task(self._arun(turn))
+    
+    async def _arun(self, turn: _AsyncTurn):
+        try:
+            async for response in turn.produce(turn.cancel_token):
+                turn.publish(response)
+        except Exception as e:
+            turn.error = e
+            _log_turn_error(turn, e)
+        finally:
+            turn.finish()
+            self._advance(turn)
+
 class ChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
     """gRPC servicer for the AI Chatbot with streaming responses."""
     
+    def __init__(self, startup: Startup):
+        """
+        Args:
+            startup: Startup of the server; RPCs are only served once it is ready
+        """
+        self.startup = startup
+        # Set by the "graph" startup step
+        self.graph = None
+        self.batch_runner = None
+        self.admission = AdmissionController()
+        # Admitted turns and turns waiting for admission each hold a worker
+        self.scheduler = ThreadScheduler(self.admission.max_in_flight + self.admission.max_queue)
+    
+    def load_graph(self):
+        """Startup step: compile the graph, which needs the memory system initialized."""
+        self.graph = get_graph()
+        self.batch_runner = BatchRunner(self.graph, self.admission, self.scheduler)
+    
     def StreamChat(self, request: chatbot_pb2.ChatRequest, context) -> Iterator[chatbot_pb2.ChatResponse]:
         """
         Handle streaming chat requests.
@@ -30,76 +674,94 @@ class ChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
         Yields:
             ChatResponse chunks with streaming AI response
         """
+        # Validate required fields
+        error_response = _validate_chat_request(request)
+        if error_response:
+            yield error_response
+            return
+        
+        # One turn per thread at a time; duplicates share the running turn
+        turn = self.scheduler.submit(
+            request.thread_id,
+            _turn_key(request),
+            lambda cancel_token: self._admitted(request, self._run_turn(request, cancel_token)),
+            _deadline(context)
+        )
+        if turn is None:
+            yield _busy_response(request.thread_id)
+            return
+        yield from turn.subscribe(context)
+        
+        if isinstance(turn.error, AdmissionRejected):
+            context.set_trailing_metadata((("retry-after", str(turn.error.retry_after)),))
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(turn.error))
+    
+    def _admitted(self, request: chatbot_pb2.ChatRequest,
+                  responses: Iterator[chatbot_pb2.ChatResponse]) -> Iterator[chatbot_pb2.ChatResponse]:
+        """Run a turn once the admission controller grants it a slot in the interactive lane."""
+        with self.admission.slot(request.user_id.strip(), INTERACTIVE, _prompt_tokens(request)):
+            yield from responses
+    
+    def _run_turn(self, request: chatbot_pb2.ChatRequest, cancel_token: CancelToken) -> Iterator[chatbot_pb2.ChatResponse]:
+        """Run one chat turn through the graph; driven by the scheduler."""
+        if cancel_token.cancelled:
+            # Every caller left while the turn waited for admission
+            return
         try:
             # Extract request parameters
             thread_id = request.thread_id
             message = request.message
-            user_id = request.user_id.strip() if request.user_id else ""
+            user_id = request.user_id.strip()
             conversation_id = request.conversation_id or "main"
             
-            # Validate required fields
-            if not thread_id:
-                yield chatbot_pb2.ChatResponse(
-                    thread_id="",
-                    content="",
-                    is_complete=True,
-                    error="thread_id is required"
-                )
-                return
-                
-            if not message:
-                yield chatbot_pb2.ChatResponse(
-                    thread_id=thread_id,
-                    content="",
-                    is_complete=True,
-                    error="message is required"
-                )
-                return
-                
-            if not user_id:
-                yield chatbot_pb2.ChatResponse(
-                    thread_id=thread_id,
-                    content="",
-                    is_complete=True,
-                    error="user_id is required"
-                )
-                return
-            
             logger.info(f"Processing chat request for thread_id: {thread_id}")
             
-            # Get conversation configuration
-            config = memory_manager.get_conversation_config(user_id, conversation_id)
-            
-            # Override thread_id if provided explicitly
-            if thread_id != f"{user_id}_{conversation_id}":
-                config = {"configurable": {"thread_id": thread_id}}
+            config = _chat_config(request, user_id, conversation_id)
+            config["configurable"]["cancel_token"] = cancel_token
             
             # Create input state with user message
             input_state = {"messages": [HumanMessage(content=message)]}
             
-            # Invoke the graph and get the response
-            result = graph.invoke(input_state, config)
-            
-            # Get the AI response
-            ai_response = result["messages"][-1].content
+            received_at = datetime.now(timezone.utc)
+            # Creation time of the user's message in the message log
+            config["configurable"]["received_at"] = received_at
+            turn = TurnMessages()
             
-            # Stream the response in chunks
-            chunk_size = 50  # Adjust chunk size as needed
-            for i in range(0, len(ai_response), chunk_size):
-                chunk = ai_response[i:i + chunk_size]
-                is_final = (i + chunk_size) >= len(ai_response)
+            # Slow turns are captured with a span per graph step and checkpointer call
+            with trace_request("StreamChat", thread_id=thread_id) as trace:
+                if trace is not None:
+                    config["callbacks"] = [trace.callback()]
                 
-                yield chatbot_pb2.ChatResponse(
-                    thread_id=thread_id,
-                    content=chunk,
-                    is_complete=is_final,
-                    error=""
-                )
-                
-                # Small delay between chunks for realistic streaming
-                if not is_final:
-                    time.sleep(0.05)
-            
+                # Run the graph and forward model tokens as the chatbot node emits
+                # them. durability="exit" persists the final state with a single
+                # checkpoint write once the turn has finished.
+                try:
+                    for mode, chunk in self.graph.stream(input_state, config, stream_mode=["custom", "values"],
+                                                         durability="exit"):
+                        if mode == "values":
+                            turn.update(chunk)
+                            continue
+                        yield chatbot_pb2.ChatResponse(
+                            thread_id=thread_id,
+                            content=chunk,
+                            is_complete=False,
+                            error=""
+                        )
+                finally:
+                    # The turn is committed, also when it failed after the user's
+                    # message was applied: update the conversation catalog
+                    with span("record_turn"):
+                        memory_manager.record_turn(thread_id, user_id, conversation_id,
+                                                   turn.messages, turn.added, received_at)
+
+            # Signal the end of the response once the turn is checkpointed
+            yield chatbot_pb2.ChatResponse(
+                thread_id=thread_id,
+                content="",
+                is_complete=True,
+                error=_truncation_error(thread_id, cancel_token)
+            )
+
             logger.info(f"Completed chat request for thread_id: {thread_id}")
             
         except Exception as e:
@@ -111,6 +773,31 @@ class ChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
                 error=f"Internal server error: {str(e)}"
             )
     
+    def BatchChat(self, request: chatbot_pb2.BatchChatRequest, context) -> Iterator[chatbot_pb2.BatchChatResult]:
+        """
+        Run many chat turns for offline jobs.
+        
+        Args:
+            request: BatchChatRequest with the items and optional max_parallel
+            context: gRPC context
+            
+        Yields:
+            One BatchChatResult per item, in the order items finish
+        """
+        # Stop the batch when the client goes away or its deadline passes
+        cancel_token = CancelToken(_deadline(context))
+        context.add_callback(lambda: cancel_token.cancelled or cancel_token.cancel("cancelled"))
+        
+        items = _batch_items(request)
+        logger.info(f"Processing batch of {len(items)} chat items")
+        run = self.batch_runner.start(items, request.max_parallel, cancel_token)
+        try:
+            for result in run:
+                yield _batch_result(result)
+        finally:
+            run.close()
+        logger.info(f"Completed batch of {len(items)} chat items")
+    
     def GetHistory(self, request: chatbot_pb2.HistoryRequest, context) -> chatbot_pb2.HistoryResponse:
         """
         Get conversation history for a thread.
@@ -136,35 +823,77 @@ class ChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
             
             logger.info(f"Getting history for thread_id: {thread_id}")
             
-            # Get conversation configuration
-            config = memory_manager.get_conversation_config(user_id, conversation_id)
-            
-            # Override thread_id if provided explicitly
-            if thread_id != f"{user_id}_{conversation_id}":
-                config = {"configurable": {"thread_id": thread_id}}
-            
-            # Get the current state to retrieve conversation history
-            snapshot = graph.get_state(config)
-            messages = []
+            page = memory_manager.get_history_page(
+                thread_id, request.limit, request.before_seq, request.after_seq
+            )
+            if page is None:
+                # No history table: fall back to the checkpointed graph state
+                config = _resolve_config(thread_id, user_id, conversation_id)
+                snapshot = self.graph.get_state(config)
+                page = _page_history(_state_history(snapshot), request.limit, request.before_seq, request.after_seq)
             
-            if snapshot.values.get("messages"):
-                for msg in snapshot.values["messages"]:
-                    role = "human" if msg.type == "human" else "ai"
-                    messages.append(chatbot_pb2.Message(
-                        role=role,
-                        content=msg.content,
-                        timestamp=int(time.time())  # Placeholder timestamp
-                    ))
+            return _history_response(thread_id, request, page)
             
+        except Exception as e:
+            logger.error(f"Error in GetHistory: {str(e)}")
             return chatbot_pb2.HistoryResponse(
-                thread_id=thread_id,
-                messages=messages,
-                error=""
+                thread_id=request.thread_id,
+                messages=[],
+                error=f"Internal server error: {str(e)}"
             )
+    
+    def StreamHistory(self, request: chatbot_pb2.HistoryRequest, context) -> Iterator[chatbot_pb2.HistoryResponse]:
+        """
+        Stream the history of a thread in pages, newest messages first.
+        
+        Args:
+            request: HistoryRequest with thread_id and optional limit (page size),
+                before_seq and after_seq bounds
+            context: gRPC context
+            
+        Yields:
+            HistoryResponse pages until the bounds are exhausted
+        """
+        try:
+            thread_id = request.thread_id
+            user_id = request.user_id or "default"
+            conversation_id = request.conversation_id or "main"
+            
+            if not thread_id:
+                yield chatbot_pb2.HistoryResponse(
+                    thread_id="",
+                    messages=[],
+                    error="thread_id is required"
+                )
+                return
+            
+            logger.info(f"Streaming history for thread_id: {thread_id}")
+            
+            limit = request.limit if request.limit > 0 else HISTORY_PAGE_SIZE
+            before_seq = request.before_seq
+            history = None
+            while True:
+                page = memory_manager.get_history_page(thread_id, limit, before_seq, request.after_seq)
+                if page is None:
+                    if history is None:
+                        config = _resolve_config(thread_id, user_id, conversation_id)
+                        history = _state_history(self.graph.get_state(config))
+                    page = _page_history(history, limit, before_seq, request.after_seq)
+                
+                messages, has_more = page
+                yield chatbot_pb2.HistoryResponse(
+                    thread_id=thread_id,
+                    messages=[chatbot_pb2.Message(**m) for m in messages],
+                    error="",
+                    has_more=has_more
+                )
+                if not has_more:
+                    break
+                before_seq = messages[-1]['seq']
             
         except Exception as e:
-            logger.error(f"Error in GetHistory: {str(e)}")
-            return chatbot_pb2.HistoryResponse(
+            logger.error(f"Error in StreamHistory: {str(e)}")
+            yield chatbot_pb2.HistoryResponse(
                 thread_id=request.thread_id,
                 messages=[],
                 error=f"Internal server error: {str(e)}"
@@ -195,16 +924,7 @@ class ChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
             
             logger.info(f"Clearing conversation for thread_id: {thread_id}")
             
-            # Use memory manager to clear conversation
-            if thread_id == f"{user_id}_{conversation_id}":
-                memory_manager.clear_conversation(user_id, conversation_id)
-            else:
-                # If thread_id is custom, extract user and conversation parts or use defaults
-                parts = thread_id.split('_', 1)
-                if len(parts) == 2:
-                    memory_manager.clear_conversation(parts[0], parts[1])
-                else:
-                    memory_manager.clear_conversation("default", thread_id)
+            _clear_thread(thread_id, user_id, conversation_id)
             
             return chatbot_pb2.ClearResponse(
                 thread_id=thread_id,
@@ -225,11 +945,13 @@ class ChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
         Get all conversations for a specific user.
         
         Args:
-            request: UserConversationsRequest containing user_id
+            request: UserConversationsRequest containing user_id and optional
+                limit/cursor paging fields
             context: gRPC context
             
         Returns:
-            UserConversationsResponse with list of conversations
+            UserConversationsResponse with a page of conversations, most recently
+            active first, and the cursor of the next page
         """
         try:
             user_id = request.user_id.strip() if request.user_id else "default"
@@ -244,27 +966,20 @@ class ChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
             logger.info(f"Getting conversations for user: {user_id}")
             
             # Get conversations from memory manager
-            conversations = memory_manager.get_user_conversations(user_id)
+            conversations, next_cursor = memory_manager.get_user_conversations(
+                user_id, request.limit, request.cursor
+            )
             
             # Convert to protobuf messages
-            proto_conversations = []
-            for conv in conversations:
-                proto_conv = chatbot_pb2.Conversation(
-                    thread_id=conv['thread_id'],
-                    conversation_id=conv['conversation_id'],
-                    first_message=conv['first_message'],
-                    created_at=conv['created_at'],
-                    last_activity=conv['last_activity'],
-                    message_count=conv['message_count']
-                )
-                proto_conversations.append(proto_conv)
+            proto_conversations = _conversations_to_proto(conversations)
             
             logger.info(f"Found {len(proto_conversations)} conversations for user: {user_id}")
             
             return chatbot_pb2.UserConversationsResponse(
                 user_id=user_id,
                 conversations=proto_conversations,
-                error=""
+                error="",
+                next_cursor=next_cursor
             )
             
         except Exception as e:
@@ -275,6 +990,54 @@ class ChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
                 error=f"Internal server error: {str(e)}"
             )
     
+    def ExportConversations(self, request: chatbot_pb2.ExportRequest, context) -> Iterator[chatbot_pb2.ExportChunk]:
+        """
+        Stream conversations as newline-delimited JSON records (see transfer.py).
+        
+        Args:
+            request: ExportRequest with optional user_id, since/until bounds and
+                the cursor of an interrupted export
+            context: gRPC context
+            
+        Yields:
+            ExportChunk messages of whole records, each with the cursor resuming after it
+        """
+        records = 0
+        try:
+            logger.info(f"Exporting conversations of user: {request.user_id or '(all)'}")
+            for data, cursor, count in export_chunks(_export_records(request)):
+                records += count
+                yield chatbot_pb2.ExportChunk(data=data, cursor=cursor, records=count)
+            logger.info(f"Exported {records} messages")
+            
+        except Exception as e:
+            logger.error(f"Error in ExportConversations: {str(e)}")
+            yield chatbot_pb2.ExportChunk(error=f"Internal server error: {str(e)}")
+    
+    def ImportConversations(self, request_iterator, context) -> chatbot_pb2.ImportResponse:
+        """
+        Import conversations streamed in the ExportConversations format.
+        
+        Args:
+            request_iterator: ExportChunk messages; records may span chunks
+            context: gRPC context
+            
+        Returns:
+            ImportResponse with the threads and messages written
+        """
+        importer = None
+        try:
+            importer = ConversationImporter()
+            for chunk in request_iterator:
+                importer.feed(chunk.data)
+            importer.close()
+            logger.info(f"Imported conversations: {importer.stats}")
+            return _import_response(importer)
+            
+        except Exception as e:
+            logger.error(f"Error in ImportConversations: {str(e)}")
+            return _import_response(importer, f"Internal server error: {str(e)}")
+    
     def HealthCheck(self, request, context):
         """
         Health check endpoint for the service.
@@ -287,40 +1050,558 @@ class ChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
             HealthCheckResponse with service status
         """
         try:
-            # Simple health check - just return SERVING if we can respond
-            return chatbot_pb2.HealthCheckResponse(status="SERVING")
+            # Report load so load balancers can shed traffic before requests are rejected
+            return _health_response(self.admission, self.startup)
         except Exception as e:
             logger.error(f"Error in HealthCheck: {str(e)}")
             return chatbot_pb2.HealthCheckResponse(status="NOT_SERVING")
+    
+    def GetMetrics(self, request, context):
+        """
+        Get the service metrics.
+        
+        Args:
+            request: MetricsRequest (empty)
+            context: gRPC context
+            
+        Returns:
+            MetricsResponse with every metric in Prometheus text format
+        """
+        return chatbot_pb2.MetricsResponse(text=registry.render())
 
-def serve(port: int = 50051):
+class AsyncChatbotServicer(chatbot_pb2_grpc.ChatbotServiceServicer):
     """
-    Start the gRPC server.
+    grpc.aio servicer for the AI Chatbot.
     
-    Args:
-        port: Port number to serve on (default: 50051)
+    Every method is a coroutine and the graph is driven through astream/aget_state,
+    so an in-flight conversation waiting on Gemini or PostgreSQL does not hold a
+    thread. Blocking MemoryManager queries are moved off the event loop.
     """
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    chatbot_pb2_grpc.add_ChatbotServiceServicer_to_server(ChatbotServicer(), server)
     
-    listen_addr = f'[::]:{port}'
-    server.add_insecure_port(listen_addr)
+    def __init__(self, startup: Startup):
+        """
+        Args:
+            startup: Startup of the server; RPCs are only served once it is ready
+        """
+        self.startup = startup
+        # Graph compiled with the async checkpointer, set by the "async_graph" startup step
+        self.graph = None
+        self.batch_runner = None
+        self.scheduler = AsyncThreadScheduler()
+        self.admission = AsyncAdmissionController()
+    
+    def load_graph(self):
+        """Startup step: batch items run on worker threads against the sync checkpointer."""
+        self.batch_runner = BatchRunner(get_graph(), self.admission, self.scheduler)
+    
+    def load_async_graph(self, loop: asyncio.AbstractEventLoop):
+        """
+        Startup step: compile the graph with the async checkpointer.
+        
+        The async pool is bound to the serving loop, so it is opened there.
+        """
+        checkpointer = asyncio.run_coroutine_threadsafe(memory_manager.get_async_checkpointer(), loop).result()
+        self.graph = build_graph(checkpointer)
+    
+    async def StreamChat(self, request: chatbot_pb2.ChatRequest, context) -> AsyncIterator[chatbot_pb2.ChatResponse]:
+        """
+        Handle streaming chat requests.
+        
+        Args:
+            request: ChatRequest with thread_id, message, user_id, conversation_id
+            context: grpc.aio context
+        
+        Yields:
+            ChatResponse chunks with streaming AI response
+        """
+        # Validate required fields
+        error_response = _validate_chat_request(request)
+        if error_response:
+            yield error_response
+            return
+        
+        # One turn per thread at a time; duplicates share the running turn
+        turn = self.scheduler.submit(
+            request.thread_id,
+            _turn_key(request),
+            lambda cancel_token: self._admitted(request, self._run_turn(request, cancel_token)),
+            _deadline(context)
+        )
+        if turn is None:
+            yield _busy_response(request.thread_id)
+            return
+        async for response in turn.subscribe():
+            yield response
+        
+        if isinstance(turn.error, AdmissionRejected):
+            await context.abort(
+                grpc.StatusCode.RESOURCE_EXHAUSTED,
+                str(turn.error),
+                trailing_metadata=(("retry-after", str(turn.error.retry_after)),)
+            )
+    
+    async def _admitted(self, request: chatbot_pb2.ChatRequest,
+                        responses: AsyncIterator[chatbot_pb2.ChatResponse]) -> AsyncIterator[chatbot_pb2.ChatResponse]:
+        """Run a turn once the admission controller grants it a slot in the interactive lane."""
+        async with self.admission.slot(request.user_id.strip(), INTERACTIVE, _prompt_tokens(request)):
+            async for response in responses:
+                yield response
+    
+    async def _run_turn(self, request: chatbot_pb2.ChatRequest, cancel_token: CancelToken) -> AsyncIterator[chatbot_pb2.ChatResponse]:
+        """Run one chat turn through the graph; driven by the scheduler."""
+        if cancel_token.cancelled:
+            return
+        try:
+            thread_id = request.thread_id
+            user_id = request.user_id.strip()
+            conversation_id = request.conversation_id or "main"
+            
+            logger.info(f"Processing chat request for thread_id: {thread_id}")
+            
+            config = _chat_config(request, user_id, conversation_id)
+            config["configurable"]["cancel_token"] = cancel_token
+            input_state = {"messages": [HumanMessage(content=request.message)]}
+            received_at = datetime.now(timezone.utc)
+            # Creation time of the user's message in the message log
+            config["configurable"]["received_at"] = received_at
+            turn = TurnMessages()
+            
+            with trace_request("StreamChat", thread_id=thread_id) as trace:
+                if trace is not None:
+                    config["callbacks"] = [trace.callback()]
+                
+                try:
+                    async for mode, chunk in self.graph.astream(input_state, config, stream_mode=["custom", "values"],
+                                                                durability="exit"):
+                        if mode == "values":
+                            turn.update(chunk)
+                            continue
+                        yield chatbot_pb2.ChatResponse(
+                            thread_id=thread_id,
+                            content=chunk,
+                            is_complete=False,
+                            error=""
+                        )
+                finally:
+                    # The turn is committed, also when it failed after the user's
+                    # message was applied: update the conversation catalog
+                    with span("record_turn"):
+                        await memory_manager.arecord_turn(thread_id, user_id, conversation_id,
+                                                          turn.messages, turn.added, received_at)
+            
+            # Signal the end of the response once the turn is checkpointed
+            yield chatbot_pb2.ChatResponse(
+                thread_id=thread_id,
+                content="",
+                is_complete=True,
+                error=_truncation_error(thread_id, cancel_token)
+            )
+            
+            logger.info(f"Completed chat request for thread_id: {thread_id}")
+        
+        except Exception as e:
+            logger.error(f"Error in StreamChat: {str(e)}")
+            yield chatbot_pb2.ChatResponse(
+                thread_id=request.thread_id,
+                content="",
+                is_complete=True,
+                error=f"Internal server error: {str(e)}"
+            )
+    
+    async def BatchChat(self, request: chatbot_pb2.BatchChatRequest, context) -> AsyncIterator[chatbot_pb2.BatchChatResult]:
+        """Run many chat turns for offline jobs."""
+        cancel_token = CancelToken(_deadline(context))
+        items = _batch_items(request)
+        logger.info(f"Processing batch of {len(items)} chat items")
+        run = self.batch_runner.start(items, request.max_parallel, cancel_token)
+        try:
+            while True:
+                result = await asyncio.to_thread(run.get)
+                if result is None:
+                    break
+                yield _batch_result(result)
+        finally:
+            # Also reached when grpc.aio cancels the handler (client gone or deadline)
+            await asyncio.to_thread(run.close)
+        logger.info(f"Completed batch of {len(items)} chat items")
     
+    async def GetHistory(self, request: chatbot_pb2.HistoryRequest, context) -> chatbot_pb2.HistoryResponse:
+        """Get conversation history for a thread."""
+        try:
+            thread_id = request.thread_id
+            user_id = request.user_id or "default"
+            conversation_id = request.conversation_id or "main"
+            
+            if not thread_id:
+                return chatbot_pb2.HistoryResponse(
+                    thread_id="",
+                    messages=[],
+                    error="thread_id is required"
+                )
+            
+            logger.info(f"Getting history for thread_id: {thread_id}")
+            
+            page = await asyncio.to_thread(
+                memory_manager.get_history_page, thread_id, request.limit, request.before_seq, request.after_seq
+            )
+            if page is None:
+                config = _resolve_config(thread_id, user_id, conversation_id)
+                snapshot = await self.graph.aget_state(config)
+                page = _page_history(_state_history(snapshot), request.limit, request.before_seq, request.after_seq)
+            
+            return _history_response(thread_id, request, page)
+        
+        except Exception as e:
+            logger.error(f"Error in GetHistory: {str(e)}")
+            return chatbot_pb2.HistoryResponse(
+                thread_id=request.thread_id,
+                messages=[],
+                error=f"Internal server error: {str(e)}"
+            )
+    
+    async def StreamHistory(self, request: chatbot_pb2.HistoryRequest, context) -> AsyncIterator[chatbot_pb2.HistoryResponse]:
+        """Stream the history of a thread in pages, newest messages first."""
+        try:
+            thread_id = request.thread_id
+            user_id = request.user_id or "default"
+            conversation_id = request.conversation_id or "main"
+            
+            if not thread_id:
+                yield chatbot_pb2.HistoryResponse(
+                    thread_id="",
+                    messages=[],
+                    error="thread_id is required"
+                )
+                return
+            
+            logger.info(f"Streaming history for thread_id: {thread_id}")
+            
+            limit = request.limit if request.limit > 0 else HISTORY_PAGE_SIZE
+            before_seq = request.before_seq
+            history = None
+            while True:
+                page = await asyncio.to_thread(
+                    memory_manager.get_history_page, thread_id, limit, before_seq, request.after_seq
+                )
+                if page is None:
+                    if history is None:
+                        config = _resolve_config(thread_id, user_id, conversation_id)
+                        history = _state_history(await self.graph.aget_state(config))
+                    page = _page_history(history, limit, before_seq, request.after_seq)
+                
+                messages, has_more = page
+                yield chatbot_pb2.HistoryResponse(
+                    thread_id=thread_id,
+                    messages=[chatbot_pb2.Message(**m) for m in messages],
+                    error="",
+                    has_more=has_more
+                )
+                if not has_more:
+                    break
+                before_seq = messages[-1]['seq']
+        
+        except Exception as e:
+            logger.error(f"Error in StreamHistory: {str(e)}")
+            yield chatbot_pb2.HistoryResponse(
+                thread_id=request.thread_id,
+                messages=[],
+                error=f"Internal server error: {str(e)}"
+            )
+    
+    async def ClearConversation(self, request: chatbot_pb2.ClearRequest, context) -> chatbot_pb2.ClearResponse:
+        """Clear conversation history for a thread."""
+        try:
+            thread_id = request.thread_id
+            user_id = request.user_id or "default"
+            conversation_id = request.conversation_id or "main"
+            
+            if not thread_id:
+                return chatbot_pb2.ClearResponse(
+                    thread_id="",
+                    success=False,
+                    error="thread_id is required"
+                )
+            
+            logger.info(f"Clearing conversation for thread_id: {thread_id}")
+            
+            await asyncio.to_thread(_clear_thread, thread_id, user_id, conversation_id)
+            
+            return chatbot_pb2.ClearResponse(
+                thread_id=thread_id,
+                success=True,
+                error=""
+            )
+        
+        except Exception as e:
+            logger.error(f"Error in ClearConversation: {str(e)}")
+            return chatbot_pb2.ClearResponse(
+                thread_id=request.thread_id,
+                success=False,
+                error=f"Internal server error: {str(e)}"
+            )
+    
+    async def GetUserConversations(self, request, context):
+        """Get all conversations for a specific user."""
+        try:
+            user_id = request.user_id.strip() if request.user_id else "default"
+            
+            if not user_id:
+                return chatbot_pb2.UserConversationsResponse(
+                    user_id="",
+                    conversations=[],
+                    error="user_id is required"
+                )
+            
+            logger.info(f"Getting conversations for user: {user_id}")
+            
+            conversations, next_cursor = await asyncio.to_thread(
+                memory_manager.get_user_conversations, user_id, request.limit, request.cursor
+            )
+            proto_conversations = _conversations_to_proto(conversations)
+            
+            logger.info(f"Found {len(proto_conversations)} conversations for user: {user_id}")
+            
+            return chatbot_pb2.UserConversationsResponse(
+                user_id=user_id,
+                conversations=proto_conversations,
+                error="",
+                next_cursor=next_cursor
+            )
+        
+        except Exception as e:
+            logger.error(f"Error in GetUserConversations: {str(e)}")
+            return chatbot_pb2.UserConversationsResponse(
+                user_id=request.user_id,
+                conversations=[],
+                error=f"Internal server error: {str(e)}"
+            )
+    
+    async def ExportConversations(self, request: chatbot_pb2.ExportRequest, context) -> AsyncIterator[chatbot_pb2.ExportChunk]:
+        """Stream conversations as newline-delimited JSON records (see transfer.py)."""
+        records = _export_records(request)
+        chunks = export_chunks(records)
+        exported = 0
+        pending = None
+        try:
+            logger.info(f"Exporting conversations of user: {request.user_id or '(all)'}")
+            while True:
+                # The export holds a server-side cursor, read on a worker thread.
+                # Shielded, so a cancelled handler can let the read finish
+                pending = asyncio.ensure_future(asyncio.to_thread(next, chunks, None))
+                chunk = await asyncio.shield(pending)
+                if chunk is None:
+                    break
+                data, cursor, count = chunk
+                exported += count
+                yield chatbot_pb2.ExportChunk(data=data, cursor=cursor, records=count)
+            logger.info(f"Exported {exported} messages")
+        
+        except Exception as e:
+            logger.error(f"Error in ExportConversations: {str(e)}")
+            yield chatbot_pb2.ExportChunk(error=f"Internal server error: {str(e)}")
+        finally:
+            # Also reached when grpc.aio cancels the handler; returns the connection
+            # once a read still running on the worker thread is done
+            if pending is not None:
+                await asyncio.wait([pending])
+            await asyncio.to_thread(chunks.close)
+            await asyncio.to_thread(records.close)
+    
+    async def ImportConversations(self, request_iterator, context) -> chatbot_pb2.ImportResponse:
+        """Import conversations streamed in the ExportConversations format."""
+        importer = None
+        try:
+            importer = await asyncio.to_thread(ConversationImporter)
+            async for chunk in request_iterator:
+                await asyncio.to_thread(importer.feed, chunk.data)
+            await asyncio.to_thread(importer.close)
+            logger.info(f"Imported conversations: {importer.stats}")
+            return _import_response(importer)
+        
+        except Exception as e:
+            logger.error(f"Error in ImportConversations: {str(e)}")
+            return _import_response(importer, f"Internal server error: {str(e)}")
+    
+    async def HealthCheck(self, request, context):
+        """Health check endpoint for the service."""
+        return _health_response(self.admission, self.startup)
+    
+    async def GetMetrics(self, request, context):
+        """Get the service metrics in Prometheus text format."""
+        return chatbot_pb2.MetricsResponse(text=registry.render())
+
+def _log_services(listen_addr: str):
     logger.info(f"🚀 Starting gRPC server on {listen_addr}")
     logger.info("📡 Services available:")
     logger.info("  - StreamChat: Streaming AI chat responses (requires thread_id, user_id, message)")
     logger.info("  - GetHistory: Retrieve conversation history")
+    logger.info("  - StreamHistory: Stream conversation history page by page")
+    logger.info("  - BatchChat: Run many chat turns for offline jobs")
     logger.info("  - ClearConversation: Clear conversation memory")
     logger.info("  - GetUserConversations: Get all conversations for a user")
+    logger.info("  - ExportConversations / ImportConversations: Bulk transfer of conversations")
     logger.info("  - HealthCheck: Service health monitoring")
+    logger.info("  - GetMetrics: Service metrics in Prometheus text format")
+
+# Seconds in-flight RPCs get to finish when the server shuts down
+SHUTDOWN_GRACE = float(os.getenv("GRPC_SHUTDOWN_GRACE", "5"))
+# SO_REUSEPORT lets several worker processes serve one port (see workers.py)
+SERVER_OPTIONS = [("grpc.so_reuseport", 1)]
+
+def _stop_on_sigterm():
+    # Container runtimes stop the service with SIGTERM: shut down as on Ctrl+C,
+    # so pending checkpoint writes are committed before exiting
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+def _add_startup_steps(startup: Startup, servicer):
+    # The database pool and the model client are set up at the same time
+    startup.add("database", memory_manager.initialize)
+    startup.add("model", warm_model)
+    startup.add("graph", servicer.load_graph, after=["database"])
+
+def serve(port: int = 50051):
+    """
+    Start the gRPC server.
+    
+    The port is bound before the service is initialized: HealthCheck reports
+    NOT_SERVING and other RPCs are refused with UNAVAILABLE until the startup
+    steps have finished.
+    
+    Args:
+        port: Port number to serve on (default: 50051)
+    """
+    _stop_on_sigterm()
+    startup = Startup()
+    servicer = ChatbotServicer(startup)
+    _add_startup_steps(startup, servicer)
+    
+    # Every open StreamChat holds a worker while its turn runs on the scheduler
+    # or waits for admission, so size the pool for the admission limits plus
+    # headroom for other RPCs.
+    # RPCs beyond the pool are refused with RESOURCE_EXHAUSTED instead of queuing.
+    admission = servicer.admission
+    max_workers = int(os.getenv("GRPC_MAX_WORKERS", "0")) or admission.max_in_flight + admission.max_queue + 10
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=max_workers),
+        interceptors=[MetricsInterceptor(), ReadinessInterceptor(startup)],
+        options=SERVER_OPTIONS,
+        maximum_concurrent_rpcs=max_workers
+    )
+    chatbot_pb2_grpc.add_ChatbotServiceServicer_to_server(servicer, server)
+    
+    listen_addr = f'[::]:{port}'
+    server.add_insecure_port(listen_addr)
+    
+    _log_services(listen_addr)
     
     server.start()
+    registry.add_collector(_service_metrics(servicer))
+    enable_admin_endpoints()
+    metrics_server = start_metrics_server()
+    compactor = None
     
     try:
+        startup.run()
+        compactor = start_background_compaction()
         server.wait_for_termination()
     except KeyboardInterrupt:
         logger.info("🛑 Shutting down gRPC server...")
+        # New RPCs are refused while in-flight ones finish
+        server.stop(SHUTDOWN_GRACE).wait()
+    except Exception as e:
+        logger.error(f"❌ Startup failed: {str(e)}")
         server.stop(0)
+        raise
+    finally:
+        if compactor is not None:
+            compactor.stop()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        logger.info(f"Connection pool stats: {memory_manager.pool_stats()}")
+        if memory_manager.write_behind:
+            logger.info(f"Checkpoint writer stats: {memory_manager.writer_stats()}")
+        if memory_manager.state_cache:
+            logger.info(f"State cache stats: {memory_manager.state_cache_stats()}")
+        logger.info(f"LLM response cache stats: {response_cache.stats()}")
+        logger.info(f"Model executor stats: {model_executor.stats()}")
+        logger.info(f"Chat scheduler stats: {servicer.scheduler.stats()}")
+        logger.info(f"Admission stats: {servicer.admission.stats()}")
+        memory_manager.close()
+
+async def _serve_async(port: int):
+    startup = Startup()
+    servicer = AsyncChatbotServicer(startup)
+    _add_startup_steps(startup, servicer)
+    loop = asyncio.get_running_loop()
+    servicer.scheduler.loop = loop
+    startup.add("async_graph", lambda: servicer.load_async_graph(loop), after=["database"])
+    
+    server = grpc.aio.server(
+        interceptors=[AsyncMetricsInterceptor(), AsyncReadinessInterceptor(startup)],
+        options=SERVER_OPTIONS
+    )
+    chatbot_pb2_grpc.add_ChatbotServiceServicer_to_server(servicer, server)
+    
+    listen_addr = f'[::]:{port}'
+    server.add_insecure_port(listen_addr)
+    
+    _log_services(listen_addr)
+    logger.info("⚡ Running in asyncio mode")
+    
+    await server.start()
+    if sys.platform != "win32":
+        # Container runtimes stop the service with SIGTERM: stop serving and run
+        # the shutdown below, so pending checkpoint writes are committed
+        loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(server.stop(SHUTDOWN_GRACE)))
+    registry.add_collector(_service_metrics(servicer))
+    enable_admin_endpoints()
+    metrics_server = start_metrics_server()
+    compactor = None
+    try:
+        # Blocking steps run on startup threads while the loop keeps serving
+        try:
+            await asyncio.to_thread(startup.run)
+        except Exception as e:
+            logger.error(f"❌ Startup failed: {str(e)}")
+            raise
+        # Compaction runs on the sync pool in its own thread, off the serving loop
+        compactor = start_background_compaction()
+        await server.wait_for_termination()
+    finally:
+        logger.info("🛑 Shutting down gRPC server...")
+        await server.stop(SHUTDOWN_GRACE)
+        if compactor is not None:
+            await asyncio.to_thread(compactor.stop)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        logger.info(f"Connection pool stats: {memory_manager.pool_stats()}")
+        if memory_manager.write_behind:
+            logger.info(f"Checkpoint writer stats: {memory_manager.writer_stats()}")
+        if memory_manager.state_cache:
+            logger.info(f"State cache stats: {memory_manager.state_cache_stats()}")
+        logger.info(f"LLM response cache stats: {response_cache.stats()}")
+        logger.info(f"Model executor stats: {model_executor.stats()}")
+        logger.info(f"Chat scheduler stats: {servicer.scheduler.stats()}")
+        logger.info(f"Admission stats: {servicer.admission.stats()}")
+        await memory_manager.aclose()
+
+def serve_async(port: int = 50051):
+    """
+    Start the gRPC server in native asyncio mode.
+    
+    Chat streams are coroutines instead of executor threads, so concurrency is
+    bounded by upstream quota rather than by a worker pool size.
+    
+    Args:
+        port: Port number to serve on (default: 50051)
+    """
+    if sys.platform == "win32":
+        # psycopg's async connections need a selector event loop on Windows
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    try:
+        asyncio.run(_serve_async(port))
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
     serve()
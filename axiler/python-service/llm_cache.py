@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.messages import BaseMessage
+
+from context_window import message_text
+from memory import memory_manager
+
+logger = logging.getLogger(__name__)
+
+GET_SQL = "SELECT response FROM llm_response_cache WHERE key = %s AND expires_at > now()"
+
+PUT_SQL = """
+INSERT INTO llm_response_cache (key, model, response, created_at, expires_at)
+VALUES (%s, %s, %s, now(), now() + make_interval(secs => %s))
+ON CONFLICT (key) DO UPDATE SET
+    response = EXCLUDED.response,
+    created_at = EXCLUDED.created_at,
+    expires_at = EXCLUDED.expires_at
+"""
+
+# Expired rows first, then the oldest rows beyond the size limit
+PRUNE_EXPIRED_SQL = "DELETE FROM llm_response_cache WHERE expires_at <= now()"
+PRUNE_OVERFLOW_SQL = """
+DELETE FROM llm_response_cache WHERE key IN (
+    SELECT key FROM llm_response_cache ORDER BY expires_at DESC OFFSET %s
+)
+"""
+
+def _normalize(text: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share an entry."""
+    return " ".join(text.split()).casefold()
+
+def model_name(model) -> str:
+    """Name of a chat model as used in cache keys."""
+    return getattr(model, "model", None) or type(model).__name__
+
+class ResponseCache:
+    """
+    Cache of model replies keyed on the model and the normalized prompt.
+
+    Lookups go to an in-process LRU first and then, if enabled, to a table
+    shared by every server process. Both tiers expire entries after a TTL and
+    are bounded in size.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("LLM_CACHE", "false").lower() in ("1", "true", "yes")
+        self.ttl = float(os.getenv("LLM_CACHE_TTL", "3600"))
+        # Entries kept in the in-process LRU tier
+        self.max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+        # Only prompts with at most this many messages are cached (0 = any).
+        # Long threads practically never repeat, so they would only churn the LRU.
+        self.max_messages = int(os.getenv("LLM_CACHE_MAX_MESSAGES", "3"))
+        # Shared PostgreSQL tier
+        self.shared = os.getenv("LLM_CACHE_SHARED", "false").lower() in ("1", "true", "yes")
+        self.max_rows = int(os.getenv("LLM_CACHE_MAX_ROWS", "100000"))
+        # Prune the shared tier every this many stores
+        self.prune_every = 100
+
+        self._entries = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()
+        self._stores = 0
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bypassed": 0}
+
+    def key(self, model, prompt: List[BaseMessage], bypass: bool = False) -> Optional[str]:
+        """
+        Compute the cache key of a prompt.
+
+        Args:
+            model: Chat model the prompt is sent to
+            prompt: Messages sent to the model
+            bypass: Skip the cache for this request
+
+        Returns:
+            The key, or None when the prompt must not be served from or stored in the cache
+        """
+        if not self.enabled:
+            return None
+        if bypass:
+            self._count("bypassed")
+            return None
+        if self.max_messages and len(prompt) > self.max_messages:
+            return None
+        normalized = [[m.type, _normalize(message_text(m.content))] for m in prompt]
+        digest = hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
+        return f"{model_name(model)}:{digest}"
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        """
+        Look up a cached reply.
+
+        Args:
+            key: Key from key(), or None
+
+        Returns:
+            The cached reply text, or None on a miss
+        """
+        if key is None:
+            return None
+        response = self._get_local(key)
+        if response is None and self._pool is not None:
+            response = self._get_shared(key)
+            if response is not None:
+                self._count("shared_hits")
+                self._put_local(key, response)
+        self._count("misses" if response is None else "hits")
+        return response
+
+    async def aget(self, key: Optional[str]) -> Optional[str]:
+        """Async variant of get(); the shared tier is queried off the event loop."""
+        if key is None:
+            return None
+        response = self._get_local(key)
+        if response is None and self._pool is not None:
+            response = await asyncio.to_thread(self._get_shared, key)
+            if response is not None:
+                self._count("shared_hits")
+                self._put_local(key, response)
+        self._count("misses" if response is None else "hits")
+        return response
+
+    def put(self, key: Optional[str], response: str):
+        """
+        Store a reply in both tiers.
+
+        Args:
+            key: Key from key(), or None
+            response: Reply text; empty replies are not cached
+        """
+        if key is None or not response:
+            return
+        self._put_local(key, response)
+        if self._pool is not None:
+            self._put_shared(key, response)
+
+    async def aput(self, key: Optional[str], response: str):
+        """Async variant of put()."""
+        if key is None or not response:
+            return
+        self._put_local(key, response)
+        if self._pool is not None:
+            await asyncio.to_thread(self._put_shared, key, response)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and the current size of the local tier."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """Drop every entry of the local tier."""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def _pool(self):
+        return memory_manager.pool if self.shared else None
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _get_local(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._stats["evictions"] += 1
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def _put_local(self, key: str, response: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _get_shared(self, key: str) -> Optional[str]:
+        try:
+            with self._pool.connection() as conn:
+                row = conn.execute(GET_SQL, (key,)).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error reading LLM response cache: {str(e)}")
+            return None
+
+    def _put_shared(self, key: str, response: str):
+        try:
+            with self._pool.connection() as conn:
+                conn.execute(PUT_SQL, (key, key.rsplit(":", 1)[0], response, self.ttl))
+                with self._lock:
+                    self._stores += 1
+                    prune = self._stores % self.prune_every == 0
+                if prune:
+                    conn.execute(PRUNE_EXPIRED_SQL)
+                    conn.execute(PRUNE_OVERFLOW_SQL, (self.max_rows,))
+        except Exception as e:
+            logger.error(f"Error writing LLM response cache: {str(e)}")
+
+# Create a global instance
+response_cache = ResponseCache()
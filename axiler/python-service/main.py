@@ -1,10 +1,23 @@
-from typing import Annotated
+import os
+import threading
+import time
+from functools import reduce
+from operator import add
+from typing import Annotated, Optional
 from typing_extensions import TypedDict
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langchain_core.messages import BaseMessage, HumanMessage
-from googleGenai import model
-from memory import memory_manager
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, message_chunk_to_message
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from cancellation import CancelToken, next_or_cancel
+from context_window import context_policy, message_text
+from googleGenai import get_model, model_registry
+from llm_cache import response_cache
+from memory import TurnMessages, memory_manager
+from model_executor import model_executor
+from model_router import model_router
+from metrics import LLM_DURATION, LLM_FIRST_TOKEN, observe_usage
 
 # Define the state of our graph
 class State(TypedDict):
@@ -12,27 +25,227 @@ class State(TypedDict):
     # in the annotation defines how this state key should be updated
     # (in this case, it appends messages to the list, rather than overwriting them)
     messages: Annotated[list, add_messages]
+    # Running summary of messages[:summarized_count], maintained by the
+    # summarize node when CONTEXT_SUMMARIZE is enabled (see context_window.py)
+    summary: str
+    summarized_count: int
+
+def _final_message(chunks):
+    """Merge streamed chunks into the single AI message stored in the state."""
+    if not chunks:
+        return AIMessage(content="")
+    return message_chunk_to_message(reduce(add, chunks))
+
+def _cache_key(prompt, config: RunnableConfig, model: str):
+    bypass = config.get("configurable", {}).get("bypass_cache", False)
+    return response_cache.key(get_model(model), prompt, bypass)
+
+def _cancel_token(config: RunnableConfig) -> Optional[CancelToken]:
+    # Set by the gRPC server for turns that can be abandoned by their callers
+    return config.get("configurable", {}).get("cancel_token")
+
+def _is_cancelled(token: Optional[CancelToken]) -> bool:
+    return token is not None and token.cancelled
+
+def _route_metadata(model: str, reason: str, first_token: Optional[float] = None) -> dict:
+    # Stored with the reply, so routing policies can be tuned against the history
+    route = {"model": model, "reason": reason}
+    if first_token is not None:
+        route["first_token_seconds"] = round(first_token, 3)
+    return route
+
+def _reply_update(chunks, token: Optional[CancelToken], route: dict, stalled: bool = False):
+    """
+    State update for the generated reply.
+    
+    A cancelled generation, or one whose model stalled mid-reply, is kept as a
+    truncated reply (marked in its response_metadata) so the thread stays
+    consistent with what the caller saw; if nothing was generated yet, only
+    the user's message is kept.
+    """
+    message = _final_message(chunks)
+    observe_usage("chatbot", message)
+    message.response_metadata["route"] = route
+    if _is_cancelled(token) or stalled:
+        if not message_text(message.content):
+            return {"messages": []}
+        message.response_metadata["truncated"] = token.reason if _is_cancelled(token) else "model_timeout"
+    return {"messages": [message]}
+
+def _complete(update) -> bool:
+    # Only complete replies are cached
+    return bool(update["messages"]) and "truncated" not in update["messages"][0].response_metadata
 
 # Define the function that calls the model
-def chatbot(state: State):
-    return {"messages": [model.invoke(state["messages"])]}
+def chatbot(state: State, config: RunnableConfig):
+    # Stream the model output and forward every token through the graph's
+    # "custom" stream so gRPC callers receive it as soon as it is generated.
+    # Outside of a streaming run the writer is a no-op.
+    writer = get_stream_writer()
+    prompt = context_policy.build_prompt(state)
+    token = _cancel_token(config)
+    if _is_cancelled(token):
+        return {"messages": []}
+    
+    # A cached reply is streamed as one chunk and stored in the state like
+    # any other, so the thread's checkpoint is the same either way
+    # The router picks the model first: cached replies are kept per model
+    model, reason = model_router.route(state, config)
+    key = _cache_key(prompt, config, model)
+    cached = response_cache.get(key)
+    if cached is not None:
+        writer(cached)
+        return {"messages": [AIMessage(content=cached, response_metadata={"route": _route_metadata(model, "cached")})]}
+    
+    chunks = []
+    first_token = None
+    start = time.perf_counter()
+    stalled = False
+    # The token also interrupts waiting for a chunk and retry backoffs
+    stream = model_executor.stream(prompt, model, token)
+    try:
+        for chunk in stream:
+            if not chunks:
+                first_token = time.perf_counter() - start
+                LLM_FIRST_TOKEN.observe(first_token, node="chatbot", model=model)
+            text = message_text(chunk.content)
+            if text:
+                writer(text)
+            chunks.append(chunk)
+            if _is_cancelled(token):
+                break
+    except TimeoutError:
+        # A model that stalls mid-reply ends the turn with what it streamed
+        if not chunks:
+            raise
+        stalled = True
+    finally:
+        # Closing the generator also closes the model's HTTP stream
+        stream.close()
+        LLM_DURATION.observe(time.perf_counter() - start, node="chatbot", model=model)
+    update = _reply_update(chunks, token, _route_metadata(model, reason, first_token), stalled)
+    if _complete(update):
+        response_cache.put(key, message_text(update["messages"][0].content))
+    return update
+
+# Async variant used when the graph runs through ainvoke/astream (grpc.aio mode)
+async def achatbot(state: State, config: RunnableConfig):
+    writer = get_stream_writer()
+    prompt = context_policy.build_prompt(state)
+    token = _cancel_token(config)
+    if _is_cancelled(token):
+        return {"messages": []}
+    
+    # The router picks the model first: cached replies are kept per model
+    model, reason = model_router.route(state, config)
+    key = _cache_key(prompt, config, model)
+    cached = await response_cache.aget(key)
+    if cached is not None:
+        writer(cached)
+        return {"messages": [AIMessage(content=cached, response_metadata={"route": _route_metadata(model, "cached")})]}
+    
+    chunks = []
+    first_token = None
+    start = time.perf_counter()
+    stalled = False
+    stream = model_executor.astream(prompt, model)
+    try:
+        while True:
+            try:
+                # Waiting on the token as well interrupts a stalled stream
+                chunk = await (stream.__anext__() if token is None else next_or_cancel(stream, token))
+            except StopAsyncIteration:
+                break
+            except TimeoutError:
+                if not chunks:
+                    raise
+                stalled = True
+                break
+            if chunk is None:
+                break
+            if not chunks:
+                first_token = time.perf_counter() - start
+                LLM_FIRST_TOKEN.observe(first_token, node="chatbot", model=model)
+            text = message_text(chunk.content)
+            if text:
+                writer(text)
+            chunks.append(chunk)
+    finally:
+        await stream.aclose()
+        LLM_DURATION.observe(time.perf_counter() - start, node="chatbot", model=model)
+    update = _reply_update(chunks, token, _route_metadata(model, reason, first_token), stalled)
+    if _complete(update):
+        await response_cache.aput(key, message_text(update["messages"][0].content))
+    return update
 
-# Build the graph
-graph_builder = StateGraph(State)
+# Fold older turns into the running summary. Runs after the reply has been
+# streamed, so it never delays the first token of a turn.
+def summarize(state: State):
+    cutoff = context_policy.summary_cutoff(state)
+    with LLM_DURATION.time(node="summarize", model=model_registry.default):
+        summary = model_executor.invoke(context_policy.summary_prompt(state, cutoff))
+    observe_usage("summarize", summary)
+    return {"summary": message_text(summary.content), "summarized_count": cutoff}
 
-# The first argument is the unique node name
-# The second argument is the function or object that will be called whenever
-# the node is used.
-graph_builder.add_node("chatbot", chatbot)
+async def asummarize(state: State):
+    cutoff = context_policy.summary_cutoff(state)
+    with LLM_DURATION.time(node="summarize", model=model_registry.default):
+        summary = await model_executor.ainvoke(context_policy.summary_prompt(state, cutoff))
+    observe_usage("summarize", summary)
+    return {"summary": message_text(summary.content), "summarized_count": cutoff}
+
+def route_after_chatbot(state: State, config: RunnableConfig):
+    # Abandoned turns end right away instead of paying for a summary
+    if _is_cancelled(_cancel_token(config)):
+        return END
+    return "summarize" if context_policy.needs_summary(state) else END
+
+def build_graph(checkpointer):
+    """
+    Build and compile the chatbot graph.
+    
+    Args:
+        checkpointer: LangGraph checkpointer used for persistent memory. Use an
+            async checkpointer when the graph is driven through ainvoke/astream.
+            
+    Returns:
+        Compiled graph
+    """
+    graph_builder = StateGraph(State)
 
-# The first argument is the name of the node that will be called first.
-graph_builder.add_edge(START, "chatbot")
+    # The first argument is the unique node name
+    # The second argument is the function or object that will be called whenever
+    # the node is used. The sync and async implementations are picked by
+    # invoke/stream and ainvoke/astream respectively.
+    graph_builder.add_node("chatbot", RunnableLambda(chatbot, afunc=achatbot, name="chatbot"))
+    graph_builder.add_node("summarize", RunnableLambda(summarize, afunc=asummarize, name="summarize"))
 
-# The second argument is the name of the node (or END) that will be called after.
-graph_builder.add_edge("chatbot", END)
+    # The first argument is the name of the node that will be called first.
+    graph_builder.add_edge(START, "chatbot")
 
-# Finally, we compile the graph with PostgreSQL checkpointer for persistent memory
-graph = graph_builder.compile(checkpointer=memory_manager.checkpointer)
+    # After replying, summarize older turns if the thread has grown past the
+    # context policy's trigger size, otherwise finish the turn.
+    graph_builder.add_conditional_edges("chatbot", route_after_chatbot, ["summarize", END])
+    graph_builder.add_edge("summarize", END)
+
+    return graph_builder.compile(checkpointer=checkpointer)
+
+_graph = None
+_graph_lock = threading.Lock()
+
+def get_graph():
+    """
+    Get the graph compiled with the PostgreSQL checkpointer for persistent memory.
+    
+    Compiled on first use, which also initializes the memory system, so
+    importing this module does not connect to the database.
+    """
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = build_graph(memory_manager.checkpointer)
+    return _graph
 
 def run_chat():
     """Enhanced chat loop with persistent memory using PostgreSQL"""
@@ -74,7 +287,7 @@ def run_chat():
         elif user_input.lower() == 'history':
             try:
                 # Get the current state to show conversation history
-                snapshot = graph.get_state(config)
+                snapshot = get_graph().get_state(config)
                 if snapshot.values.get("messages"):
                     print("\n📖 Conversation History:")
                     print("-" * 30)
@@ -94,28 +307,174 @@ def run_chat():
             # automatically loads and maintains the conversation state
             input_state = {"messages": [HumanMessage(content=user_input)]}
             
-            # Invoke the graph with the configuration for persistent memory
+            # Run the graph with the configuration for persistent memory
             # The config parameter enables the checkpointing system
-            result = graph.invoke(input_state, config)
+            turn = TurnMessages()
+            try:
+                for values in get_graph().stream(input_state, config, stream_mode="values"):
+                    turn.update(values)
+            finally:
+                # Also records the user's message of a turn that failed
+                memory_manager.record_turn(f"{user_id}_{conversation_id}", user_id, conversation_id,
+                                           turn.messages, turn.added)
             
             # Get the AI's response (the last message in the result)
-            ai_response = result["messages"][-1].content
+            ai_response = turn.messages[-1].content
             print(f"🤖 AI: {ai_response}")
             
         except Exception as e:
             print(f"❌ Error: {e}")
             print("Please check your database connection and try again.")
 
+def run_batch(path: str, out_path: str = "", max_parallel: int = 0):
+    """
+    Run a JSON Lines file of chat turns (see batch.read_batch_file()).
+    
+    One JSON result per item is appended to the output file as soon as the
+    item finishes, so an interrupted run keeps the results it produced.
+    
+    Args:
+        path: Input file
+        out_path: Output file (default: <input>.results.jsonl)
+        max_parallel: Items run at once (0 = BATCH_MAX_PARALLEL)
+    """
+    import json
+    from batch import BatchRunner, read_batch_file
+    
+    out_path = out_path or f"{path.rsplit('.', 1)[0]}.results.jsonl"
+    items = read_batch_file(path)
+    print(f"📦 Running {len(items)} batch items from {path}, writing results to {out_path}")
+    run = BatchRunner(get_graph()).start(items, max_parallel)
+    failed = 0
+    try:
+        with open(out_path, "w", encoding="utf-8") as out:
+            for result in run:
+                failed += bool(result["error"])
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        # Interrupting the run skips the items that have not started yet
+        run.close()
+        memory_manager.close()
+    print(f"✅ {len(items) - failed} items succeeded, {failed} failed")
+
+def run_export(path: str, user_id: str = "", since: str = "", until: str = "", cursor: str = "",
+               resume: bool = False):
+    """
+    Export conversations to a newline-delimited JSON file (see transfer.py).
+    
+    Args:
+        path: Output file, or "-" for stdout
+        user_id: Only export this user's threads ("" = every user)
+        since: Only threads last active at or after this ISO 8601 time
+        until: Only threads last active before this ISO 8601 time
+        cursor: Resume after the record this cursor was taken from
+        resume: Continue an interrupted export to the same file
+    """
+    import contextlib
+    import sys
+    from datetime import datetime
+    from transfer import dump_record, export_records, record_cursor, resume_point
+    
+    mode = "w"
+    if resume and path != "-" and os.path.exists(path):
+        cursor, size = resume_point(path)
+        # Drops a last line the interrupted export did not finish
+        os.truncate(path, size)
+        mode = "a"
+    records = export_records(user_id, datetime.fromisoformat(since) if since else None,
+                             datetime.fromisoformat(until) if until else None, cursor)
+    count = 0
+    last = cursor
+    out = sys.stdout if path == "-" else open(path, mode, encoding="utf-8")
+    try:
+        # Status lines (e.g. of the memory setup) go to stderr, keeping stdout for records
+        with contextlib.redirect_stdout(sys.stderr):
+            for record in records:
+                out.write(dump_record(record) + "\n")
+                count += 1
+                last = record_cursor(record)
+    except KeyboardInterrupt:
+        print(f"⏸️ Export interrupted; resume with --cursor={last} or --resume", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        memory_manager.close()
+    print(f"✅ Exported {count} messages", file=sys.stderr)
+
+def run_import(path: str):
+    """
+    Import conversations from a newline-delimited JSON file (see transfer.py).
+    
+    Args:
+        path: Input file, or "-" for stdin
+    """
+    import sys
+    from transfer import ConversationImporter
+    
+    importer = ConversationImporter()
+    source = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        for line in source:
+            importer.feed(line)
+        stats = importer.close()
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        memory_manager.close()
+    print(f"✅ Imported {stats['messages']} messages into {stats['threads']} threads "
+          f"({stats['skipped']} already imported, {stats['failed']} failed)")
+
 def main():
     """Main entry point with mode selection."""
     import sys
     
     if len(sys.argv) > 1 and sys.argv[1] == 'grpc':
-        # Start gRPC server mode
-        from grpc_server import serve
-        port = int(sys.argv[2]) if len(sys.argv) > 2 else 50051
-        print(f"🚀 Starting in gRPC server mode on port {port}")
-        serve(port)
+        # Start gRPC server mode: python main.py grpc [port] [--aio] [--workers N]
+        argv = sys.argv[2:]
+        workers = int(os.getenv("GRPC_WORKERS", "1"))
+        args = []
+        while argv:
+            arg = argv.pop(0)
+            if arg.startswith('--workers'):
+                workers = int(arg.split('=', 1)[1] if '=' in arg else argv.pop(0))
+            elif not arg.startswith('--'):
+                args.append(arg)
+        port = int(args[0]) if args else 50051
+        if workers > 1:
+            # Several processes share the port; each runs the server below
+            from workers import serve_workers
+            print(f"🚀 Starting {workers} gRPC server workers on port {port}")
+            serve_workers(port, workers, aio='--aio' in sys.argv[2:])
+        elif '--aio' in sys.argv[2:]:
+            from grpc_server import serve_async
+            print(f"🚀 Starting in asyncio gRPC server mode on port {port}")
+            serve_async(port)
+        else:
+            from grpc_server import serve
+            print(f"🚀 Starting in gRPC server mode on port {port}")
+            serve(port)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'compact':
+        # Prune old checkpoints once: python main.py compact
+        from compaction import CheckpointCompactor
+        compactor = CheckpointCompactor()
+        print(f"🧹 Compacting checkpoints (keeping {compactor.keep} per thread)...")
+        report = compactor.run_once(wait_for_orphans=True)
+        print(f"✅ Reclaimed {report}")
+        memory_manager.close()
+    elif len(sys.argv) > 2 and sys.argv[1] == 'batch':
+        # Run many turns offline: python main.py batch <file.jsonl> [--out=FILE] [--parallel=N]
+        options = dict(arg[2:].split('=', 1) for arg in sys.argv[3:] if arg.startswith('--') and '=' in arg)
+        run_batch(sys.argv[2], options.get('out', ''), int(options.get('parallel', 0)))
+    elif len(sys.argv) > 2 and sys.argv[1] == 'export':
+        # Export conversations: python main.py export <file.jsonl|-> [--user=ID] [--since=TIME]
+        #   [--until=TIME] [--cursor=CURSOR] [--resume]
+        options = dict(arg[2:].split('=', 1) for arg in sys.argv[3:] if arg.startswith('--') and '=' in arg)
+        run_export(sys.argv[2], options.get('user', ''), options.get('since', ''), options.get('until', ''),
+                   options.get('cursor', ''), '--resume' in sys.argv[3:])
+    elif len(sys.argv) > 2 and sys.argv[1] == 'import':
+        # Import conversations: python main.py import <file.jsonl|->
+        run_import(sys.argv[2])
     else:
         # Start CLI mode
         print("🖥️ Starting in CLI mode")
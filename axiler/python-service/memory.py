@@ -1,56 +1,562 @@
+import asyncio
+import base64
+import json
 import os
+import threading
+import time
+from datetime import datetime, timezone
+import psycopg
 from dotenv import load_dotenv
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.checkpoint.postgres import PostgresSaver
-import psycopg
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+from context_window import message_text
+from message_log import MessageLog, MessageLogSaver
+from metrics import TimedCheckpointer
+from serializer import checkpoint_serializer
+from state_cache import CachedSaver, StateCache
+from write_behind import CheckpointWriter, WriteBehindSaver
 
 # Load environment variables
 load_dotenv()
 
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+# Application tables, applied in order after the LangGraph checkpoint tables.
+# Each entry's index is its version in chatbot_migrations: only append to this
+# list, never edit or reorder existing entries.
+MIGRATIONS = [
+    """CREATE TABLE IF NOT EXISTS chatbot_migrations (
+    v INTEGER PRIMARY KEY
+);""",
+    # One row per thread, maintained as each turn commits, so listing a user's
+    # conversations never has to scan or deserialize checkpoints
+    """CREATE TABLE IF NOT EXISTS conversation_catalog (
+    thread_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    first_message TEXT NOT NULL DEFAULT '',
+    message_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_activity TIMESTAMPTZ NOT NULL DEFAULT now()
+);""",
+    """CREATE INDEX IF NOT EXISTS conversation_catalog_user_activity_idx
+    ON conversation_catalog (user_id, last_activity DESC, thread_id DESC);""",
+    # Append-only projection of every thread's messages. seq is the 1-based
+    # position of the message in the thread's state, so the primary key
+    # serves both history pages and their cursors.
+    """CREATE TABLE IF NOT EXISTS conversation_messages (
+    thread_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (thread_id, seq)
+);""",
+    # Shared tier of the LLM response cache (see llm_cache.py)
+    """CREATE TABLE IF NOT EXISTS llm_response_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    expires_at TIMESTAMPTZ NOT NULL
+);""",
+    """CREATE INDEX IF NOT EXISTS llm_response_cache_expires_idx
+    ON llm_response_cache (expires_at);""",
+    # Announce checkpoint changes of root graphs to the state caches of every
+    # replica (see state_cache.py): "<P|W|D>:<checkpoint_id>:<thread_id>"
+    """CREATE OR REPLACE FUNCTION chatbot_notify_checkpoint() RETURNS trigger AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        r := OLD;
+    ELSE
+        r := NEW;
+    END IF;
+    IF r.checkpoint_ns = '' THEN
+        PERFORM pg_notify('chatbot_checkpoints',
+            CASE WHEN TG_OP = 'DELETE' THEN 'D'
+                 WHEN TG_TABLE_NAME = 'checkpoint_writes' THEN 'W'
+                 ELSE 'P' END
+            || ':' || r.checkpoint_id || ':' || r.thread_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;""",
+    """DO $$
+BEGIN
+    DROP TRIGGER IF EXISTS chatbot_checkpoints_notify ON checkpoints;
+    CREATE TRIGGER chatbot_checkpoints_notify
+        AFTER INSERT OR UPDATE OR DELETE ON checkpoints
+        FOR EACH ROW EXECUTE FUNCTION chatbot_notify_checkpoint();
+    DROP TRIGGER IF EXISTS chatbot_checkpoint_writes_notify ON checkpoint_writes;
+    CREATE TRIGGER chatbot_checkpoint_writes_notify
+        AFTER INSERT OR UPDATE ON checkpoint_writes
+        FOR EACH ROW EXECUTE FUNCTION chatbot_notify_checkpoint();
+END $$;""",
+    # Complete messages for the message log (see message_log.py); rows written
+    # only as history have no data
+    """ALTER TABLE conversation_messages
+    ADD COLUMN IF NOT EXISTS message_id TEXT,
+    ADD COLUMN IF NOT EXISTS data_type TEXT,
+    ADD COLUMN IF NOT EXISTS data BYTEA;""",
+]
+
+# Version after which existing threads are copied into conversation_catalog
+CATALOG_MIGRATION = 2
+# Version after which existing messages are copied into conversation_messages
+HISTORY_MIGRATION = 3
+# pg_advisory_lock key held while migrating
+SCHEMA_LOCK_ID = 0x63686174
+
+# Message count recorded for a thread, locked until the turn's rows are written
+LOCK_TURN_SQL = "SELECT message_count FROM conversation_catalog WHERE thread_id = %s FOR UPDATE"
+
+RECORD_TURN_SQL = """
+INSERT INTO conversation_catalog
+    (thread_id, user_id, conversation_id, first_message, message_count, created_at, last_activity)
+VALUES (%s, %s, %s, %s, %s, now(), now())
+ON CONFLICT (thread_id) DO UPDATE SET
+    message_count = GREATEST(conversation_catalog.message_count, EXCLUDED.message_count),
+    last_activity = EXCLUDED.last_activity
+"""
+
+INSERT_MESSAGE_SQL = """
+INSERT INTO conversation_messages (thread_id, seq, role, content, created_at)
+VALUES (%s, %s, %s, %s, %s)
+ON CONFLICT (thread_id, seq) DO UPDATE SET role = EXCLUDED.role, content = EXCLUDED.content
+WHERE (conversation_messages.role, conversation_messages.content) IS DISTINCT FROM (EXCLUDED.role, EXCLUDED.content)
+"""
+
+# Attempts at recording a turn before the error is raised to the caller
+RECORD_TURN_ATTEMPTS = 3
+
+def preview(text: str, length: int = 100) -> str:
+    """Truncate a message for conversation listings."""
+    return text[:length] + ('...' if len(text) > length else '')
+
+def _first_message(messages: list) -> str:
+    """Catalog preview of a thread: its first user message."""
+    for m in messages:
+        if m.type == "human":
+            return preview(message_text(m.content))
+    return ""
+
+class TurnMessages:
+    """
+    The messages a turn leaves in its thread, followed on the graph's "values" stream.
+    
+    The last values seen are what the turn checkpoints with durability="exit",
+    also when it fails or is cancelled after the user's message was applied,
+    so the history can be recorded from them either way.
+    """
+    
+    def __init__(self):
+        self.messages = []
+        self.added = 0
+        self._start = None
+    
+    def update(self, values: dict):
+        """Take one "values" chunk of the turn's stream."""
+        messages = values.get("messages", [])
+        if self._start is None:
+            # First values: the thread's state with the turn's input applied
+            self._start = len(messages) - 1
+        self.messages = messages
+        self.added = len(messages) - self._start
+
+def encode_cursor(last_activity: datetime, thread_id: str) -> str:
+    """Encode the position after a catalog row as an opaque page cursor."""
+    raw = json.dumps([last_activity.isoformat(), thread_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    """Decode a page cursor produced by encode_cursor()."""
+    last_activity, thread_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(last_activity), thread_id
+
+class PoolSettings:
+    """Connection pool sizing and health settings, read from the environment."""
+    
+    def __init__(self):
+        self.min_size = _env_int("DB_POOL_MIN_SIZE", 2)
+        self.max_size = _env_int("DB_POOL_MAX_SIZE", 20)
+        # Seconds a caller may wait for a free connection before failing
+        self.timeout = _env_float("DB_POOL_TIMEOUT", 30.0)
+        # Callers allowed to queue for a connection (0 = unbounded)
+        self.max_waiting = _env_int("DB_POOL_MAX_WAITING", 0)
+        self.max_idle = _env_float("DB_POOL_MAX_IDLE", 600.0)
+        self.max_lifetime = _env_float("DB_POOL_MAX_LIFETIME", 3600.0)
+        # How long the pool keeps retrying after the database goes away
+        self.reconnect_timeout = _env_float("DB_POOL_RECONNECT_TIMEOUT", 300.0)
+    
+    def pool_kwargs(self) -> dict:
+        """Keyword arguments shared by the sync and async pools."""
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "timeout": self.timeout,
+            "max_waiting": self.max_waiting,
+            "max_idle": self.max_idle,
+            "max_lifetime": self.max_lifetime,
+            "reconnect_timeout": self.reconnect_timeout,
+            # autocommit is required by the checkpointer's DDL (CREATE INDEX CONCURRENTLY)
+            # and prepared statements are disabled so the pool also works behind pgbouncer
+            "kwargs": {"autocommit": True, "prepare_threshold": 0},
+        }
+
 class MemoryManager:
     """Manages memory for the AI chatbot using LangGraph checkpointing."""
     
     def __init__(self):
         self.database_url = os.getenv("DATABASE_URL")
-        if not self.database_url:
-            print("⚠️ DATABASE_URL not found, using SQLite for memory storage")
+        # Keep serving from MemorySaver when PostgreSQL cannot be reached,
+        # instead of failing initialization
+        self.allow_memory_fallback = os.getenv("MEMORY_FALLBACK", "false").lower() in ("1", "true", "yes")
+        # Queue checkpoint writes and commit them in batches in the background
+        # (see write_behind.py); a crash loses up to CHECKPOINT_FLUSH_INTERVAL of writes
+        self.write_behind = os.getenv("CHECKPOINT_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+        # Serve the latest checkpoint of hot threads from process memory (see state_cache.py)
+        self.state_cache = os.getenv("STATE_CACHE", "false").lower() in ("1", "true", "yes")
+        # Keep messages in an append-only log instead of in every checkpoint (see message_log.py)
+        self.message_log = os.getenv("CHECKPOINT_MESSAGE_LOG", "false").lower() in ("1", "true", "yes")
         
+        self.pool_settings = PoolSettings()
+        self._pool = None
+        self._async_pool = None
+        self._writer = None
+        self._cache = None
+        self._log = None
+        self._serde = None
         self._checkpointer = None
-        self._setup_memory()
+        self._async_checkpointer = None
+        self._init_lock = threading.Lock()
+    
+    @property
+    def initialized(self) -> bool:
+        return self._checkpointer is not None
+    
+    def initialize(self):
+        """
+        Connect to PostgreSQL and bring the schema up to date.
+        
+        Nothing connects at import time: the gRPC server runs this as a startup
+        step, other entry points on first use of the checkpointer. Calling it
+        again is a no-op.
+        
+        Raises:
+            Exception: PostgreSQL could not be set up and MEMORY_FALLBACK is off
+        """
+        if self._checkpointer is not None:
+            return
+        with self._init_lock:
+            if self._checkpointer is None:
+                self._setup_memory()
     
     def _setup_memory(self):
         """Setup the memory system with PostgreSQL."""
+        if not self.database_url:
+            print("⚠️ DATABASE_URL not set, using in-memory storage (conversations won't persist)")
+            self._checkpointer = TimedCheckpointer(MemorySaver())
+            return
+        
         try:
-            if self.database_url and self.database_url.startswith("postgresql://"):
-                # Use PostgreSQL for checkpointing
-                print("🐘 Setting up PostgreSQL memory storage...")
-                
-                # Create direct connection with autocommit for DDL
-                conn = psycopg.connect(self.database_url, autocommit=True)
-                self._checkpointer = PostgresSaver(conn)
-                
-                # Setup the database tables for checkpointing
-                self._checkpointer.setup()
-                
-                print("✅ PostgreSQL memory database initialized")
-                print("💡 Chat conversations will be persistent across sessions")
-                
+            if not self.database_url.startswith("postgresql://"):
+                raise ValueError("❌ DATABASE_URL must be a postgresql:// URL. Please check your .env file.")
+            
+            # Use PostgreSQL for checkpointing
+            print("🐘 Setting up PostgreSQL memory storage...")
+            
+            # Every query path and the checkpointer borrow connections from
+            # this pool; broken connections are detected on checkout and replaced
+            self._pool = ConnectionPool(
+                self.database_url,
+                name="chatbot-memory",
+                check=ConnectionPool.check_connection,
+                reconnect_failed=self._on_reconnect_failed,
+                open=False,
+                **self.pool_settings.pool_kwargs()
+            )
+            # Waits until min_size connections are open, so the pool is warm
+            self._pool.open(wait=True, timeout=self.pool_settings.timeout)
+            self._serde = checkpoint_serializer()
+            saver = PostgresSaver(self._pool, serde=self._serde)
+            if self._serde.codec is not None:
+                print(f"🗜️ Checkpoint values of {self._serde.threshold} bytes or more are "
+                      f"compressed with {self._serde.codec.name}")
+            
+            # Setup the database tables for checkpointing, unless a previous
+            # start already applied every migration
+            if self._schema_is_current():
+                print("✅ Database schema is up to date")
             else:
-                raise ValueError("❌ PostgreSQL DATABASE_URL is required. Please check your .env file.")
-                
+                # Replicas starting together on a new database migrate one at a time
+                with self._pool.connection() as lock_conn:
+                    lock_conn.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_LOCK_ID,))
+                    try:
+                        saver.setup()
+                        self._setup_schema(saver)
+                    finally:
+                        lock_conn.execute("SELECT pg_advisory_unlock(%s)", (SCHEMA_LOCK_ID,))
+            
+            if self.write_behind:
+                self._writer = CheckpointWriter(self._pool, saver)
+                saver = WriteBehindSaver(saver, self._writer)
+                print(f"💾 Checkpoint writes are committed in the background "
+                      f"(every {self._writer.interval * 1000:.0f}ms)")
+            # Messages are logged as the checkpoint is put, queued ahead of it with
+            # write-behind. Always wrapped, so checkpoints written while the log
+            # was on still load after it is switched off
+            self._log = MessageLog()
+            saver = MessageLogSaver(saver, self._log, self._pool, write=self.message_log, writer=self._writer)
+            if self._writer is not None:
+                # A dropped append leaves the thread's log short of what was remembered
+                self._writer.on_drop = self._log.forget
+            if self.message_log:
+                print("📜 Messages are appended to the message log; checkpoints only reference it")
+            if self.state_cache:
+                self._cache = StateCache(self.database_url)
+                saver = CachedSaver(saver, self._cache)
+                print(f"⚡ Caching the state of up to {self._cache.max_entries} conversations in memory")
+            # Wrapped to record checkpoint read/write latency (see metrics.py)
+            self._checkpointer = TimedCheckpointer(saver)
+            
+            print(f"✅ PostgreSQL memory database initialized "
+                  f"(pool size {self.pool_settings.min_size}-{self.pool_settings.max_size})")
+            print("💡 Chat conversations will be persistent across sessions")
+            
         except Exception as e:
             print(f"❌ Error setting up PostgreSQL memory: {e}")
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+            if not self.allow_memory_fallback:
+                raise
             print("🔄 Falling back to in-memory storage (conversations won't persist)")
             # Fall back to in-memory storage
-            self._checkpointer = MemorySaver()
+            self._checkpointer = TimedCheckpointer(MemorySaver())
+    
+    def _schema_is_current(self) -> bool:
+        """Whether the checkpoint tables and MIGRATIONS are at their latest versions."""
+        with self._pool.connection() as conn:
+            row = conn.execute("""
+                SELECT to_regclass('checkpoint_migrations') IS NOT NULL
+                   AND to_regclass('chatbot_migrations') IS NOT NULL
+            """).fetchone()
+            if not row[0]:
+                return False
+            checkpoint_version, version = conn.execute("""
+                SELECT (SELECT max(v) FROM checkpoint_migrations), (SELECT max(v) FROM chatbot_migrations)
+            """).fetchone()
+        return (checkpoint_version == len(PostgresSaver.MIGRATIONS) - 1
+                and version == len(MIGRATIONS) - 1)
+    
+    def _setup_schema(self, checkpointer):
+        """Apply pending application migrations (see MIGRATIONS)."""
+        with self._pool.connection() as conn:
+            conn.execute(MIGRATIONS[0])
+            row = conn.execute("SELECT max(v) FROM chatbot_migrations").fetchone()
+            version = row[0] if row and row[0] is not None else -1
+            for v in range(version + 1, len(MIGRATIONS)):
+                with conn.transaction():
+                    conn.execute(MIGRATIONS[v])
+                    conn.execute("INSERT INTO chatbot_migrations (v) VALUES (%s)", (v,))
+                if v == CATALOG_MIGRATION:
+                    self._backfill_catalog(checkpointer)
+                elif v == HISTORY_MIGRATION:
+                    self._backfill_history(checkpointer)
+    
+    def _backfill_catalog(self, checkpointer):
+        """Copy threads checkpointed before the conversation catalog existed into it."""
+        with self._pool.connection() as conn:
+            rows = conn.execute("""
+                SELECT thread_id, min(checkpoint->>'ts'), max(checkpoint->>'ts')
+                FROM checkpoints
+                WHERE checkpoint_ns = ''
+                GROUP BY thread_id
+            """).fetchall()
+        
+        for thread_id, created_at, last_activity in rows:
+            checkpoint = checkpointer.get_tuple({"configurable": {"thread_id": thread_id}})
+            messages = checkpoint.checkpoint["channel_values"].get("messages", []) if checkpoint else []
+            # Legacy thread ids follow the "{user_id}_{conversation_id}" convention
+            user_id, _, conversation_id = thread_id.partition("_")
+            with self._pool.connection() as conn:
+                conn.execute("""
+                    INSERT INTO conversation_catalog
+                        (thread_id, user_id, conversation_id, first_message, message_count, created_at, last_activity)
+                    VALUES (%s, %s, %s, %s, %s, COALESCE(%s::timestamptz, now()), COALESCE(%s::timestamptz, now()))
+                    ON CONFLICT (thread_id) DO NOTHING
+                """, (thread_id, user_id, conversation_id or "main", _first_message(messages),
+                      len(messages), created_at, last_activity))
+        if rows:
+            print(f"📋 Added {len(rows)} existing conversations to the conversation catalog")
+    
+    def _backfill_history(self, checkpointer):
+        """
+        Copy the messages of threads checkpointed before conversation_messages existed.
+        
+        Each message is stamped with the time of the first checkpoint that contains
+        it, which is exact for threads written one checkpoint per turn.
+        """
+        with self._pool.connection() as conn:
+            threads = [row[0] for row in conn.execute(
+                "SELECT DISTINCT thread_id FROM checkpoints WHERE checkpoint_ns = ''"
+            ).fetchall()]
+        
+        for thread_id in threads:
+            config = {"configurable": {"thread_id": thread_id}}
+            messages = []
+            timestamps = []
+            # Newest checkpoint first: walk back, moving each message's time earlier
+            for checkpoint in checkpointer.list(config):
+                if checkpoint.config["configurable"].get("checkpoint_ns"):
+                    continue
+                ts = datetime.fromisoformat(checkpoint.checkpoint["ts"])
+                count = len(checkpoint.checkpoint["channel_values"].get("messages", []))
+                if not messages:
+                    messages = checkpoint.checkpoint["channel_values"].get("messages", [])
+                    timestamps = [ts] * len(messages)
+                for i in range(min(count, len(timestamps))):
+                    timestamps[i] = ts
+            if not messages:
+                continue
+            
+            rows = [(thread_id, i + 1, "human" if m.type == "human" else "ai", message_text(m.content), ts)
+                    for i, (m, ts) in enumerate(zip(messages, timestamps))]
+            with self._pool.connection() as conn, conn.transaction():
+                conn.cursor().executemany(INSERT_MESSAGE_SQL, rows)
+                # Keep message_count in step with the rows above
+                conn.execute("UPDATE conversation_catalog SET message_count = %s WHERE thread_id = %s",
+                             (len(rows), thread_id))
+        if threads:
+            print(f"📋 Added the messages of {len(threads)} existing conversations to the history table")
+    
+    @staticmethod
+    def _on_reconnect_failed(pool):
+        print(f"❌ Pool '{pool.name}' could not reconnect to PostgreSQL within "
+              f"{pool.reconnect_timeout:.0f}s; it will keep retrying on demand")
     
     @property
     def checkpointer(self):
-        """Get the checkpointer instance."""
-        if self._checkpointer is None:
-            raise RuntimeError("Checkpointer not initialized. Call _setup_memory() first.")
+        """Get the checkpointer instance, initializing the memory system on first use."""
+        self.initialize()
         return self._checkpointer
     
+    @property
+    def pool(self):
+        """Get the PostgreSQL connection pool, or None when running on MemorySaver."""
+        self.initialize()
+        return self._pool
+    
+    async def get_async_checkpointer(self):
+        """
+        Get a checkpointer for graphs driven through ainvoke/astream.
+        
+        The async connection is bound to the running event loop, so this must be
+        awaited from the loop that will use it (e.g. the grpc.aio server loop).
+        
+        Returns:
+            AsyncPostgresSaver sharing the tables of the sync checkpointer, or the
+            in-memory saver when PostgreSQL is not available
+        """
+        if self._async_checkpointer is None:
+            if not self.initialized:
+                await asyncio.to_thread(self.initialize)
+            if self._pool is not None:
+                # Tables were already created by the sync checkpointer's setup()
+                self._async_pool = AsyncConnectionPool(
+                    self.database_url,
+                    name="chatbot-memory-async",
+                    check=AsyncConnectionPool.check_connection,
+                    reconnect_failed=self._on_reconnect_failed,
+                    open=False,
+                    **self.pool_settings.pool_kwargs()
+                )
+                await self._async_pool.open(wait=True, timeout=self.pool_settings.timeout)
+                saver = AsyncPostgresSaver(self._async_pool, serde=self._serde)
+                if self._writer is not None:
+                    # Shares the sync checkpointer's queue, so either one reads the other's writes
+                    saver = WriteBehindSaver(saver, self._writer)
+                saver = MessageLogSaver(saver, self._log, self._async_pool, write=self.message_log,
+                                        writer=self._writer)
+                if self._cache is not None:
+                    saver = CachedSaver(saver, self._cache)
+                self._async_checkpointer = TimedCheckpointer(saver)
+                print("✅ Async PostgreSQL checkpointer ready")
+            else:
+                # MemorySaver implements both the sync and async interfaces
+                self._async_checkpointer = self.checkpointer
+        return self._async_checkpointer
+    
+    def pool_stats(self) -> dict:
+        """
+        Get connection pool metrics.
+        
+        Returns:
+            Mapping of pool name to its psycopg_pool statistics (size, available
+            connections, requests_waiting, requests_wait_ms, connections_lost, ...)
+        """
+        stats = {}
+        for pool in (self._pool, self._async_pool):
+            if pool is not None:
+                stats[pool.name] = pool.get_stats()
+        return stats
+    
+    def writer_stats(self) -> dict:
+        """Write-behind queue depth, lag and counters, or {} when writes are synchronous."""
+        return self._writer.stats() if self._writer is not None else {}
+    
+    def state_cache_stats(self) -> dict:
+        """State cache hits, misses, evictions, size and hit ratio, or {} when it is disabled."""
+        return self._cache.stats() if self._cache is not None else {}
+    
+    def bound_checkpointer(self, conn):
+        """
+        Checkpointer writing through an open connection, inside its transaction.
+        
+        For bulk writers (see transfer.py). Like the service's checkpointer it
+        resolves message log references and, with CHECKPOINT_MESSAGE_LOG, logs
+        the messages of the checkpoints it writes; it bypasses write-behind and
+        the state cache.
+        """
+        self.initialize()
+        # Its own log, so a rolled back transaction leaves the service's
+        # remembered log tails intact
+        return MessageLogSaver(PostgresSaver(conn, serde=self._serde), MessageLog(), conn, write=self.message_log)
+    
+    def invalidate_state(self, thread_id: str):
+        """Drop a thread's cached state after its checkpoints were written outside the checkpointer."""
+        if self._cache is not None:
+            self._cache.invalidate(thread_id)
+    
+    def close(self):
+        """Commit pending checkpoint writes and close the sync connection pool."""
+        if self._cache is not None:
+            self._cache.close()
+        if self._writer is not None:
+            self._writer.close()
+        if self._pool is not None:
+            self._pool.close()
+    
+    async def aclose(self):
+        """Commit pending checkpoint writes and close the async connection pool."""
+        if self._cache is not None:
+            await asyncio.to_thread(self._cache.close)
+        if self._writer is not None:
+            await asyncio.to_thread(self._writer.close)
+        if self._async_pool is not None:
+            await self._async_pool.close()
+    
     def get_conversation_config(self, user_id: str = "default", conversation_id: str = "main"):
         """
         Get configuration for a specific conversation thread.
@@ -74,14 +580,21 @@ class MemoryManager:
             conversation_id: Identifier for the conversation
         """
         thread_id = f"{user_id}_{conversation_id}"
-        if isinstance(self._checkpointer, PostgresSaver):
+        if self.pool is not None:
             try:
+                if self._writer is not None:
+                    # Queued writes would otherwise bring the thread back
+                    self._writer.flush(thread_id)
                 # For PostgreSQL, we can delete the thread data
-                with self._checkpointer.conn.cursor() as cur:
+                with self.pool.connection() as conn, conn.transaction(), conn.cursor() as cur:
                     cur.execute("DELETE FROM checkpoints WHERE thread_id = %s", (thread_id,))
                     cur.execute("DELETE FROM checkpoint_writes WHERE thread_id = %s", (thread_id,))
-                    self._checkpointer.conn.commit()
-                    print(f"🗑️ Cleared conversation: {thread_id}")
+                    cur.execute("DELETE FROM checkpoint_blobs WHERE thread_id = %s", (thread_id,))
+                    cur.execute("DELETE FROM conversation_catalog WHERE thread_id = %s", (thread_id,))
+                    cur.execute("DELETE FROM conversation_messages WHERE thread_id = %s", (thread_id,))
+                if self._cache is not None:
+                    self._cache.invalidate(thread_id)
+                print(f"🗑️ Cleared conversation: {thread_id}")
             except Exception as e:
                 print(f"❌ Error clearing conversation: {e}")
         else:
@@ -106,100 +619,213 @@ class MemoryManager:
             print(f"❌ Error getting conversation history: {e}")
             return []
     
-    def get_user_conversations(self, user_id: str):
+    @staticmethod
+    def _turn_rows(thread_id: str, messages: list, first: int, received_at: datetime) -> list:
+        """History rows for messages[first:], each at its position in the thread's state."""
+        now = datetime.now(timezone.utc)
+        return [
+            (thread_id, seq, "human" if m.type == "human" else "ai", message_text(m.content),
+             (received_at or now) if m.type == "human" else now)
+            for seq, m in enumerate(messages[first:], first + 1)
+        ]
+    
+    @staticmethod
+    def _turn_first(thread_id: str, messages: list, added: int, previous: int) -> int:
+        """
+        Index of the first message to write for a turn.
+        
+        The turn's own messages, unless earlier turns of the thread are missing
+        from the history (previous count short of where the turn starts), in
+        which case every message is rewritten from the state.
+        """
+        start = len(messages) - added
+        if previous < start:
+            print(f"🔧 Rebuilding the history of {thread_id}: {previous} of {start} earlier messages recorded")
+            return 0
+        return start
+    
+    def record_turn(self, thread_id: str, user_id: str, conversation_id: str, messages: list,
+                    added: int, received_at: datetime = None):
         """
-        Get all conversations for a specific user.
+        Update the conversation catalog and message history after a turn has been checkpointed.
+        
+        Also called for turns that failed or were cancelled: whatever the turn
+        checkpointed (at least the user's message) is recorded, so the history
+        stays in step with the state.
         
         Args:
-            user_id: Identifier for the user
+            thread_id: The thread identifier
+            user_id: Identifier for the user owning the thread
+            conversation_id: Identifier for the conversation
+            messages: The thread's messages as checkpointed by the turn (see TurnMessages)
+            added: How many of them the turn added
+            received_at: When the user's message arrived (defaults to now)
+        
+        Raises:
+            psycopg.Error: The history could not be written
+        """
+        self.record_turns([(thread_id, user_id, conversation_id, messages, added, received_at)])
+    
+    def record_turns(self, turns: list):
+        """
+        Record several checkpointed turns in a single transaction.
+        
+        Used by batch runs to group catalog writes. Connection errors are
+        retried a few times before they are raised.
+        
+        Args:
+            turns: (thread_id, user_id, conversation_id, messages, added, received_at)
+                tuples, see record_turn()
+        """
+        turns = [turn for turn in turns if turn[4] > 0]
+        if self.pool is None or not turns:
+            return
+        for attempt in range(1, RECORD_TURN_ATTEMPTS + 1):
+            try:
+                with self.pool.connection() as conn, conn.transaction():
+                    for thread_id, user_id, conversation_id, messages, added, received_at in turns:
+                        row = conn.execute(LOCK_TURN_SQL, (thread_id,)).fetchone()
+                        conn.execute(RECORD_TURN_SQL, (
+                            thread_id, user_id, conversation_id, _first_message(messages), len(messages)
+                        ))
+                        first = self._turn_first(thread_id, messages, added, row[0] if row else 0)
+                        conn.cursor().executemany(
+                            INSERT_MESSAGE_SQL, self._turn_rows(thread_id, messages, first, received_at)
+                        )
+                return
+            except psycopg.OperationalError as e:
+                if attempt == RECORD_TURN_ATTEMPTS:
+                    raise
+                print(f"⚠️ Retrying conversation catalog update ({attempt}/{RECORD_TURN_ATTEMPTS}): {e}")
+                time.sleep(0.1 * 2 ** attempt)
+    
+    async def arecord_turn(self, thread_id: str, user_id: str, conversation_id: str, messages: list,
+                           added: int, received_at: datetime = None):
+        """Async variant of record_turn() using the async connection pool."""
+        if self._async_pool is None or added <= 0:
+            return
+        for attempt in range(1, RECORD_TURN_ATTEMPTS + 1):
+            try:
+                async with self._async_pool.connection() as conn, conn.transaction():
+                    row = await (await conn.execute(LOCK_TURN_SQL, (thread_id,))).fetchone()
+                    await conn.execute(RECORD_TURN_SQL, (
+                        thread_id, user_id, conversation_id, _first_message(messages), len(messages)
+                    ))
+                    first = self._turn_first(thread_id, messages, added, row[0] if row else 0)
+                    await conn.cursor().executemany(
+                        INSERT_MESSAGE_SQL, self._turn_rows(thread_id, messages, first, received_at)
+                    )
+                return
+            except psycopg.OperationalError as e:
+                if attempt == RECORD_TURN_ATTEMPTS:
+                    raise
+                print(f"⚠️ Retrying conversation catalog update ({attempt}/{RECORD_TURN_ATTEMPTS}): {e}")
+                await asyncio.sleep(0.1 * 2 ** attempt)
+    
+    def get_history_page(self, thread_id: str, limit: int = 0, before_seq: int = 0, after_seq: int = 0):
+        """
+        Get a page of a thread's messages, newest first.
+        
+        Args:
+            thread_id: The thread identifier
+            limit: Maximum number of messages to return (0 = all)
+            before_seq: Only return messages with a lower seq (0 = no upper bound)
+            after_seq: Only return messages with a higher seq (0 = no lower bound)
             
         Returns:
-            List of conversation summaries with thread_id and first_message
+            Tuple of (list of messages with seq, role, content and timestamp,
+            whether older messages remain within the bounds), or None when
+            the history table is not available and callers must read the graph state
         """
-        try:
-            if isinstance(self._checkpointer, PostgresSaver):
-                with self._checkpointer.conn.cursor() as cur:
-                    # Query to get all conversations for a user
-                    query = """
-                    SELECT 
-                        thread_id,
-                        MIN(created_at) as created_at,
-                        MAX(created_at) as last_activity,
-                        COUNT(*) as message_count
-                    FROM checkpoints 
-                    WHERE thread_id LIKE %s 
-                    GROUP BY thread_id
-                    ORDER BY MAX(created_at) DESC
-                    """
-                    cur.execute(query, (f"{user_id}_%",))
-                    conversations = []
-                    
-                    for row in cur.fetchall():
-                        thread_id, created_at, last_activity, message_count = row
-                        conversation_id = thread_id.replace(f"{user_id}_", "", 1)
-                        
-                        # Get the first message from this conversation
-                        first_message = self._get_first_message(thread_id)
-                        
-                        conversations.append({
-                            'thread_id': thread_id,
-                            'conversation_id': conversation_id,
-                            'first_message': first_message,
-                            'created_at': int(created_at.timestamp()) if created_at else 0,
-                            'last_activity': int(last_activity.timestamp()) if last_activity else 0,
-                            'message_count': message_count
-                        })
-                    
-                    return conversations
-            else:
-                print("⚠️ Getting user conversations not supported for current checkpointer type")
-                return []
-                
-        except Exception as e:
-            print(f"❌ Error getting user conversations: {e}")
-            return []
+        if self.pool is None:
+            return None
+        
+        # Walks the (thread_id, seq) primary key backwards from the cursor
+        query = "SELECT seq, role, content, created_at FROM conversation_messages WHERE thread_id = %s"
+        params = [thread_id]
+        if before_seq > 0:
+            query += " AND seq < %s"
+            params.append(before_seq)
+        if after_seq > 0:
+            query += " AND seq > %s"
+            params.append(after_seq)
+        query += " ORDER BY seq DESC"
+        if limit > 0:
+            # Fetch one extra row to learn whether another page exists
+            query += " LIMIT %s"
+            params.append(limit + 1)
+        
+        with self.pool.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        
+        has_more = limit > 0 and len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+        messages = [
+            {'seq': seq, 'role': role, 'content': content, 'timestamp': int(created_at.timestamp())}
+            for seq, role, content, created_at in rows
+        ]
+        return messages, has_more
     
-    def _get_first_message(self, thread_id: str):
+    def get_user_conversations(self, user_id: str, limit: int = 0, cursor: str = ""):
         """
-        Get the first human message from a conversation.
+        Get conversations for a specific user, most recently active first.
         
         Args:
-            thread_id: The thread identifier
+            user_id: Identifier for the user
+            limit: Maximum number of conversations to return (0 = all)
+            cursor: next_cursor from a previous page, or "" for the first page
             
         Returns:
-            The content of the first human message, or empty string if not found
+            Tuple of (list of conversation summaries with thread_id and
+            first_message, cursor for the next page or "" if this is the last one)
         """
         try:
-            if isinstance(self._checkpointer, PostgresSaver):
-                with self._checkpointer.conn.cursor() as cur:
-                    # Get the checkpoint with the earliest created_at for this thread
-                    query = """
-                    SELECT checkpoint 
-                    FROM checkpoints 
-                    WHERE thread_id = %s 
-                    ORDER BY created_at ASC 
-                    LIMIT 1
-                    """
-                    cur.execute(query, (thread_id,))
-                    result = cur.fetchone()
-                    
-                    if result and result[0]:
-                        checkpoint_data = result[0]
-                        # Extract messages from checkpoint data
-                        if 'channel_values' in checkpoint_data and 'messages' in checkpoint_data['channel_values']:
-                            messages = checkpoint_data['channel_values']['messages']
-                            for message in messages:
-                                if hasattr(message, 'type') and message.type == 'human':
-                                    return message.content[:100] + ('...' if len(message.content) > 100 else '')
-                                elif isinstance(message, dict) and message.get('type') == 'human':
-                                    content = message.get('content', '')
-                                    return content[:100] + ('...' if len(content) > 100 else '')
-            
-            return "No messages found"
-            
+            if self.pool is not None:
+                # Served entirely from the (user_id, last_activity) index
+                query = """
+                SELECT thread_id, conversation_id, first_message, created_at, last_activity, message_count
+                FROM conversation_catalog
+                WHERE user_id = %s
+                """
+                params = [user_id]
+                if cursor:
+                    query += " AND (last_activity, thread_id) < (%s, %s)"
+                    params.extend(decode_cursor(cursor))
+                query += " ORDER BY last_activity DESC, thread_id DESC"
+                if limit > 0:
+                    # Fetch one extra row to learn whether another page exists
+                    query += " LIMIT %s"
+                    params.append(limit + 1)
+                
+                with self.pool.connection() as conn, conn.cursor() as cur:
+                    cur.execute(query, params)
+                    rows = cur.fetchall()
+                
+                next_cursor = ""
+                if limit > 0 and len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = encode_cursor(rows[-1][4], rows[-1][0])
+                
+                conversations = []
+                for thread_id, conversation_id, first_message, created_at, last_activity, message_count in rows:
+                    conversations.append({
+                        'thread_id': thread_id,
+                        'conversation_id': conversation_id,
+                        'first_message': first_message,
+                        'created_at': int(created_at.timestamp()),
+                        'last_activity': int(last_activity.timestamp()),
+                        'message_count': message_count
+                    })
+                
+                return conversations, next_cursor
+            else:
+                print("⚠️ Getting user conversations not supported for current checkpointer type")
+                return [], ""
+                
         except Exception as e:
-            print(f"❌ Error getting first message: {e}")
-            return "Error retrieving message"
+            print(f"❌ Error getting user conversations: {e}")
+            return [], ""
 
 # Create a global instance
 memory_manager = MemoryManager()
\ No newline at end of file
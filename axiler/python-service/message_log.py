@@ -0,0 +1,416 @@
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+import psycopg
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+
+from context_window import message_text
+
+# Stored in place of the messages channel of a checkpoint: the thread's
+# messages are rows 1..n of conversation_messages
+LOG_REF_KEY = "chatbot_message_log"
+
+# Rows written by record_turn (or before the message log was enabled) have no
+# data; logging a thread fills them in and keeps their created_at. Logged rows
+# are never overwritten: a row logged with another message is left as it is
+# and not returned
+UPSERT_LOGGED_MESSAGE_SQL = """
+INSERT INTO conversation_messages (thread_id, seq, role, content, message_id, data_type, data, created_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (thread_id, seq) DO UPDATE SET
+    role = EXCLUDED.role,
+    content = EXCLUDED.content,
+    message_id = EXCLUDED.message_id,
+    data_type = EXCLUDED.data_type,
+    data = EXCLUDED.data
+WHERE conversation_messages.data IS NULL OR conversation_messages.message_id = EXCLUDED.message_id
+RETURNING seq
+"""
+
+LOGGED_IDS_SQL = """
+SELECT seq, message_id FROM conversation_messages
+WHERE thread_id = %s AND data IS NOT NULL
+ORDER BY seq
+"""
+
+LOAD_MESSAGES_SQL = """
+SELECT data_type, data FROM conversation_messages
+WHERE thread_id = %s AND seq <= %s
+ORDER BY seq
+"""
+
+def _log_ref(checkpoint) -> Optional[int]:
+    """Number of logged messages a stored checkpoint refers to, or None if it holds its messages."""
+    value = checkpoint["channel_values"].get("messages")
+    if isinstance(value, dict) and LOG_REF_KEY in value:
+        return value[LOG_REF_KEY]
+    return None
+
+def _is_root(config) -> bool:
+    return config["configurable"].get("checkpoint_ns", "") == ""
+
+def _returned(cursor) -> int:
+    """Rows returned by every statement of an executemany(returning=True)."""
+    count = len(cursor.fetchall())
+    while cursor.nextset():
+        count += len(cursor.fetchall())
+    return count
+
+async def _areturned(cursor) -> int:
+    count = len(await cursor.fetchall())
+    while cursor.nextset():
+        count += len(await cursor.fetchall())
+    return count
+
+def _connection(pool):
+    """A connection from pool, or pool itself when it is a connection (see MessageLogSaver)."""
+    if isinstance(pool, (psycopg.Connection, psycopg.AsyncConnection)):
+        return nullcontext(pool)
+    return pool.connection()
+
+class MessageLog:
+    """
+    Append-only log of every thread's messages, in conversation_messages.
+
+    Keeps the length and last message id of recently logged threads, so a
+    turn normally appends its new messages without reading the log first.
+    The log is checked against the database whenever a thread's messages do
+    not continue what was logged last (another process wrote the thread, the
+    process restarted, the thread was cleared, or a queued append was dropped).
+    Logged messages are never overwritten: messages that diverge from the log
+    (e.g. a list rewritten by RemoveMessage, or a replayed fork) are not logged,
+    and their checkpoint is stored whole.
+    """
+
+    def __init__(self, max_threads: int = 10000):
+        self.max_threads = max_threads
+        self._tails = OrderedDict()  # thread_id -> (messages logged, id of the last one)
+        self._lock = threading.Lock()
+
+    def _known_start(self, thread_id: str, messages: list) -> Optional[int]:
+        """Messages already logged, if the remembered tail is a prefix of messages."""
+        with self._lock:
+            tail = self._tails.get(thread_id)
+        if tail is None:
+            return None
+        count, last_id = tail
+        if count <= len(messages) and (count == 0 or messages[count - 1].id == last_id):
+            return count
+        return None
+
+    def _remember(self, thread_id: str, messages: list):
+        with self._lock:
+            self._tails[thread_id] = (len(messages), messages[-1].id)
+            self._tails.move_to_end(thread_id)
+            while len(self._tails) > self.max_threads:
+                self._tails.popitem(last=False)
+
+    def forget(self, thread_id: str):
+        """Check the thread's log against the database on its next append."""
+        with self._lock:
+            self._tails.pop(thread_id, None)
+
+    @staticmethod
+    def _loggable(messages: list) -> bool:
+        return bool(messages) and all(message.id is not None for message in messages)
+
+    @staticmethod
+    def _logged_prefix(rows: List[Tuple[int, str]], messages: list) -> int:
+        """Leading messages the logged (seq, message_id) rows already hold."""
+        count = 0
+        for seq, message_id in rows:
+            if seq != count + 1 or count >= len(messages) or messages[count].id != message_id:
+                break
+            count += 1
+        return count
+
+    @classmethod
+    def _append_start(cls, rows: List[Tuple[int, str]], messages: list) -> Optional[int]:
+        """Leading messages already logged, or None if logging the rest would overwrite logged rows."""
+        count = cls._logged_prefix(rows, messages)
+        if count < len(messages) and rows and rows[-1][0] > count:
+            return None
+        return count
+
+    @staticmethod
+    def _rows(thread_id: str, messages: list, start: int, serde, received_at: Optional[datetime]) -> list:
+        now = datetime.now(timezone.utc)
+        rows = []
+        for seq, message in enumerate(messages[start:], start + 1):
+            data_type, data = serde.dumps_typed(message)
+            human = message.type == "human"
+            rows.append((thread_id, seq, "human" if human else "ai", message_text(message.content),
+                         message.id, data_type, data, (received_at or now) if human else now))
+        return rows
+
+    @staticmethod
+    def _loaded(thread_id: str, count: int, rows: list, serde) -> list:
+        if len(rows) != count or any(data is None for _, data in rows):
+            raise RuntimeError(f"Message log of thread {thread_id} is missing messages 1-{count}")
+        return [serde.loads_typed((data_type, bytes(data))) for data_type, data in rows]
+
+    def append(self, conn, thread_id: str, messages: list, serde, received_at: Optional[datetime] = None) -> bool:
+        """
+        Log the messages of a thread that are not logged yet.
+
+        Args:
+            conn: Sync connection to write with
+            thread_id: Thread the messages belong to
+            messages: The thread's complete message list
+            serde: Serializer of the message data
+            received_at: Creation time of new user messages (defaults to now)
+
+        Returns:
+            True if the log now holds exactly messages as its first rows, False
+            if they cannot be logged or diverge from the logged ones
+        """
+        if not self._loggable(messages):
+            return False
+        start = self._known_start(thread_id, messages)
+        diverged = False
+        with conn.transaction():
+            if start is None:
+                start = self._append_start(conn.execute(LOGGED_IDS_SQL, (thread_id,)).fetchall(), messages)
+                if start is None:
+                    return False
+            rows = self._rows(thread_id, messages, start, serde, received_at)
+            if rows:
+                cursor = conn.cursor()
+                cursor.executemany(UPSERT_LOGGED_MESSAGE_SQL, rows, returning=True)
+                diverged = _returned(cursor) < len(rows)
+                if diverged:
+                    raise psycopg.Rollback()
+        if diverged:
+            # The remembered tail was stale: the thread was logged elsewhere
+            self.forget(thread_id)
+            return False
+        self._remember(thread_id, messages)
+        return True
+
+    async def aappend(self, conn, thread_id: str, messages: list, serde,
+                      received_at: Optional[datetime] = None) -> bool:
+        """Async variant of append()."""
+        if not self._loggable(messages):
+            return False
+        start = self._known_start(thread_id, messages)
+        diverged = False
+        async with conn.transaction():
+            if start is None:
+                cursor = await conn.execute(LOGGED_IDS_SQL, (thread_id,))
+                start = self._append_start(await cursor.fetchall(), messages)
+                if start is None:
+                    return False
+            rows = self._rows(thread_id, messages, start, serde, received_at)
+            if rows:
+                cursor = conn.cursor()
+                await cursor.executemany(UPSERT_LOGGED_MESSAGE_SQL, rows, returning=True)
+                diverged = await _areturned(cursor) < len(rows)
+                if diverged:
+                    raise psycopg.Rollback()
+        if diverged:
+            self.forget(thread_id)
+            return False
+        self._remember(thread_id, messages)
+        return True
+
+    def enqueue(self, pool, writer, thread_id: str, messages: list, serde,
+                received_at: Optional[datetime] = None) -> bool:
+        """
+        append() through a write-behind CheckpointWriter.
+
+        The rows are queued ahead of the checkpoint that refers to them and
+        committed with it; the database is only read for a thread whose log
+        is not known to this process yet. Queued rows never overwrite logged
+        ones either.
+
+        Args:
+            pool: Sync connection pool to read the logged ids with
+            writer: CheckpointWriter of the checkpoints (see write_behind.py)
+        """
+        if not self._loggable(messages):
+            return False
+        start = self._known_start(thread_id, messages)
+        if start is None:
+            with pool.connection() as conn:
+                start = self._append_start(conn.execute(LOGGED_IDS_SQL, (thread_id,)).fetchall(), messages)
+            if start is None:
+                return False
+        rows = self._rows(thread_id, messages, start, serde, received_at)
+        if rows:
+            writer.enqueue(thread_id, "executemany", UPSERT_LOGGED_MESSAGE_SQL, rows)
+        self._remember(thread_id, messages)
+        return True
+
+    async def aenqueue(self, pool, writer, thread_id: str, messages: list, serde,
+                       received_at: Optional[datetime] = None) -> bool:
+        """Async variant of enqueue(), reading with an async pool."""
+        if not self._loggable(messages):
+            return False
+        start = self._known_start(thread_id, messages)
+        if start is None:
+            async with pool.connection() as conn:
+                cursor = await conn.execute(LOGGED_IDS_SQL, (thread_id,))
+                start = self._append_start(await cursor.fetchall(), messages)
+            if start is None:
+                return False
+        rows = self._rows(thread_id, messages, start, serde, received_at)
+        if rows:
+            await writer.aenqueue(thread_id, "executemany", UPSERT_LOGGED_MESSAGE_SQL, rows)
+        self._remember(thread_id, messages)
+        return True
+
+    def load(self, conn, thread_id: str, count: int, serde) -> list:
+        """Read the first count messages of a thread."""
+        rows = conn.execute(LOAD_MESSAGES_SQL, (thread_id, count)).fetchall()
+        return self._loaded(thread_id, count, rows, serde)
+
+    async def aload(self, conn, thread_id: str, count: int, serde) -> list:
+        """Async variant of load()."""
+        cursor = await conn.execute(LOAD_MESSAGES_SQL, (thread_id, count))
+        return self._loaded(thread_id, count, await cursor.fetchall(), serde)
+
+class MessageLogSaver(BaseCheckpointSaver):
+    """
+    Checkpointer wrapper storing the messages channel in the message log.
+
+    When a checkpoint's messages change, only the messages the log does not
+    hold yet are written to it, and the stored checkpoint keeps just their
+    count in place of the list. Reads rebuild the list from the log, so a
+    thread of n turns writes O(n) message bytes over its lifetime instead of
+    O(n²). Checkpoints whose messages cannot be logged (e.g. a message
+    without an id) are stored whole, as are checkpoints written before the
+    log was enabled, and both still load. Everything else is delegated to the
+    wrapped saver, which may be sync or async, with a matching pool.
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver, log: MessageLog, pool, write: bool = True, writer=None):
+        """
+        Args:
+            saver: Checkpointer storing the checkpoints
+            log: Message log of the process
+            pool: Connection pool (sync or async, like saver) of the log, or
+                the connection saver is bound to, to write in its transaction
+            write: Log the messages of new checkpoints; without it checkpoints
+                are stored whole, and references in stored ones are still resolved
+            writer: CheckpointWriter when saver is a WriteBehindSaver; appends
+                are then queued with the checkpoints instead of committed on put
+        """
+        self.saver = saver
+        self.log = log
+        self.pool = pool
+        self.write = write
+        self.writer = writer
+        super().__init__(serde=saver.serde)
+
+    @property
+    def serde(self):
+        return self.saver.serde
+
+    @serde.setter
+    def serde(self, serde):
+        # Wrappers of this saver (see metrics.TimedCheckpointer) replace the
+        # serializer of the saver doing the reads
+        self.saver.serde = serde
+
+    def __getattr__(self, name):
+        if name == "saver":
+            raise AttributeError(name)
+        return getattr(self.saver, name)
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def _messages_to_log(self, config, checkpoint, new_versions) -> Optional[list]:
+        if not self.write or "messages" not in new_versions or not _is_root(config):
+            return None
+        messages = checkpoint["channel_values"].get("messages")
+        return messages if isinstance(messages, list) and messages else None
+
+    @staticmethod
+    def _with_messages(checkpoint, messages):
+        # channel_values is copied because the graph keeps using the checkpoint
+        return {**checkpoint, "channel_values": {**checkpoint["channel_values"], "messages": messages}}
+
+    def _restore(self, checkpoint_tuple: Optional[CheckpointTuple]) -> Optional[CheckpointTuple]:
+        if checkpoint_tuple is None or (count := _log_ref(checkpoint_tuple.checkpoint)) is None:
+            return checkpoint_tuple
+        thread_id = checkpoint_tuple.config["configurable"]["thread_id"]
+        with _connection(self.pool) as conn:
+            messages = self.log.load(conn, thread_id, count, self.serde)
+        return checkpoint_tuple._replace(checkpoint=self._with_messages(checkpoint_tuple.checkpoint, messages))
+
+    async def _arestore(self, checkpoint_tuple: Optional[CheckpointTuple]) -> Optional[CheckpointTuple]:
+        if checkpoint_tuple is None or (count := _log_ref(checkpoint_tuple.checkpoint)) is None:
+            return checkpoint_tuple
+        thread_id = checkpoint_tuple.config["configurable"]["thread_id"]
+        async with _connection(self.pool) as conn:
+            messages = await self.log.aload(conn, thread_id, count, self.serde)
+        return checkpoint_tuple._replace(checkpoint=self._with_messages(checkpoint_tuple.checkpoint, messages))
+
+    def get_tuple(self, config):
+        return self._restore(self.saver.get_tuple(config))
+
+    def list(self, config, **kwargs):
+        for checkpoint_tuple in self.saver.list(config, **kwargs):
+            yield self._restore(checkpoint_tuple)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        messages = self._messages_to_log(config, checkpoint, new_versions)
+        if messages is not None:
+            thread_id = config["configurable"]["thread_id"]
+            received_at = config["configurable"].get("received_at")
+            if self.writer is not None:
+                logged = self.log.enqueue(self.pool, self.writer, thread_id, messages, self.serde, received_at)
+            else:
+                with _connection(self.pool) as conn:
+                    logged = self.log.append(conn, thread_id, messages, self.serde, received_at)
+            if logged:
+                checkpoint = self._with_messages(checkpoint, {LOG_REF_KEY: len(messages)})
+        return self.saver.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        return self.saver.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        return self.saver.delete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.saver.get_next_version(current, channel)
+
+    def get_delta_channel_history(self, *, config, channels):
+        return self.saver.get_delta_channel_history(config=config, channels=channels)
+
+    async def aget_tuple(self, config):
+        return await self._arestore(await self.saver.aget_tuple(config))
+
+    async def alist(self, config, **kwargs):
+        async for checkpoint_tuple in self.saver.alist(config, **kwargs):
+            yield await self._arestore(checkpoint_tuple)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        messages = self._messages_to_log(config, checkpoint, new_versions)
+        if messages is not None:
+            thread_id = config["configurable"]["thread_id"]
+            received_at = config["configurable"].get("received_at")
+            if self.writer is not None:
+                logged = await self.log.aenqueue(self.pool, self.writer, thread_id, messages,
+                                                 self.serde, received_at)
+            else:
+                async with _connection(self.pool) as conn:
+                    logged = await self.log.aappend(conn, thread_id, messages, self.serde, received_at)
+            if logged:
+                checkpoint = self._with_messages(checkpoint, {LOG_REF_KEY: len(messages)})
+        return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await self.saver.adelete_thread(thread_id)
+
+    async def aget_delta_channel_history(self, *, config, channels):
+        return await self.saver.aget_delta_channel_history(config=config, channels=channels)
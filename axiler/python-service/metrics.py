@@ -0,0 +1,485 @@
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, Optional, Sequence
+from urllib.parse import parse_qs
+
+import grpc
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from tracing import TracedSerializer, span
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers fast database calls up to long model generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """A metric family: one value per combination of label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield from self._render_value(key, value)
+
+    def _render_value(self, key: tuple, value) -> Iterable[str]:
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Counter(_Metric):
+    """Monotonically increasing total."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Value that goes up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets, plus their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts with a final +Inf bucket, sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key: tuple, value) -> Iterable[str]:
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, key)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+class Registry:
+    """
+    The metrics exposed by the service.
+
+    Besides the metric families registered here, collectors are called on
+    every scrape to export stats that other components already keep (the
+    admission controller, the connection pools, the response cache) as gauges.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect: Callable[[], Iterable[tuple]]):
+        """
+        Add a scrape-time collector.
+
+        Args:
+            collect: Callable returning (name, documentation, labels dict, value)
+                tuples; every name is exported as a gauge
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        gauges = {}
+        for collect in collectors:
+            try:
+                for name, documentation, labels, value in collect():
+                    gauge = gauges.get(name)
+                    if gauge is None:
+                        gauge = gauges[name] = Gauge(name, documentation, sorted(labels))
+                    gauge.set(value, **labels)
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {str(e)}")
+        for gauge in gauges.values():
+            lines.extend(gauge.render())
+        return "\n".join(lines) + "\n"
+
+# Create a global instance
+registry = Registry()
+
+RPC_DURATION = registry.register(Histogram(
+    "chatbot_rpc_duration_seconds", "Time to handle an RPC, until its last response was sent", ["method", "code"]))
+RPC_FIRST_RESPONSE = registry.register(Histogram(
+    "chatbot_rpc_first_response_seconds", "Time until a streaming RPC sent its first response", ["method"]))
+RPC_IN_FLIGHT = registry.register(Gauge(
+    "chatbot_rpc_in_flight", "RPCs currently being handled", ["method"]))
+LLM_DURATION = registry.register(Histogram(
+    "chatbot_llm_duration_seconds", "Duration of model calls", ["node", "model"]))
+LLM_FIRST_TOKEN = registry.register(Histogram(
+    "chatbot_llm_first_token_seconds", "Time until the model streamed its first token", ["node", "model"]))
+LLM_TOKENS = registry.register(Counter(
+    "chatbot_llm_tokens_total", "Tokens reported by the model", ["node", "type"]))
+ROUTER_DECISIONS = registry.register(Counter(
+    "chatbot_router_decisions_total", "Chat turns routed to each model, by reason", ["model", "reason"]))
+CHECKPOINT_DURATION = registry.register(Histogram(
+    "chatbot_checkpoint_duration_seconds", "Duration of checkpointer reads and writes", ["operation"]))
+CHECKPOINT_FLUSH_SIZE = registry.register(Histogram(
+    "chatbot_checkpoint_flush_size", "Checkpoint writes committed per write-behind transaction",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)))
+STARTUP_DURATION = registry.register(Gauge(
+    "chatbot_startup_seconds", "Duration of each startup step and of the whole startup", ["step"]))
+
+def observe_usage(node: str, message):
+    """Count the input and output tokens of a model reply, when the model reports them."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    LLM_TOKENS.inc(usage.get("input_tokens", 0), node=node, type="input")
+    LLM_TOKENS.inc(usage.get("output_tokens", 0), node=node, type="output")
+
+def _method_name(handler_call_details) -> str:
+    # "/chatbot.ChatbotService/StreamChat" -> "StreamChat"
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+def _status(context, error: Optional[BaseException]) -> str:
+    code = context.code() if hasattr(context, "code") else None
+    if isinstance(code, grpc.StatusCode):
+        return code.name
+    if error is not None:
+        return "UNKNOWN"
+    # The sync servicers return normally once the caller has gone away
+    if hasattr(context, "is_active") and not context.is_active():
+        remaining = context.time_remaining()
+        return "DEADLINE_EXCEEDED" if remaining is not None and remaining <= 0 else "CANCELLED"
+    return "OK"
+
+def _wrap_handler(handler, wrap_unary: Callable, wrap_stream: Callable):
+    """Rebuild an RPC method handler with instrumented behaviours."""
+    if handler.unary_unary:
+        return grpc.unary_unary_rpc_method_handler(
+            wrap_unary(handler.unary_unary), handler.request_deserializer, handler.response_serializer)
+    if handler.unary_stream:
+        return grpc.unary_stream_rpc_method_handler(
+            wrap_stream(handler.unary_stream), handler.request_deserializer, handler.response_serializer)
+    if handler.stream_unary:
+        # Client-streaming methods are timed like unary ones, until the response is sent
+        return grpc.stream_unary_rpc_method_handler(
+            wrap_unary(handler.stream_unary), handler.request_deserializer, handler.response_serializer)
+    # Bidirectional streaming methods are not instrumented
+    return handler
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Records latency, time to first response and in-flight count of every RPC."""
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+
+        def wrap_unary(behavior):
+            def unary(request, context):
+                start = time.perf_counter()
+                RPC_IN_FLIGHT.inc(method=method)
+                error = None
+                try:
+                    return behavior(request, context)
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    RPC_IN_FLIGHT.dec(method=method)
+                    RPC_DURATION.observe(time.perf_counter() - start, method=method, code=_status(context, error))
+            return unary
+
+        def wrap_stream(behavior):
+            def stream(request, context):
+                start = time.perf_counter()
+                RPC_IN_FLIGHT.inc(method=method)
+                error = None
+                first = True
+                try:
+                    for response in behavior(request, context):
+                        if first:
+                            RPC_FIRST_RESPONSE.observe(time.perf_counter() - start, method=method)
+                            first = False
+                        yield response
+                except GeneratorExit:
+                    # The client went away before the stream ended
+                    error = grpc.StatusCode.CANCELLED
+                    raise
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    RPC_IN_FLIGHT.dec(method=method)
+                    code = "CANCELLED" if error is grpc.StatusCode.CANCELLED else _status(context, error)
+                    RPC_DURATION.observe(time.perf_counter() - start, method=method, code=code)
+            return stream
+
+        return _wrap_handler(handler, wrap_unary, wrap_stream)
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """MetricsInterceptor for the grpc.aio server."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+
+        def wrap_unary(behavior):
+            async def unary(request, context):
+                start = time.perf_counter()
+                RPC_IN_FLIGHT.inc(method=method)
+                error = None
+                try:
+                    return await behavior(request, context)
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    RPC_IN_FLIGHT.dec(method=method)
+                    RPC_DURATION.observe(time.perf_counter() - start, method=method, code=_status(context, error))
+            return unary
+
+        def wrap_stream(behavior):
+            async def stream(request, context):
+                start = time.perf_counter()
+                RPC_IN_FLIGHT.inc(method=method)
+                error = None
+                first = True
+                try:
+                    async for response in behavior(request, context):
+                        if first:
+                            RPC_FIRST_RESPONSE.observe(time.perf_counter() - start, method=method)
+                            first = False
+                        yield response
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    RPC_IN_FLIGHT.dec(method=method)
+                    # grpc.aio cancels the handler when the client goes away
+                    cancelled = isinstance(error, (GeneratorExit, asyncio.CancelledError))
+                    code = "CANCELLED" if cancelled else _status(context, error)
+                    RPC_DURATION.observe(time.perf_counter() - start, method=method, code=code)
+            return stream
+
+        return _wrap_handler(handler, wrap_unary, wrap_stream)
+
+@contextmanager
+def _timed_checkpoint(operation: str):
+    with CHECKPOINT_DURATION.time(operation=operation), span(f"checkpoint.{operation}"):
+        yield
+
+class TimedCheckpointer(BaseCheckpointSaver):
+    """
+    Checkpointer wrapper recording the latency of checkpoint reads and writes.
+
+    Latencies go to the checkpoint histogram and, together with the time spent
+    (de)serializing state, to the trace of the current request. Every call is
+    delegated to the wrapped saver; methods that are not part of the
+    checkpointer interface (e.g. setup()) are reached through attribute lookup.
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver):
+        saver.serde = TracedSerializer(saver.serde)
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+
+    def __getattr__(self, name):
+        # Only called for attributes missing on the wrapper itself
+        if name == "saver":
+            raise AttributeError(name)
+        return getattr(self.saver, name)
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def get_tuple(self, config):
+        with _timed_checkpoint("get_tuple"):
+            return self.saver.get_tuple(config)
+
+    def list(self, config, **kwargs):
+        return self.saver.list(config, **kwargs)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with _timed_checkpoint("put"):
+            return self.saver.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with _timed_checkpoint("put_writes"):
+            return self.saver.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        return self.saver.delete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.saver.get_next_version(current, channel)
+
+    def get_delta_channel_history(self, *, config, channels):
+        return self.saver.get_delta_channel_history(config=config, channels=channels)
+
+    async def aget_tuple(self, config):
+        with _timed_checkpoint("get_tuple"):
+            return await self.saver.aget_tuple(config)
+
+    def alist(self, config, **kwargs):
+        return self.saver.alist(config, **kwargs)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with _timed_checkpoint("put"):
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        with _timed_checkpoint("put_writes"):
+            return await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await self.saver.adelete_thread(thread_id)
+
+    async def aget_delta_channel_history(self, *, config, channels):
+        return await self.saver.aget_delta_channel_history(config=config, channels=channels)
+
+# Extra GET endpoints served next to /metrics (see profiling.py):
+# path -> callable taking the query parameters and returning (content type, body)
+_routes = {}
+
+def add_route(path: str, handler: Callable[[dict], tuple]):
+    """
+    Serve another endpoint from the metrics HTTP server.
+
+    Args:
+        path: Request path, e.g. "/debug/traces"
+        handler: Callable taking the query parameters (name -> last value) and
+            returning (content type, body text); ValueError becomes a 400 response
+    """
+    _routes[path] = handler
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path in ("/", "/metrics"):
+            self._send(200, "text/plain; version=0.0.4; charset=utf-8", registry.render())
+            return
+        handler = _routes.get(path)
+        if handler is None:
+            self.send_error(404)
+            return
+        try:
+            content_type, body = handler({k: v[-1] for k, v in parse_qs(query).items()})
+        except ValueError as e:
+            self._send(400, "text/plain; charset=utf-8", f"{e}\n")
+            return
+        self._send(200, content_type, body)
+
+    def _send(self, status: int, content_type: str, body: str):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the service log
+        pass
+
+def start_metrics_server(port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve /metrics in Prometheus text format from a daemon thread.
+
+    Args:
+        port: Port to listen on (METRICS_PORT, default 0 = disabled)
+
+    Returns:
+        The running HTTP server, or None when disabled
+    """
+    port = port if port is not None else int(os.getenv("METRICS_PORT", "0"))
+    if port <= 0:
+        return None
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"📈 Serving Prometheus metrics on port {port} at /metrics")
+    return server
@@ -0,0 +1,436 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Iterator, Optional
+
+from cancellation import CancelToken
+from googleGenai import HEDGE_MODEL, get_hedge_model, get_model, model_registry
+
+logger = logging.getLogger(__name__)
+
+# Returned by a stream attempt that ended without any chunk
+_END = object()
+
+class _LatencyWindow:
+    """Recent latencies of one model, for hedge delays and routing."""
+
+    def __init__(self, size: int = 500):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._sorted = None
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._sorted = None
+
+    def percentile(self, percentile: float, min_samples: int = 20) -> Optional[float]:
+        """Nearest-rank percentile, or None until `min_samples` latencies were seen."""
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self._samples)
+            rank = max(1, int(len(self._sorted) * percentile / 100 + 0.5))
+            return self._sorted[min(rank, len(self._sorted)) - 1]
+
+async def _anext(stream: AsyncIterator):
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+def _input_tokens(message) -> int:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0)
+
+class _Attempt:
+    """One request to a model: its first result (a reply or first chunk) and, for streams, the stream."""
+
+    def __init__(self, role: str, model: str, future, stream=None):
+        self.role = role  # "primary" or "hedge"
+        self.model = model
+        self.future = future
+        self.stream = stream
+        self.started = time.perf_counter()
+
+class ModelExecutor:
+    """
+    Runs model calls with timeouts, retries and hedging.
+
+    Every attempt must return its first streamed chunk (or, for invoke, its
+    reply) within MODEL_TIMEOUT, otherwise it is abandoned and retried, up to
+    MODEL_MAX_RETRIES times with jittered exponential backoff. Once a chunk has
+    been returned the call is committed to that stream: tokens already sent to
+    the caller are never retried, and a stream whose next chunk takes longer
+    than MODEL_TIMEOUT raises TimeoutError instead.
+
+    With MODEL_HEDGE_PERCENTILE set, an attempt whose primary request is still
+    waiting after that percentile of the model's recent latencies sends a second
+    request to the hedge model (see googleGenai.get_hedge_model); the first to
+    answer wins and the other is abandoned. MODEL_HEDGE_MAX_RATE caps the share
+    of calls that may be hedged, since every hedge is paid for.
+    """
+
+    def __init__(self):
+        self.timeout = float(os.getenv("MODEL_TIMEOUT", "30"))
+        self.max_retries = max(0, int(os.getenv("MODEL_MAX_RETRIES", "2")))
+        # Base of the exponential backoff between attempts, in seconds
+        self.retry_backoff = float(os.getenv("MODEL_RETRY_BACKOFF", "0.5"))
+        # Percentile of primary latency after which a hedge is sent (0 = never)
+        self.hedge_percentile = float(os.getenv("MODEL_HEDGE_PERCENTILE", "0"))
+        # Never hedge sooner than this, however fast the model has been
+        self.hedge_min_delay = float(os.getenv("MODEL_HEDGE_MIN_DELAY", "0.5"))
+        self.hedge_max_rate = float(os.getenv("MODEL_HEDGE_MAX_RATE", "0.1"))
+        # Blocking model reads of the sync path; a read abandoned by a timeout
+        # keeps its worker until the model answers, so this bounds them too
+        self._executor = ThreadPoolExecutor(max_workers=int(os.getenv("MODEL_CALL_WORKERS", "64")),
+                                            thread_name_prefix="model-call")
+
+        # (kind, model) -> _LatencyWindow: streams (time to first chunk) and
+        # invokes (time to reply) are tracked separately for every model
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "attempts": 0, "retries": 0, "timeouts": 0, "errors": 0, "hedged": 0,
+                       "primary_wins": 0, "hedge_wins": 0, "extra_input_tokens": 0, "extra_output_tokens": 0}
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _window(self, kind: str, model: str) -> _LatencyWindow:
+        window = self._latencies.get((kind, model))
+        if window is None:
+            with self._lock:
+                window = self._latencies.setdefault((kind, model), _LatencyWindow())
+        return window
+
+    def recent_latency(self, model: Optional[str] = None, percentile: float = 50) -> Optional[float]:
+        """
+        Recent time to first token of a model.
+
+        Args:
+            model: Registry name (None = the default model)
+            percentile: Percentile of the recent streamed calls
+
+        Returns:
+            Seconds, or None until the model has answered enough calls
+        """
+        return self._window("stream", model or model_registry.default).percentile(percentile)
+
+    def _hedge_delay(self, kind: str, model: str) -> Optional[float]:
+        """Seconds to wait for the primary request before hedging, or None to not hedge."""
+        if self.hedge_percentile <= 0:
+            return None
+        latency = self._window(kind, model).percentile(self.hedge_percentile)
+        if latency is None:
+            return None
+        return max(self.hedge_min_delay, latency)
+
+    def _take_hedge(self) -> bool:
+        # Hedges are rationed against calls since start, so bursts of slow
+        # responses cannot multiply the load on the model
+        with self._lock:
+            if self._stats["hedged"] >= self.hedge_max_rate * self._stats["calls"]:
+                return False
+            self._stats["hedged"] += 1
+            return True
+
+    def _backoff(self, retry: int) -> float:
+        # "Full jitter": spreads the retries of callers that failed together
+        return random.uniform(0, min(8.0, self.retry_backoff * 2 ** retry))
+
+    def _attempt_failed(self, error: BaseException, retry: int) -> bool:
+        """Count a failed attempt and whether to retry it."""
+        self._count("timeouts" if isinstance(error, TimeoutError) else "errors")
+        if retry >= self.max_retries:
+            return False
+        self._count("retries")
+        logger.warning(f"⚠️ Model call failed ({type(error).__name__}: {error}), retrying")
+        return True
+
+    def _record_latency(self, kind: str, attempt: _Attempt):
+        # Every successful request is recorded, including ones that lost the
+        # race, so the percentile is not biased towards fast responses
+        def record(done):
+            if not done.cancelled() and done.exception() is None:
+                self._window(kind, attempt.model).add(time.perf_counter() - attempt.started)
+        return record
+
+    def _won(self, winner: _Attempt, hedged: bool):
+        if hedged:
+            self._count("hedge_wins" if winner.role == "hedge" else "primary_wins")
+
+    def _on_loser_reply(self, done):
+        # An abandoned request (a hedge's loser, or a timed out attempt) is still billed
+        if not done.cancelled() and done.exception() is None:
+            usage = getattr(done.result(), "usage_metadata", None) or {}
+            self._count("extra_input_tokens", usage.get("input_tokens", 0))
+            self._count("extra_output_tokens", usage.get("output_tokens", 0))
+
+    # -- sync -------------------------------------------------------------
+
+    def _wait(self, futures: list, timeout: float, cancel_token: Optional[CancelToken]) -> Optional[set]:
+        """Wait for the first of `futures` to complete; None once the cancel token fires."""
+        if cancel_token is not None:
+            remaining = cancel_token.remaining()
+            if remaining is not None:
+                timeout = min(timeout, remaining)
+            futures = futures + [cancel_token.future()]
+        done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+        if cancel_token is not None and cancel_token.cancelled:
+            return None
+        return done
+
+    def _start(self, kind: str, role: str, name: str, model, prompt) -> _Attempt:
+        if kind == "stream":
+            stream = model.stream(prompt)
+            attempt = _Attempt(role, name, self._executor.submit(next, stream, _END), stream)
+        else:
+            attempt = _Attempt(role, name, self._executor.submit(model.invoke, prompt))
+        self._count("attempts")
+        attempt.future.add_done_callback(self._record_latency(kind, attempt))
+        return attempt
+
+    def _discard(self, attempt: _Attempt):
+        # A blocked model call cannot be interrupted: the stream is closed (or
+        # the reply dropped) as soon as its first result arrives. A request
+        # still queued for a worker is never sent
+        attempt.future.cancel()
+        if attempt.stream is not None:
+            attempt.future.add_done_callback(lambda _: attempt.stream.close())
+        else:
+            attempt.future.add_done_callback(self._on_loser_reply)
+
+    def _race(self, kind: str, prompt, model: str, cancel_token: Optional[CancelToken] = None) -> Optional[tuple]:
+        """One attempt, hedged if the primary request is slow. Returns (winning attempt, hedged), or None if cancelled."""
+        primary = self._start(kind, "primary", model, get_model(model), prompt)
+        attempts = {primary.future: primary}
+        deadline = primary.started + self.timeout
+        hedge_delay = self._hedge_delay(kind, model)
+        hedged = False
+        try:
+            if hedge_delay is not None and hedge_delay < self.timeout:
+                done = self._wait([primary.future], hedge_delay, cancel_token)
+                if done is None:
+                    return None
+                if not done and self._take_hedge():
+                    hedge = self._start(kind, "hedge", HEDGE_MODEL or model, get_hedge_model(model), prompt)
+                    attempts[hedge.future] = hedge
+                    hedged = True
+            error = None
+            while attempts:
+                done = self._wait(list(attempts), max(0.0, deadline - time.perf_counter()), cancel_token)
+                if done is None:
+                    return None
+                if not done:
+                    break
+                for future in done:
+                    attempt = attempts.pop(future)
+                    if future.exception() is None:
+                        self._won(attempt, hedged)
+                        return attempt, hedged
+                    error = future.exception()
+            if error is not None and not attempts:
+                raise error
+            raise TimeoutError(f"No response from the model within {self.timeout:.0f}s")
+        finally:
+            for attempt in attempts.values():
+                self._discard(attempt)
+
+    def _call(self, kind: str, prompt, model: Optional[str], cancel_token: Optional[CancelToken] = None) -> Optional[tuple]:
+        self._count("calls")
+        model = model or model_registry.default
+        retry = 0
+        while True:
+            try:
+                return self._race(kind, prompt, model, cancel_token)
+            except Exception as e:
+                if not self._attempt_failed(e, retry):
+                    raise
+            if cancel_token is None:
+                time.sleep(self._backoff(retry))
+            elif cancel_token.sleep(self._backoff(retry)):
+                return None
+            retry += 1
+
+    def stream(self, prompt, model: Optional[str] = None, cancel_token: Optional[CancelToken] = None) -> Iterator:
+        """
+        Stream a reply, like the model's stream().
+
+        Args:
+            prompt: Model input (messages)
+            model: Registry name of the model (None = the default model)
+            cancel_token: Ends the stream as soon as it is cancelled, also
+                while waiting for a chunk or between retries
+
+        Yields:
+            Message chunks of the winning request
+        """
+        started = self._call("stream", prompt, model, cancel_token)
+        if started is None:
+            return
+        attempt, hedged = started
+        stream = attempt.stream
+        try:
+            chunk = attempt.future.result()
+            while chunk is not _END:
+                yield chunk
+                read = self._executor.submit(next, stream, _END)
+                done = self._wait([read], self.timeout, cancel_token)
+                if not done:
+                    # The pending read still runs the stream; it is closed
+                    # once the read returns
+                    read.add_done_callback(lambda _, stream=stream: stream.close())
+                    stream = None
+                    if done is None:
+                        return
+                    self._count("timeouts")
+                    raise TimeoutError(f"No chunk from the model within {self.timeout:.0f}s")
+                chunk = read.result()
+                if hedged and chunk is not _END:
+                    # The other request was sent the same prompt
+                    self._count("extra_input_tokens", _input_tokens(chunk))
+        finally:
+            if stream is not None:
+                stream.close()
+
+    def invoke(self, prompt, model: Optional[str] = None):
+        """
+        Get a complete reply, like the model's invoke().
+
+        Args:
+            prompt: Model input (messages)
+            model: Registry name of the model (None = the default model)
+
+        Returns:
+            The reply message of the winning request
+        """
+        attempt, _ = self._call("invoke", prompt, model)
+        return attempt.future.result()
+
+    # -- async ------------------------------------------------------------
+
+    def _astart(self, kind: str, role: str, name: str, model, prompt) -> _Attempt:
+        if kind == "stream":
+            stream = model.astream(prompt)
+            attempt = _Attempt(role, name, asyncio.ensure_future(_anext(stream)), stream)
+        else:
+            attempt = _Attempt(role, name, asyncio.ensure_future(model.ainvoke(prompt)))
+        self._count("attempts")
+        attempt.future.add_done_callback(self._record_latency(kind, attempt))
+        return attempt
+
+    def _adiscard(self, attempt: _Attempt, cancel: bool):
+        # A losing request is left to return its first result, as in the sync
+        # path, so its latency is still recorded; when the call itself failed or
+        # was cancelled, cancelling the pending read also ends its HTTP request
+        if cancel:
+            attempt.future.cancel()
+        if attempt.stream is not None:
+            stream = attempt.stream
+            attempt.future.add_done_callback(lambda _: asyncio.ensure_future(stream.aclose()))
+        else:
+            attempt.future.add_done_callback(self._on_loser_reply)
+
+    async def _arace(self, kind: str, prompt, model: str) -> tuple:
+        primary = self._astart(kind, "primary", model, get_model(model), prompt)
+        attempts = {primary.future: primary}
+        deadline = primary.started + self.timeout
+        hedge_delay = self._hedge_delay(kind, model)
+        hedged = False
+        winner = None
+        try:
+            if hedge_delay is not None and hedge_delay < self.timeout:
+                done, _ = await asyncio.wait([primary.future], timeout=hedge_delay)
+                if not done and self._take_hedge():
+                    hedge = self._astart(kind, "hedge", HEDGE_MODEL or model, get_hedge_model(model), prompt)
+                    attempts[hedge.future] = hedge
+                    hedged = True
+            error = None
+            while attempts:
+                done, _ = await asyncio.wait(list(attempts), timeout=max(0.0, deadline - time.perf_counter()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    attempt = attempts.pop(future)
+                    if future.exception() is None:
+                        self._won(attempt, hedged)
+                        winner = attempt
+                        return attempt, hedged
+                    error = future.exception()
+            if error is not None and not attempts:
+                raise error
+            raise TimeoutError(f"No response from the model within {self.timeout:.0f}s")
+        finally:
+            # Also runs when the caller is cancelled while waiting
+            for attempt in attempts.values():
+                self._adiscard(attempt, cancel=winner is None)
+
+    async def _acall(self, kind: str, prompt, model: Optional[str]) -> tuple:
+        self._count("calls")
+        model = model or model_registry.default
+        retry = 0
+        while True:
+            try:
+                return await self._arace(kind, prompt, model)
+            except Exception as e:
+                if not self._attempt_failed(e, retry):
+                    raise
+            await asyncio.sleep(self._backoff(retry))
+            retry += 1
+
+    async def astream(self, prompt, model: Optional[str] = None) -> AsyncIterator:
+        """Async variant of stream()."""
+        attempt, hedged = await self._acall("stream", prompt, model)
+        try:
+            chunk = attempt.future.result()
+            while chunk is not _END:
+                yield chunk
+                try:
+                    chunk = await asyncio.wait_for(_anext(attempt.stream), self.timeout)
+                except asyncio.TimeoutError:
+                    self._count("timeouts")
+                    raise TimeoutError(f"No chunk from the model within {self.timeout:.0f}s") from None
+                if hedged and chunk is not _END:
+                    self._count("extra_input_tokens", _input_tokens(chunk))
+        finally:
+            await attempt.stream.aclose()
+
+    async def ainvoke(self, prompt, model: Optional[str] = None):
+        """Async variant of invoke()."""
+        attempt, _ = await self._acall("invoke", prompt, model)
+        return attempt.future.result()
+
+    def stats(self) -> dict:
+        """Counters since start and the share of calls hedged."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = round(stats["hedged"] / stats["calls"], 3) if stats["calls"] else 0.0
+        return stats
+
+    def latency_stats(self) -> dict:
+        """
+        Recent latencies per model.
+
+        Returns:
+            Mapping of (kind, model) to the p50 and p95 of its recent calls and
+            its current hedge delay, in seconds (absent until known)
+        """
+        stats = {}
+        with self._lock:
+            windows = dict(self._latencies)
+        for (kind, model), window in windows.items():
+            values = {"p50": window.percentile(50), "p95": window.percentile(95),
+                      "hedge_delay": self._hedge_delay(kind, model)}
+            stats[(kind, model)] = {name: round(value, 3) for name, value in values.items() if value is not None}
+        return stats
+
+# Global model executor
+model_executor = ModelExecutor()
@@ -0,0 +1,128 @@
+import fnmatch
+import json
+import logging
+import os
+import random
+from typing import Tuple
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from context_window import estimate_tokens
+from googleGenai import model_registry
+from metrics import ROUTER_DECISIONS
+from model_executor import model_executor
+
+logger = logging.getLogger(__name__)
+
+# Settings a policy (or one of its "users" entries) may set
+_SETTINGS = ("model", "light_model", "max_light_tokens", "max_light_turns", "explore_rate")
+
+def _load_policy(spec: str) -> dict:
+    """Parse MODEL_ROUTER_POLICY: inline JSON, or the path of a JSON file."""
+    if not spec:
+        return {}
+    if spec.lstrip().startswith("{"):
+        policy = json.loads(spec)
+    else:
+        with open(spec) as f:
+            policy = json.load(f)
+    unknown = set(policy) - set(_SETTINGS) - {"users"}
+    for overrides in policy.get("users", {}).values():
+        unknown |= set(overrides) - set(_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown MODEL_ROUTER_POLICY settings: {', '.join(sorted(unknown))}")
+    return policy
+
+class ModelRouter:
+    """
+    Chooses the model that answers a chat turn.
+
+    Without a policy every turn goes to the default model (the first one in
+    CHAT_MODELS). With a "light_model", short prompts early in a conversation
+    go to it instead, as long as its recent time to first token is not worse
+    than the default model's. A share of the turns that could use the light
+    model is still sent to it ("explore_rate"), so its latency keeps being
+    measured while it is avoided. "model" pins every turn to one model.
+
+    Users matching a pattern in "users" (fnmatch, e.g. "acme-*" for a tenant's
+    user ids) get that entry's settings over the top-level ones; the first
+    matching pattern wins.
+    """
+
+    def __init__(self, policy: dict):
+        """
+        Args:
+            policy: Routing policy (see MODEL_ROUTER_POLICY in the README)
+        """
+        self.defaults = {
+            "model": None,
+            "light_model": None,
+            # Largest latest message, in estimated tokens, that may go to the light model
+            "max_light_tokens": 200,
+            # Deepest conversation, in user turns, that may go to the light model
+            "max_light_turns": 6,
+            "explore_rate": 0.05,
+        }
+        self.defaults.update({name: value for name, value in policy.items() if name != "users"})
+        self.users = list(policy.get("users", {}).items())
+        for settings in [self.defaults] + [overrides for _, overrides in self.users]:
+            for name in ("model", "light_model"):
+                if settings.get(name) and settings[name] not in model_registry.models:
+                    raise ValueError(f"MODEL_ROUTER_POLICY names unknown model '{settings[name]}' "
+                                     f"(known: {', '.join(model_registry.names())})")
+
+    def settings(self, user_id: str) -> dict:
+        """Routing settings for a user: the top-level policy with the first matching override."""
+        for pattern, overrides in self.users:
+            if fnmatch.fnmatchcase(user_id, pattern):
+                return {**self.defaults, **overrides}
+        return self.defaults
+
+    def _choose(self, state, settings: dict) -> Tuple[str, str]:
+        default = model_registry.default
+        if settings["model"]:
+            return settings["model"], "pinned"
+        light = settings["light_model"]
+        if not light or light == default:
+            return default, "default"
+        messages = state["messages"]
+        latest = next((m for m in reversed(messages) if isinstance(m, HumanMessage)), None)
+        if latest is not None and estimate_tokens([latest]) > settings["max_light_tokens"]:
+            return default, "long_prompt"
+        if sum(isinstance(m, HumanMessage) for m in messages) > settings["max_light_turns"]:
+            return default, "deep_conversation"
+        light_latency = model_executor.recent_latency(light)
+        default_latency = model_executor.recent_latency(default)
+        if light_latency is not None and default_latency is not None and light_latency >= default_latency:
+            if random.random() < settings["explore_rate"]:
+                return light, "explore"
+            return default, "latency"
+        return light, "short_prompt"
+
+    def route(self, state, config: RunnableConfig) -> Tuple[str, str]:
+        """
+        Choose the model for a chat turn.
+
+        Args:
+            state: Graph state, with the user's new message last
+            config: Run configuration; its user_id (or the user part of the
+                thread id) selects the user's settings
+
+        Returns:
+            The model's registry name and the reason it was chosen
+        """
+        configurable = config.get("configurable", {})
+        user_id = configurable.get("user_id") or configurable.get("thread_id", "").partition("_")[0]
+        model, reason = self._choose(state, self.settings(user_id))
+        ROUTER_DECISIONS.inc(model=model, reason=reason)
+        return model, reason
+
+def _create_router() -> ModelRouter:
+    router = ModelRouter(_load_policy(os.getenv("MODEL_ROUTER_POLICY", "")))
+    if router.defaults["light_model"] or router.defaults["model"] or router.users:
+        logger.info(f"🧭 Model routing enabled across {', '.join(model_registry.names())}")
+    return router
+
+# Global model router instance
+model_router = _create_router()
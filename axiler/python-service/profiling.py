@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from metrics import add_route
+from tracing import slow_traces
+
+logger = logging.getLogger(__name__)
+
+# Longest profiling window an admin request may ask for
+MAX_SECONDS = 300
+
+# Only one profiler or tracemalloc window runs at a time
+_busy = threading.Lock()
+
+def _seconds(params: dict, default: float = 10) -> float:
+    seconds = float(params.get("seconds", default))
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {MAX_SECONDS}")
+    return seconds
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> Counter:
+    """
+    Sample the stack of every thread for a while.
+
+    Args:
+        seconds: How long to sample
+        interval: Seconds between samples
+
+    Returns:
+        Counter of collapsed stacks ("thread;outer;...;inner") to sample counts
+    """
+    own = threading.get_ident()
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+def tracemalloc_report(seconds: float, top: int = 25, frames: int = 10) -> str:
+    """
+    Trace allocations for a while and report where memory grew.
+
+    Args:
+        seconds: How long to trace
+        top: Number of source lines to report
+        frames: Stack depth stored per allocation while tracing
+
+    Returns:
+        Plain text report: traced memory totals and the lines whose allocations
+        grew most during the window
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    lines = [f"Traced for {seconds:.0f}s: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB", "",
+             f"Top {top} lines by growth:"]
+    lines += [str(stat) for stat in after.compare_to(before, "lineno")[:top]]
+    lines += ["", f"Top {top} lines by size at the end of the window:"]
+    lines += [str(stat) for stat in after.statistics("lineno")[:top]]
+    return "\n".join(lines) + "\n"
+
+def _profile(params: dict) -> tuple:
+    seconds = _seconds(params)
+    interval = float(params.get("interval_ms", 5)) / 1000
+    if not _busy.acquire(blocking=False):
+        raise ValueError("Another profiling window is running")
+    try:
+        logger.info(f"🔬 Sampling profiler running for {seconds:.0f}s")
+        counts = sample_stacks(seconds, interval)
+    finally:
+        _busy.release()
+    # Collapsed stack format, as read by flamegraph.pl and speedscope
+    return "text/plain; charset=utf-8", "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+def _tracemalloc(params: dict) -> tuple:
+    seconds = _seconds(params)
+    top = int(params.get("top", 25))
+    if not _busy.acquire(blocking=False):
+        raise ValueError("Another profiling window is running")
+    try:
+        logger.info(f"🔬 Tracing allocations for {seconds:.0f}s")
+        return "text/plain; charset=utf-8", tracemalloc_report(seconds, top)
+    finally:
+        _busy.release()
+
+def _traces(params: dict) -> tuple:
+    return "application/json", json.dumps(slow_traces.recent(), indent=2)
+
+def enable_admin_endpoints() -> bool:
+    """
+    Add the debug endpoints to the metrics HTTP server if ADMIN_DEBUG is set.
+
+    - /debug/traces: recent slow request traces (JSON)
+    - /debug/profile?seconds=N: sample every thread's stack for N seconds
+      and return collapsed stacks
+    - /debug/tracemalloc?seconds=N: trace allocations for N seconds and
+      return the lines where memory grew
+
+    Returns:
+        True when the endpoints were added
+    """
+    if os.getenv("ADMIN_DEBUG", "false").lower() not in ("1", "true", "yes"):
+        return False
+    add_route("/debug/traces", _traces)
+    add_route("/debug/profile", _profile)
+    add_route("/debug/tracemalloc", _tracemalloc)
+    logger.info("🔬 Debug endpoints enabled: /debug/traces, /debug/profile, /debug/tracemalloc")
+    return True
@@ -0,0 +1,120 @@
+import os
+import zlib
+from typing import Callable, Dict, Optional, Tuple
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# Version of the compressed type tags written by CompactSerializer. A value
+# compressed with codec C and serialized as type T is stored with the type
+# "c1:C:T"; any other type is an uncompressed value of the wrapped serializer.
+FORMAT_VERSION = "c1"
+
+class Codec:
+    """A compression codec: a name stored in type tags and its two functions."""
+
+    def __init__(self, name: str, compress: Callable[[bytes], bytes], decompress: Callable[[bytes], bytes]):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+def _zlib(level: Optional[int]) -> Codec:
+    level = 6 if level is None else level
+    return Codec("zlib", lambda data: zlib.compress(data, level), zlib.decompress)
+
+def _zstd(level: Optional[int]) -> Codec:
+    import zstandard
+    level = 3 if level is None else level
+    return Codec("zstd", lambda data: zstandard.compress(data, level), zstandard.decompress)
+
+def _lz4(level: Optional[int]) -> Codec:
+    import lz4.frame
+    level = 0 if level is None else level
+    return Codec("lz4", lambda data: lz4.frame.compress(data, compression_level=level), lz4.frame.decompress)
+
+# zlib ships with Python; zstd needs the zstandard package and lz4 the lz4 package
+_CODECS = {"zlib": _zlib, "zstd": _zstd, "lz4": _lz4}
+
+def get_codec(name: str, level: Optional[int] = None) -> Codec:
+    """
+    Create a compression codec.
+
+    Args:
+        name: "zlib", "zstd" or "lz4"
+        level: Compression level (None = the codec's default)
+
+    Raises:
+        ValueError: The codec is unknown, or its package is not installed
+    """
+    if name not in _CODECS:
+        raise ValueError(f"Unknown compression codec '{name}' (known: {', '.join(_CODECS)})")
+    try:
+        return _CODECS[name](level)
+    except ImportError as e:
+        raise ValueError(f"Compression codec '{name}' needs a package that is not installed: {e}") from e
+
+class CompactSerializer:
+    """
+    Checkpoint serializer compressing large values.
+
+    Values are encoded by the wrapped serializer (LangGraph's default encodes
+    channel values with msgpack). Encodings of at least `threshold` bytes are
+    compressed with the codec when that makes them smaller, and stored under
+    a versioned type tag (see FORMAT_VERSION), so rows written before
+    compression was enabled, or with another codec, still load. Without a
+    codec nothing is compressed, but compressed rows can still be read.
+    """
+
+    def __init__(self, serde=None, codec: Optional[Codec] = None, threshold: int = 4096):
+        """
+        Args:
+            serde: Serializer encoding the values (default: LangGraph's JsonPlusSerializer)
+            codec: Codec new values are compressed with (None = no compression)
+            threshold: Smallest encoding, in bytes, that is compressed
+        """
+        self.serde = serde or JsonPlusSerializer()
+        self.codec = codec
+        self.threshold = threshold
+        self._decoders: Dict[str, Callable[[bytes], bytes]] = {}
+        if codec is not None:
+            self._decoders[codec.name] = codec.decompress
+
+    def __getattr__(self, name):
+        if name == "serde":
+            raise AttributeError(name)
+        return getattr(self.serde, name)
+
+    def dumps_typed(self, obj) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if self.codec is None or len(data) < self.threshold:
+            return type_, data
+        compressed = self.codec.compress(data)
+        if len(compressed) >= len(data):
+            return type_, data
+        return f"{FORMAT_VERSION}:{self.codec.name}:{type_}", compressed
+
+    def loads_typed(self, data: Tuple[str, bytes]):
+        type_, payload = data
+        if type_.startswith(FORMAT_VERSION + ":"):
+            _, codec_name, type_ = type_.split(":", 2)
+            payload = self._decoder(codec_name)(bytes(payload))
+        return self.serde.loads_typed((type_, payload))
+
+    def _decoder(self, name: str) -> Callable[[bytes], bytes]:
+        decoder = self._decoders.get(name)
+        if decoder is None:
+            decoder = self._decoders[name] = get_codec(name).decompress
+        return decoder
+
+def checkpoint_serializer() -> CompactSerializer:
+    """
+    Serializer for the PostgreSQL checkpointers, configured by CHECKPOINT_COMPRESSION.
+
+    It is used even when compression is off, so values compressed by an
+    earlier configuration keep loading.
+    """
+    name = os.getenv("CHECKPOINT_COMPRESSION", "").lower()
+    if name in ("", "none", "off", "false"):
+        return CompactSerializer()
+    level = os.getenv("CHECKPOINT_COMPRESSION_LEVEL")
+    threshold = int(os.getenv("CHECKPOINT_COMPRESSION_THRESHOLD", "4096"))
+    return CompactSerializer(codec=get_codec(name, int(level) if level else None), threshold=threshold)
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Sequence
+
+import grpc
+
+from metrics import STARTUP_DURATION
+
+logger = logging.getLogger(__name__)
+
+# RPCs answered while the service is still starting
+_ALWAYS_AVAILABLE = {"HealthCheck", "GetMetrics"}
+
+class Startup:
+    """
+    Initialization steps of the service, run in parallel and timed.
+
+    A step starts as soon as the steps it depends on have finished. The
+    service is ready once every step has succeeded; until then HealthCheck
+    reports NOT_SERVING and other RPCs are refused with UNAVAILABLE (see
+    ReadinessInterceptor).
+    """
+
+    def __init__(self):
+        self._steps = []  # (name, fn, after)
+        self.timings = {}
+        self._ready = threading.Event()
+
+    def add(self, name: str, fn: Callable[[], None], after: Sequence[str] = ()):
+        """
+        Add a step.
+
+        Args:
+            name: Step name used in logs and the chatbot_startup_seconds metric
+            fn: Function doing the work; its exceptions fail the startup
+            after: Names of the steps that must finish first
+        """
+        self._steps.append((name, fn, tuple(after)))
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def run(self) -> dict:
+        """
+        Run every step and mark the service ready.
+
+        Returns:
+            Mapping of step name to the seconds it took
+
+        Raises:
+            Exception: The first step that failed; the service stays not ready
+        """
+        start = time.perf_counter()
+        futures = {}
+
+        def timed(name: str, fn: Callable[[], None], after: tuple):
+            for dependency in after:
+                futures[dependency].result()
+            step_start = time.perf_counter()
+            fn()
+            self.timings[name] = time.perf_counter() - step_start
+            STARTUP_DURATION.set(self.timings[name], step=name)
+            logger.info(f"⏱️ Startup step '{name}' took {self.timings[name]:.2f}s")
+
+        # One thread per step, so a step waiting for its dependencies never
+        # holds up one that could run
+        with ThreadPoolExecutor(max_workers=max(1, len(self._steps)), thread_name_prefix="startup") as executor:
+            for name, fn, after in self._steps:
+                futures[name] = executor.submit(timed, name, fn, after)
+            for future in futures.values():
+                future.result()
+
+        self.timings["total"] = time.perf_counter() - start
+        STARTUP_DURATION.set(self.timings["total"], step="total")
+        self._ready.set()
+        logger.info(f"✅ Service ready after {self.timings['total']:.2f}s")
+        return self.timings
+
+def _method_name(handler_call_details) -> str:
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+def _starting_handler(handler, unary: Callable, stream: Callable):
+    """Handler with the request and response types of `handler` that refuses the call."""
+    if handler.unary_unary:
+        return grpc.unary_unary_rpc_method_handler(unary, handler.request_deserializer, handler.response_serializer)
+    if handler.unary_stream:
+        return grpc.unary_stream_rpc_method_handler(stream, handler.request_deserializer, handler.response_serializer)
+    if handler.stream_unary:
+        return grpc.stream_unary_rpc_method_handler(unary, handler.request_deserializer, handler.response_serializer)
+    return handler
+
+class ReadinessInterceptor(grpc.ServerInterceptor):
+    """Refuses RPCs with UNAVAILABLE until the startup has finished."""
+
+    def __init__(self, startup: Startup):
+        self.startup = startup
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or self.startup.ready or _method_name(handler_call_details) in _ALWAYS_AVAILABLE:
+            return handler
+
+        def refuse(request, context):
+            context.abort(grpc.StatusCode.UNAVAILABLE, "Service is starting")
+
+        return _starting_handler(handler, refuse, refuse)
+
+class AsyncReadinessInterceptor(grpc.aio.ServerInterceptor):
+    """ReadinessInterceptor for the grpc.aio server."""
+
+    def __init__(self, startup: Startup):
+        self.startup = startup
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None or self.startup.ready or _method_name(handler_call_details) in _ALWAYS_AVAILABLE:
+            return handler
+
+        async def refuse(request, context):
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "Service is starting")
+
+        async def refuse_stream(request, context):
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "Service is starting")
+            yield
+
+        return _starting_handler(handler, refuse, refuse_stream)
@@ -0,0 +1,313 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import psycopg
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_serializable_checkpoint_metadata,
+)
+
+logger = logging.getLogger(__name__)
+
+# Channel the checkpoint table triggers notify on (see MIGRATIONS in memory.py).
+# Payload: "<op>:<checkpoint_id>:<thread_id>" where op is P (checkpoint stored),
+# W (writes stored for the checkpoint) or D (checkpoint deleted)
+NOTIFY_CHANNEL = "chatbot_checkpoints"
+
+class _Entry:
+    __slots__ = ("checkpoint_id", "config", "parent_config", "data", "size")
+
+    def __init__(self, checkpoint_id: str, config: dict, parent_config: Optional[dict], data: tuple):
+        self.checkpoint_id = checkpoint_id
+        self.config = config
+        self.parent_config = parent_config
+        # Serialized (checkpoint, metadata, pending_writes)
+        self.data = data
+        self.size = len(data[1])
+
+class StateCache:
+    """
+    In-process LRU cache of the latest checkpoint of recently used threads.
+
+    Entries are kept serialized, so every read gets its own copy of the
+    state and the byte bound is exact. Checkpoints committed by any replica
+    (or deleted, or given new writes) are announced by database triggers
+    through LISTEN/NOTIFY, and the stale entries are dropped. The cache only
+    serves while it is listening: after a lost connection it starts empty.
+    """
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+        self.max_entries = max(1, int(os.getenv("STATE_CACHE_MAX_ENTRIES", "1000")))
+        self.max_bytes = max(1, int(os.getenv("STATE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+
+        self._entries = OrderedDict()  # thread_id -> _Entry, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Bumped by every write and invalidation; a state read from the database
+        # is only cached if nothing changed while it was being read
+        self._generation = 0
+        self._listening = threading.Event()
+        self._stopped = threading.Event()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+        self._thread = threading.Thread(target=self._listen, name="state-cache-listener", daemon=True)
+        self._thread.start()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, thread_id: str, checkpoint_id: Optional[str], serde) -> Optional[CheckpointTuple]:
+        """
+        Get the cached latest checkpoint of a thread.
+
+        Args:
+            thread_id: Thread to look up
+            checkpoint_id: Only return the entry if it is this checkpoint (None = latest)
+            serde: Serializer the entry was stored with
+
+        Returns:
+            A fresh CheckpointTuple, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(thread_id) if self._listening.is_set() else None
+            if entry is None or (checkpoint_id is not None and checkpoint_id != entry.checkpoint_id):
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(thread_id)
+            self._stats["hits"] += 1
+        checkpoint, metadata, pending_writes = serde.loads_typed(entry.data)
+        return CheckpointTuple(
+            config={"configurable": dict(entry.config["configurable"])},
+            checkpoint=checkpoint,
+            metadata=metadata,
+            parent_config=entry.parent_config and {"configurable": dict(entry.parent_config["configurable"])},
+            pending_writes=[tuple(write) for write in pending_writes],
+        )
+
+    def put(self, checkpoint_tuple: CheckpointTuple, serde, generation: Optional[int] = None):
+        """
+        Cache the latest checkpoint of a thread.
+
+        Args:
+            checkpoint_tuple: Checkpoint just written, or just read from the database
+            serde: Serializer used to store it
+            generation: For states read from the database, the generation
+                before the read; the state is dropped if anything changed since
+        """
+        if not self._listening.is_set():
+            return
+        configurable = checkpoint_tuple.config["configurable"]
+        data = serde.dumps_typed((checkpoint_tuple.checkpoint, checkpoint_tuple.metadata,
+                                  list(checkpoint_tuple.pending_writes or [])))
+        entry = _Entry(configurable["checkpoint_id"], checkpoint_tuple.config, checkpoint_tuple.parent_config, data)
+        thread_id = configurable["thread_id"]
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if generation is None:
+                self._generation += 1
+            self._remove(thread_id)
+            if entry.size > self.max_bytes:
+                return
+            self._entries[thread_id] = entry
+            self._bytes += entry.size
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self._stats["evictions"] += 1
+
+    def invalidate(self, thread_id: str):
+        with self._lock:
+            self._generation += 1
+            if self._remove(thread_id):
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, thread_id: str) -> bool:
+        entry = self._entries.pop(thread_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry is not None
+
+    def _on_notify(self, payload: str):
+        op, checkpoint_id, thread_id = payload.split(":", 2)
+        with self._lock:
+            self._generation += 1
+            entry = self._entries.get(thread_id)
+            if entry is None:
+                return
+            # Checkpoint ids sort by creation time: a newer checkpoint replaces
+            # the cached one, while the commit of the cached one (or an older
+            # one, e.g. from a write-behind queue) changes nothing
+            if (op == "P" and checkpoint_id > entry.checkpoint_id) or \
+                    (op in ("W", "D") and checkpoint_id == entry.checkpoint_id):
+                self._remove(thread_id)
+                self._stats["invalidations"] += 1
+
+    def _listen(self):
+        failures = 0
+        while not self._stopped.is_set():
+            try:
+                with psycopg.connect(self.database_url, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    # Notifications sent while not listening are lost
+                    self.clear()
+                    self._listening.set()
+                    failures = 0
+                    logger.info("📣 State cache listening for checkpoint changes")
+                    while not self._stopped.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            self._on_notify(notify.payload)
+            except Exception as e:
+                if self._stopped.is_set():
+                    break
+                failures += 1
+                logger.error(f"❌ State cache lost its notification connection: {str(e)}")
+            finally:
+                self._listening.clear()
+                self.clear()
+            self._stopped.wait(min(30.0, 0.5 * 2 ** min(failures, 6)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_ratio": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join(5)
+
+def _latest_lookup(config) -> Optional[tuple]:
+    """(thread_id, checkpoint_id or None) for reads the cache can serve, else None."""
+    configurable = config.get("configurable", {})
+    if configurable.get("checkpoint_ns", "") != "" or "thread_id" not in configurable:
+        return None
+    return configurable["thread_id"], configurable.get("checkpoint_id")
+
+class CachedSaver(BaseCheckpointSaver):
+    """
+    Checkpointer wrapper serving the latest checkpoint of hot threads from a StateCache.
+
+    Checkpoints written through the wrapper are cached as they are put;
+    other reads fill the cache on a miss. Everything else is delegated to the
+    wrapped saver, which may be sync or async.
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver, cache: StateCache):
+        self.saver = saver
+        self.cache = cache
+        super().__init__(serde=saver.serde)
+
+    @property
+    def serde(self):
+        return self.saver.serde
+
+    @serde.setter
+    def serde(self, serde):
+        # Wrappers of this saver (see metrics.TimedCheckpointer) replace the
+        # serializer of the saver doing the reads
+        self.saver.serde = serde
+
+    def __getattr__(self, name):
+        if name == "saver":
+            raise AttributeError(name)
+        return getattr(self.saver, name)
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def _cached(self, config):
+        lookup = _latest_lookup(config)
+        return self.cache.get(*lookup, self.serde) if lookup else None
+
+    def _fill(self, config, checkpoint_tuple, generation: int):
+        # Only the latest checkpoint is cached, i.e. reads without a checkpoint_id
+        if checkpoint_tuple is not None and (lookup := _latest_lookup(config)) and lookup[1] is None:
+            self.cache.put(checkpoint_tuple, self.serde, generation)
+
+    def _stored(self, config, next_config, checkpoint, metadata):
+        if next_config["configurable"].get("checkpoint_ns", "") != "":
+            return
+        parent_id = config["configurable"].get("checkpoint_id")
+        parent_config = {"configurable": {**next_config["configurable"], "checkpoint_id": parent_id}} \
+            if parent_id else None
+        # Stored metadata includes the config's keys, as the saver reads it back
+        metadata = get_serializable_checkpoint_metadata(config, metadata)
+        self.cache.put(CheckpointTuple(next_config, checkpoint, metadata, parent_config, []), self.serde)
+
+    def get_tuple(self, config):
+        cached = self._cached(config)
+        if cached is not None:
+            return cached
+        generation = self.cache.generation
+        checkpoint_tuple = self.saver.get_tuple(config)
+        self._fill(config, checkpoint_tuple, generation)
+        return checkpoint_tuple
+
+    def list(self, config, **kwargs):
+        return self.saver.list(config, **kwargs)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = self.saver.put(config, checkpoint, metadata, new_versions)
+        self._stored(config, next_config, checkpoint, metadata)
+        return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        # The cached tuple would miss these pending writes
+        self.cache.invalidate(config["configurable"]["thread_id"])
+        return self.saver.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        self.cache.invalidate(thread_id)
+        return self.saver.delete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.saver.get_next_version(current, channel)
+
+    def get_delta_channel_history(self, *, config, channels):
+        return self.saver.get_delta_channel_history(config=config, channels=channels)
+
+    async def aget_tuple(self, config):
+        cached = self._cached(config)
+        if cached is not None:
+            return cached
+        generation = self.cache.generation
+        checkpoint_tuple = await self.saver.aget_tuple(config)
+        self._fill(config, checkpoint_tuple, generation)
+        return checkpoint_tuple
+
+    def alist(self, config, **kwargs):
+        return self.saver.alist(config, **kwargs)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        next_config = await self.saver.aput(config, checkpoint, metadata, new_versions)
+        self._stored(config, next_config, checkpoint, metadata)
+        return next_config
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        self.cache.invalidate(config["configurable"]["thread_id"])
+        return await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        self.cache.invalidate(thread_id)
+        return await self.saver.adelete_thread(thread_id)
+
+    async def aget_delta_channel_history(self, *, config, channels):
+        return await self.saver.aget_delta_channel_history(config=config, channels=channels)
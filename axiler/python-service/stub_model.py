@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from context_window import message_text
+
+# Words the stub replies are made of
+_VOCABULARY = (
+    "the service answers questions about conversations threads memory and models with short "
+    "streamed replies so that every benchmark run sends the same tokens over the wire"
+).split()
+
+class StubChatModel(BaseChatModel):
+    """
+    Deterministic chat model for benchmarks and local development.
+
+    Replies are derived from a hash of the prompt, so the same prompt always
+    gets the same reply, and are streamed after a fixed latency at a fixed
+    token rate. Selected with CHAT_MODEL_BACKEND=stub (see googleGenai.py).
+    """
+
+    # Name of the model the stub stands in for, kept apart in cache keys
+    model: str = "stub"
+    # Seconds before the first token
+    latency: float = 0.2
+    # Tokens streamed per second after the first one (0 = all at once)
+    tokens_per_second: float = 50.0
+    # Tokens per reply
+    reply_tokens: int = 40
+    # Share of requests whose first token takes tail_latency instead, to
+    # exercise timeouts and hedging (see model_executor.py)
+    tail_rate: float = 0.0
+    tail_latency: float = 2.0
+    # Share of requests failing before the first token
+    error_rate: float = 0.0
+
+    @classmethod
+    def from_env(cls, name: str = "") -> "StubChatModel":
+        """
+        Build a stub configured by the STUB_MODEL_* environment variables.
+
+        Args:
+            name: Registry name of the model the stub stands in for; its
+                latency can be set apart with STUB_MODEL_LATENCY_<NAME>
+        """
+        latency = os.getenv(f"STUB_MODEL_LATENCY_{name.upper()}") if name else None
+        return cls(
+            model=f"stub-{name}" if name else "stub",
+            latency=float(latency or os.getenv("STUB_MODEL_LATENCY", "0.2")),
+            tokens_per_second=float(os.getenv("STUB_MODEL_TOKENS_PER_SECOND", "50")),
+            reply_tokens=int(os.getenv("STUB_MODEL_REPLY_TOKENS", "40")),
+            tail_rate=float(os.getenv("STUB_MODEL_TAIL_RATE", "0")),
+            tail_latency=float(os.getenv("STUB_MODEL_TAIL_LATENCY", "2")),
+            error_rate=float(os.getenv("STUB_MODEL_ERROR_RATE", "0")),
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "\n".join(message_text(m.content) for m in messages)
+        rng = random.Random(hashlib.sha256(prompt.encode()).digest())
+        words = [rng.choice(_VOCABULARY) for _ in range(self.reply_tokens)]
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def _usage(self, messages: List[BaseMessage], tokens: List[str]) -> dict:
+        # Whitespace-separated words stand in for model tokens
+        input_tokens = sum(len(message_text(m.content).split()) for m in messages)
+        return {"input_tokens": input_tokens, "output_tokens": len(tokens),
+                "total_tokens": input_tokens + len(tokens)}
+
+    def _delays(self, count: int) -> Iterator[float]:
+        # Tail latency and errors are random per request, unlike the reply
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("Stub model error")
+        yield self.tail_latency if self.tail_rate and random.random() < self.tail_rate else self.latency
+        for _ in range(count - 1):
+            yield 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(sum(self._delays(len(tokens))))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        for token, delay in zip(tokens, self._delays(len(tokens))):
+            time.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, tokens)))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        for token, delay in zip(tokens, self._delays(len(tokens))):
+            await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, tokens)))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(sum(self._delays(len(tokens))))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
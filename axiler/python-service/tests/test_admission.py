@@ -0,0 +1,132 @@
+import asyncio
+import threading
+
+import pytest
+
+from admission import BACKGROUND, AdmissionController, AdmissionRejected, AsyncAdmissionController
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setenv("ADMISSION_MAX_IN_FLIGHT", "1")
+    monkeypatch.setenv("ADMISSION_MAX_QUEUE", "8")
+    monkeypatch.setenv("ADMISSION_MAX_WAIT", "5")
+    for name in ("ADMISSION_USER_RATE", "ADMISSION_USER_TOKEN_RATE", "ADMISSION_USER_WEIGHTS"):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+def _admission_order(controller, turns):
+    """Queue turns (user, tokens) behind a held slot, then return the users in the order they were admitted."""
+    order = []
+
+    async def turn(user_id, tokens):
+        async with controller.slot(user_id, tokens=tokens):
+            order.append(user_id)
+
+    async def run():
+        async with controller.slot("holder"):
+            tasks = []
+            for user_id, tokens in turns:
+                tasks.append(asyncio.create_task(turn(user_id, tokens)))
+                await asyncio.sleep(0)
+            assert controller.stats()["queued"] == len(turns)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    return order
+
+def test_a_user_with_many_queued_turns_does_not_delay_others(env):
+    order = _admission_order(AsyncAdmissionController(), [("a", 1)] * 3 + [("b", 1)])
+    assert order == ["a", "b", "a", "a"]
+
+def test_large_prompts_take_a_larger_share(env):
+    order = _admission_order(AsyncAdmissionController(), [("big", 100), ("big", 100), ("small", 10), ("small", 10)])
+    assert order == ["big", "small", "small", "big"]
+
+def test_weights_scale_the_share(env):
+    env.setenv("ADMISSION_USER_WEIGHTS", "vip-*=4")
+    turns = [("user", 1), ("user", 1)] + [("vip-1", 1)] * 4
+    order = _admission_order(AsyncAdmissionController(), turns)
+    assert order == ["user", "vip-1", "vip-1", "vip-1", "vip-1", "user"]
+
+def test_turn_is_rejected_when_the_queue_is_full(env):
+    env.setenv("ADMISSION_MAX_QUEUE", "0")
+    controller = AdmissionController()
+    with controller.blocking_slot("a"):
+        with pytest.raises(AdmissionRejected, match="capacity") as rejected:
+            with controller.blocking_slot("b"):
+                pass
+        assert rejected.value.retry_after >= 1
+    with controller.blocking_slot("b"):
+        pass
+    stats = controller.stats()
+    assert (stats["admitted"], stats["rejected"], stats["in_flight"]) == (2, 1, 0)
+
+def test_turn_is_rejected_when_no_slot_frees_up_in_time(env):
+    env.setenv("ADMISSION_MAX_WAIT", "0.05")
+    controller = AdmissionController()
+    with controller.blocking_slot("a"):
+        with pytest.raises(AdmissionRejected, match="Timed out"):
+            with controller.blocking_slot("b"):
+                pass
+        assert controller.stats()["queued"] == 0
+
+def test_async_turn_is_rejected_when_no_slot_frees_up_in_time(env):
+    env.setenv("ADMISSION_MAX_WAIT", "0.05")
+    controller = AsyncAdmissionController()
+
+    async def run():
+        async with controller.slot("a"):
+            with pytest.raises(AdmissionRejected):
+                async with controller.slot("b"):
+                    pass
+        async with controller.slot("b"):
+            pass
+
+    asyncio.run(run())
+    assert controller.stats()["queued"] == 0 and controller.stats()["in_flight"] == 0
+
+def test_queued_turn_is_admitted_when_a_slot_frees_up(env):
+    controller = AdmissionController()
+    admitted = threading.Event()
+
+    def queued():
+        with controller.blocking_slot("b"):
+            admitted.set()
+
+    with controller.blocking_slot("a"):
+        waiter = threading.Thread(target=queued)
+        waiter.start()
+        assert not admitted.wait(0.1)
+        assert controller.stats()["queued"] == 1
+    assert admitted.wait(5)
+    waiter.join(5)
+
+def test_background_turns_do_not_take_interactive_slots(env):
+    env.setenv("ADMISSION_MAX_QUEUE", "0")
+    env.setenv("ADMISSION_BACKGROUND_MAX_IN_FLIGHT", "1")
+    env.setenv("ADMISSION_BACKGROUND_MAX_QUEUE", "0")
+    controller = AdmissionController()
+    with controller.blocking_slot("batch", lane=BACKGROUND):
+        with pytest.raises(AdmissionRejected):
+            with controller.blocking_slot("batch", lane=BACKGROUND):
+                pass
+        with controller.blocking_slot("user"):
+            stats = controller.stats()
+            assert (stats["in_flight"], stats["background_in_flight"]) == (1, 1)
+
+def test_interactive_turns_over_the_user_rate_are_rejected(env):
+    env.setenv("ADMISSION_MAX_IN_FLIGHT", "4")
+    env.setenv("ADMISSION_USER_RATE", "0.5")
+    env.setenv("ADMISSION_USER_BURST", "2")
+    controller = AdmissionController()
+    for _ in range(2):
+        with controller.blocking_slot("a"):
+            pass
+    with pytest.raises(AdmissionRejected, match="Rate limit") as rejected:
+        with controller.blocking_slot("a"):
+            pass
+    assert 1 <= rejected.value.retry_after <= 2
+    # Other users have their own buckets
+    with controller.blocking_slot("b"):
+        pass
+    assert controller.stats()["rate_limited"] == 1
@@ -0,0 +1,52 @@
+import threading
+import time
+
+from batch import RateLimiter
+from cancellation import CancelToken
+
+def test_burst_of_up_to_one_second_is_not_delayed():
+    limiter, token = RateLimiter(5), CancelToken()
+    started = time.monotonic()
+    assert all(limiter.acquire(token) for _ in range(5))
+    assert time.monotonic() - started < 0.1
+
+def test_acquire_waits_for_the_next_token():
+    limiter, token = RateLimiter(20), CancelToken()
+    for _ in range(20):
+        limiter.acquire(token)
+    started = time.monotonic()
+    assert limiter.acquire(token)
+    assert 0.03 <= time.monotonic() - started < 0.5
+
+def test_rate_below_one_still_allows_one_item():
+    limiter = RateLimiter(0.5)
+    assert limiter.capacity == 1
+    assert limiter.acquire(CancelToken())
+
+def test_zero_rate_disables_the_limit():
+    limiter, token = RateLimiter(0), CancelToken()
+    assert all(limiter.acquire(token) for _ in range(1000))
+    token.cancel()
+    assert not limiter.acquire(token)
+
+def test_cancel_stops_waiting():
+    limiter, token = RateLimiter(0.1), CancelToken()
+    assert limiter.acquire(token)
+    threading.Timer(0.1, token.cancel).start()
+    started = time.monotonic()
+    assert not limiter.acquire(token)
+    assert time.monotonic() - started < 2
+
+def test_limiter_is_shared_between_workers():
+    limiter, token = RateLimiter(10), CancelToken()
+    def work():
+        for _ in range(3):
+            assert limiter.acquire(token)
+    workers = [threading.Thread(target=work) for _ in range(4)]
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(5)
+    # 10 items at once, then one every 0.1s for the other 2
+    assert 0.15 <= time.monotonic() - started < 1
@@ -0,0 +1,72 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from context_window import ContextPolicy, estimate_tokens, message_text
+
+def _turns(count, size=40):
+    messages = []
+    for i in range(count):
+        messages.append(HumanMessage(content=f"q{i} " + "x" * size))
+        messages.append(AIMessage(content=f"a{i} " + "y" * size))
+    return messages
+
+def _policy(monkeypatch, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, str(value))
+    return ContextPolicy()
+
+def test_message_text_flattens_content_blocks():
+    content = [{"type": "text", "text": "hello "}, {"type": "image_url", "image_url": "x"}, "world"]
+    assert message_text(content) == "hello world"
+    assert message_text("plain") == "plain"
+    assert message_text(None) == ""
+
+def test_trim_keeps_the_newest_messages_within_budget(monkeypatch):
+    policy = _policy(monkeypatch)
+    messages = _turns(10)
+    budget = estimate_tokens(messages[-4:])
+    assert policy.trim(messages, budget) == messages[-4:]
+
+def test_trim_starts_on_a_human_message(monkeypatch):
+    policy = _policy(monkeypatch)
+    messages = _turns(10)
+    # Room for three messages: the dangling AI reply is dropped
+    kept = policy.trim(messages, estimate_tokens(messages[-3:]))
+    assert kept == messages[-2:]
+    assert isinstance(kept[0], HumanMessage)
+
+def test_trim_always_keeps_the_newest_message(monkeypatch):
+    policy = _policy(monkeypatch)
+    huge = HumanMessage(content="z" * 10000)
+    assert policy.trim(_turns(2) + [huge], 10) == [huge]
+
+def test_build_prompt_counts_the_summary_against_the_budget(monkeypatch):
+    messages = _turns(10)
+    policy = _policy(monkeypatch, CONTEXT_MAX_TOKENS=estimate_tokens(messages[-4:]))
+    prompt = policy.build_prompt({"messages": messages, "summary": "earlier talk", "summarized_count": 4})
+    assert isinstance(prompt[0], SystemMessage) and "earlier talk" in prompt[0].content
+    assert prompt[1:] == messages[-2:]
+
+def test_build_prompt_skips_summarized_messages(monkeypatch):
+    policy = _policy(monkeypatch, CONTEXT_MAX_TOKENS=100000)
+    messages = _turns(5)
+    assert policy.build_prompt({"messages": messages, "summarized_count": 6}) == messages[6:]
+
+def test_summary_cutoff_keeps_recent_messages_and_cuts_before_a_human_turn(monkeypatch):
+    policy = _policy(monkeypatch, CONTEXT_KEEP_MESSAGES=3)
+    messages = _turns(5)
+    cutoff = policy.summary_cutoff({"messages": messages})
+    # len - 3 = 7 is an AI reply, so the cut moves back to the human message at 6
+    assert cutoff == 6
+    assert isinstance(messages[cutoff], HumanMessage)
+
+def test_summary_cutoff_never_goes_below_the_summarized_count(monkeypatch):
+    policy = _policy(monkeypatch, CONTEXT_KEEP_MESSAGES=6)
+    assert policy.summary_cutoff({"messages": _turns(5), "summarized_count": 6}) == 6
+
+def test_needs_summary(monkeypatch):
+    messages = _turns(10)
+    policy = _policy(monkeypatch, CONTEXT_SUMMARIZE="true", CONTEXT_KEEP_MESSAGES=4,
+                     CONTEXT_SUMMARY_TRIGGER_TOKENS=estimate_tokens(messages[:6]))
+    assert policy.needs_summary({"messages": messages})
+    assert not policy.needs_summary({"messages": messages, "summarized_count": 14})
+    assert not _policy(monkeypatch, CONTEXT_SUMMARIZE="false").needs_summary({"messages": messages})
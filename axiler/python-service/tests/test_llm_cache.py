@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from llm_cache import ResponseCache
+
+MODEL = SimpleNamespace(model="gemini-test")
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setenv("LLM_CACHE", "true")
+    monkeypatch.setenv("LLM_CACHE_SHARED", "false")
+    monkeypatch.setenv("LLM_CACHE_MAX_MESSAGES", "3")
+    return ResponseCache()
+
+def test_key_ignores_whitespace_and_case(cache):
+    key = cache.key(MODEL, [HumanMessage(content="What is  the\tcapital of France?")])
+    assert key == cache.key(MODEL, [HumanMessage(content=" what is the capital of FRANCE? ")])
+    assert key.startswith("gemini-test:")
+
+def test_key_flattens_content_blocks(cache):
+    blocks = [{"type": "text", "text": "Hello "}, {"type": "text", "text": "there"}]
+    assert cache.key(MODEL, [HumanMessage(content=blocks)]) == cache.key(MODEL, [HumanMessage(content="hello there")])
+
+def test_key_depends_on_roles_text_and_model(cache):
+    prompt = [HumanMessage(content="hi")]
+    key = cache.key(MODEL, prompt)
+    assert key != cache.key(MODEL, [AIMessage(content="hi")])
+    assert key != cache.key(MODEL, [HumanMessage(content="hi!")])
+    assert key != cache.key(SimpleNamespace(model="other"), prompt)
+    # Message boundaries count: the same text split differently is another prompt
+    assert cache.key(MODEL, [HumanMessage(content="a b"), AIMessage(content="c")]) != \
+        cache.key(MODEL, [HumanMessage(content="a"), AIMessage(content="b c")])
+
+def test_key_is_none_when_the_prompt_is_not_cacheable(cache, monkeypatch):
+    long_prompt = [SystemMessage(content="s")] + [HumanMessage(content=str(i)) for i in range(3)]
+    assert cache.key(MODEL, long_prompt) is None
+    assert cache.key(MODEL, [HumanMessage(content="hi")], bypass=True) is None
+    assert cache.stats()["bypassed"] == 1
+
+    monkeypatch.setenv("LLM_CACHE", "false")
+    assert ResponseCache().key(MODEL, [HumanMessage(content="hi")]) is None
+
+def test_get_and_put_use_the_local_tier(cache):
+    key = cache.key(MODEL, [HumanMessage(content="hi")])
+    assert cache.get(key) is None
+    cache.put(key, "hello")
+    cache.put(cache.key(MODEL, [HumanMessage(content="empty")]), "")
+    assert cache.get(key) == "hello"
+    assert cache.get(None) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 1, 1, 1)
+
+def test_local_tier_is_bounded_and_expires(cache):
+    cache.max_entries = 2
+    keys = [cache.key(MODEL, [HumanMessage(content=str(i))]) for i in range(3)]
+    for key in keys:
+        cache.put(key, "reply")
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == "reply"
+
+    cache.ttl = -1
+    cache.put(keys[1], "stale")
+    assert cache.get(keys[1]) is None
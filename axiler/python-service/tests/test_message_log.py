@@ -0,0 +1,146 @@
+from contextlib import contextmanager, nullcontext
+
+import psycopg
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+
+from message_log import (LOAD_MESSAGES_SQL, LOG_REF_KEY, LOGGED_IDS_SQL, MessageLog, MessageLogSaver,
+                         UPSERT_LOGGED_MESSAGE_SQL)
+
+class FakeCursor:
+    def __init__(self, conn, rows=None):
+        self.conn = conn
+        self.rows = rows or []
+
+    def fetchall(self):
+        return self.rows
+
+    def nextset(self):
+        return None
+
+    def executemany(self, sql, rows, returning=False):
+        assert sql == UPSERT_LOGGED_MESSAGE_SQL
+        self.rows = []
+        for thread_id, seq, role, content, message_id, data_type, data, created_at in rows:
+            existing = self.conn.rows.get((thread_id, seq))
+            # Like the upsert, a row logged with another message is left as it is
+            if existing is None or existing["data"] is None or existing["id"] == message_id:
+                self.conn.rows[(thread_id, seq)] = {"id": message_id, "data_type": data_type, "data": data}
+                self.conn.written.append((thread_id, seq))
+                self.rows.append((seq,))
+
+class FakeConnection:
+    """The conversation_messages queries of MessageLog, kept in memory."""
+
+    def __init__(self):
+        self.rows = {}  # (thread_id, seq) -> {"id", "data_type", "data"}
+        self.written = []
+
+    @contextmanager
+    def transaction(self):
+        rows, written = dict(self.rows), list(self.written)
+        try:
+            yield
+        except psycopg.Rollback:
+            self.rows, self.written = rows, written
+
+    def connection(self):
+        # Also serves as the pool of MessageLogSaver
+        return nullcontext(self)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def execute(self, sql, params):
+        thread_id = params[0]
+        logged = sorted((seq, row) for (tid, seq), row in self.rows.items() if tid == thread_id and row["data"])
+        if sql == LOGGED_IDS_SQL:
+            return FakeCursor(self, [(seq, row["id"]) for seq, row in logged])
+        assert sql == LOAD_MESSAGES_SQL
+        return FakeCursor(self, [(row["data_type"], row["data"]) for seq, row in logged if seq <= params[1]])
+
+def _messages(*ids):
+    return [(HumanMessage if i % 2 == 0 else AIMessage)(content=f"message {i}", id=message_id)
+            for i, message_id in enumerate(ids)]
+
+def _put(saver, thread_id, messages, version):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"]["messages"] = messages
+    checkpoint["channel_versions"]["messages"] = version
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    return saver.put(config, checkpoint, {"source": "loop", "step": version}, {"messages": version})
+
+def test_append_writes_only_new_messages():
+    conn, log, serde = FakeConnection(), MessageLog(), MemorySaver().serde
+    assert log.append(conn, "t", _messages("a", "b"), serde)
+    assert log.append(conn, "t", _messages("a", "b", "c", "d"), serde)
+    assert conn.written == [("t", 1), ("t", 2), ("t", 3), ("t", 4)]
+
+def test_append_checks_the_database_for_an_unknown_thread():
+    conn, serde = FakeConnection(), MemorySaver().serde
+    MessageLog().append(conn, "t", _messages("a", "b"), serde)
+    # Another process (or a restart) does not know what was logged
+    assert MessageLog().append(conn, "t", _messages("a", "b", "c"), serde)
+    assert conn.written == [("t", 1), ("t", 2), ("t", 3)]
+
+def test_append_refuses_messages_that_diverge_from_the_log():
+    conn, serde = FakeConnection(), MemorySaver().serde
+    MessageLog().append(conn, "t", _messages("a", "b", "c"), serde)
+    before = dict(conn.rows)
+    # e.g. the list was rewritten by RemoveMessage or a fork was replayed
+    log = MessageLog()
+    assert not log.append(conn, "t", _messages("a", "x", "y", "z"), serde)
+    assert conn.rows == before
+    assert log.load(conn, "t", 3, serde) == _messages("a", "b", "c")
+
+def test_append_with_a_stale_tail_does_not_overwrite_the_log():
+    conn, serde = FakeConnection(), MemorySaver().serde
+    log = MessageLog()
+    log.append(conn, "t", _messages("a"), serde)
+    # Another process logged the thread meanwhile
+    MessageLog().append(conn, "t", _messages("a", "b"), serde)
+    assert not log.append(conn, "t", _messages("a", "x", "y"), serde)
+    assert conn.written == [("t", 1), ("t", 2)]
+    assert log.append(conn, "t", _messages("a", "b", "c"), serde)
+    assert conn.written == [("t", 1), ("t", 2), ("t", 3)]
+
+def test_append_of_a_logged_prefix_writes_nothing():
+    conn, serde = FakeConnection(), MemorySaver().serde
+    MessageLog().append(conn, "t", _messages("a", "b", "c"), serde)
+    assert MessageLog().append(conn, "t", _messages("a", "b"), serde)
+    assert len(conn.written) == 3
+
+def test_append_skips_messages_without_ids():
+    conn = FakeConnection()
+    assert not MessageLog().append(conn, "t", [HumanMessage(content="hi")], MemorySaver().serde)
+    assert conn.written == []
+
+def test_saver_stores_a_reference_and_restores_the_messages():
+    conn, memory = FakeConnection(), MemorySaver()
+    saver = MessageLogSaver(memory, MessageLog(), conn)
+    messages = _messages("a", "b")
+    config = _put(saver, "t", messages, 1)
+
+    stored = memory.get_tuple(config).checkpoint["channel_values"]["messages"]
+    assert stored == {LOG_REF_KEY: 2}
+    assert saver.get_tuple(config).checkpoint["channel_values"]["messages"] == messages
+    assert [t.checkpoint["channel_values"]["messages"] for t in saver.list(config)] == [messages]
+
+def test_saver_stores_diverging_messages_whole():
+    conn, memory = FakeConnection(), MemorySaver()
+    _put(MessageLogSaver(MemorySaver(), MessageLog(), conn), "t", _messages("a", "b"), 1)
+
+    diverged = _messages("a", "x", "y")
+    config = _put(MessageLogSaver(memory, MessageLog(), conn), "t", diverged, 2)
+    assert memory.get_tuple(config).checkpoint["channel_values"]["messages"] == diverged
+    assert MessageLog().load(conn, "t", 2, memory.serde) == _messages("a", "b")
+
+def test_saver_without_write_still_resolves_references():
+    conn, memory = FakeConnection(), MemorySaver()
+    config = _put(MessageLogSaver(memory, MessageLog(), conn), "t", _messages("a", "b"), 1)
+    reader = MessageLogSaver(memory, MessageLog(), conn, write=False)
+    assert reader.get_tuple(config).checkpoint["channel_values"]["messages"] == _messages("a", "b")
+
+    config = _put(reader, "t", _messages("a", "b", "c"), 2)
+    assert memory.get_tuple(config).checkpoint["channel_values"]["messages"] == _messages("a", "b", "c")
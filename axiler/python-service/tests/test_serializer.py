@@ -0,0 +1,72 @@
+import os
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from serializer import FORMAT_VERSION, CompactSerializer, checkpoint_serializer, get_codec
+
+def _value(size=1000):
+    return {
+        "messages": [HumanMessage(content="question " * size, id="h"), AIMessage(content="answer " * size, id="a")],
+        "summary": "",
+        "summarized_count": 0,
+    }
+
+def test_small_values_are_not_compressed():
+    serde = CompactSerializer(codec=get_codec("zlib"))
+    type_, data = serde.dumps_typed({"summary": "short"})
+    assert not type_.startswith(FORMAT_VERSION)
+    assert (type_, data) == JsonPlusSerializer().dumps_typed({"summary": "short"})
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd", "lz4"])
+def test_large_values_round_trip_compressed(codec):
+    pytest.importorskip({"zlib": "zlib", "zstd": "zstandard", "lz4": "lz4"}[codec])
+    serde = CompactSerializer(codec=get_codec(codec))
+    value = _value()
+    type_, data = serde.dumps_typed(value)
+    assert type_.startswith(f"{FORMAT_VERSION}:{codec}:")
+    assert len(data) < len(JsonPlusSerializer().dumps_typed(value)[1])
+    assert serde.loads_typed((type_, data)) == value
+
+def test_incompressible_values_are_stored_as_they_are():
+    serde = CompactSerializer(codec=get_codec("zlib"), threshold=16)
+    value = os.urandom(512)
+    type_, data = serde.dumps_typed(value)
+    assert not type_.startswith(FORMAT_VERSION)
+    assert serde.loads_typed((type_, data)) == value
+
+def test_rows_written_without_compression_still_load():
+    value = _value()
+    legacy = JsonPlusSerializer().dumps_typed(value)
+    assert CompactSerializer(codec=get_codec("zlib")).loads_typed(legacy) == value
+    assert CompactSerializer().loads_typed(legacy) == value
+
+def test_compressed_rows_load_after_compression_is_turned_off_or_changed():
+    value = _value()
+    stored = CompactSerializer(codec=get_codec("zlib")).dumps_typed(value)
+    assert CompactSerializer().loads_typed(stored) == value
+    pytest.importorskip("zstandard")
+    assert CompactSerializer(codec=get_codec("zstd")).loads_typed(stored) == value
+
+def test_memoryview_payloads_load():
+    serde = CompactSerializer(codec=get_codec("zlib"))
+    type_, data = serde.dumps_typed(_value())
+    assert serde.loads_typed((type_, memoryview(data))) == _value()
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError, match="Unknown compression codec"):
+        get_codec("brotli")
+
+def test_checkpoint_serializer_follows_the_environment(monkeypatch):
+    monkeypatch.delenv("CHECKPOINT_COMPRESSION", raising=False)
+    assert checkpoint_serializer().codec is None
+    monkeypatch.setenv("CHECKPOINT_COMPRESSION", "off")
+    assert checkpoint_serializer().codec is None
+
+    monkeypatch.setenv("CHECKPOINT_COMPRESSION", "ZLIB")
+    monkeypatch.setenv("CHECKPOINT_COMPRESSION_LEVEL", "1")
+    monkeypatch.setenv("CHECKPOINT_COMPRESSION_THRESHOLD", "64")
+    serde = checkpoint_serializer()
+    assert (serde.codec.name, serde.threshold) == ("zlib", 64)
+    assert serde.dumps_typed(_value(20))[0].startswith(f"{FORMAT_VERSION}:zlib:")
@@ -0,0 +1,151 @@
+import threading
+
+import pytest
+
+from cancellation import CancelToken
+from grpc_server import ThreadScheduler
+
+class FakeContext:
+    def add_callback(self, callback):
+        pass
+
+    def is_active(self):
+        return True
+
+class Gate:
+    """A produce function that yields once it is opened."""
+
+    def __init__(self, *responses):
+        self.responses = responses
+        self.started = threading.Event()
+        self.opened = threading.Event()
+        self.tokens = []
+
+    def __call__(self, cancel_token: CancelToken):
+        self.tokens.append(cancel_token)
+        self.started.set()
+        assert self.opened.wait(5)
+        yield from self.responses
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setenv("CHAT_BUSY_POLICY", "queue")
+    monkeypatch.delenv("CHAT_TURN_WORKERS", raising=False)
+    return ThreadScheduler(workers=4)
+
+def _read(turn):
+    return list(turn.subscribe(FakeContext()))
+
+def test_duplicates_share_the_running_turn(scheduler):
+    gate = Gate("a", "b")
+    first = scheduler.submit("t", ("key",), gate)
+    assert gate.started.wait(5)
+    second = scheduler.submit("t", ("key",), Gate("other"))
+    assert second is first
+    gate.opened.set()
+    assert _read(first) == ["a", "b"]
+    # A caller that joins late still receives the whole reply
+    assert _read(second) == ["a", "b"]
+    stats = scheduler.stats()
+    assert (stats["started"], stats["coalesced"]) == (1, 1)
+    assert len(gate.tokens) == 1
+
+def test_duplicates_of_a_queued_turn_are_coalesced(scheduler):
+    running, queued = Gate("first"), Gate("second")
+    first = scheduler.submit("t", ("one",), running)
+    second = scheduler.submit("t", ("two",), queued)
+    assert scheduler.submit("t", ("two",), Gate("third")) is second
+    assert not queued.started.is_set()
+    running.opened.set()
+    queued.opened.set()
+    assert _read(first) == ["first"]
+    assert _read(second) == ["second"]
+    assert scheduler.stats()["queued"] == 1 and scheduler.stats()["coalesced"] == 1
+
+def test_different_messages_of_a_thread_run_in_order(scheduler):
+    order = []
+    def produce(name):
+        def run(cancel_token):
+            order.append(name)
+            yield name
+        return run
+    gate = Gate("first")
+    first = scheduler.submit("t", ("one",), gate)
+    turns = [scheduler.submit("t", (name,), produce(name)) for name in ("two", "three")]
+    gate.opened.set()
+    assert [_read(turn) for turn in [first] + turns] == [["first"], ["two"], ["three"]]
+    assert order == ["two", "three"]
+    assert scheduler.stats()["busy_threads"] == 0
+
+def test_threads_do_not_wait_for_each_other(scheduler):
+    blocked = Gate("blocked")
+    scheduler.submit("t1", ("key",), blocked)
+    other = Gate("other")
+    other.opened.set()
+    assert _read(scheduler.submit("t2", ("key",), other)) == ["other"]
+    blocked.opened.set()
+
+def test_busy_thread_is_rejected_under_the_reject_policy(scheduler):
+    scheduler.policy = "reject"
+    gate = Gate("a")
+    turn = scheduler.submit("t", ("one",), gate)
+    assert scheduler.submit("t", ("two",), Gate()) is None
+    # Duplicates still join the running turn
+    assert scheduler.submit("t", ("one",), Gate()) is turn
+    gate.opened.set()
+    assert _read(turn) == ["a"]
+    assert scheduler.stats()["rejected"] == 1
+
+def test_queue_per_thread_is_bounded(scheduler):
+    scheduler.max_queued = 1
+    gate = Gate("a")
+    scheduler.submit("t", ("one",), gate)
+    queued = scheduler.submit("t", ("two",), Gate())
+    assert queued is not None
+    assert scheduler.submit("t", ("three",), Gate()) is None
+    queued.leave()
+    gate.opened.set()
+
+def test_a_cancelled_turn_is_not_joined(scheduler):
+    gate = Gate("a")
+    first = scheduler.submit("t", ("key",), gate)
+    assert gate.started.wait(5)
+    first.leave()
+    assert gate.tokens[0].cancelled
+    second = scheduler.submit("t", ("key",), Gate())
+    assert second is not first
+    second.leave()
+    gate.opened.set()
+
+def test_queued_turn_whose_callers_left_is_dropped(scheduler):
+    gate, dropped = Gate("a"), Gate("b")
+    first = scheduler.submit("t", ("one",), gate)
+    queued = scheduler.submit("t", ("two",), dropped)
+    queued.leave()
+    gate.opened.set()
+    assert _read(first) == ["a"]
+    assert queued.retired.wait(5)
+    assert not dropped.started.is_set()
+    assert scheduler.stats()["cancelled"] == 1
+
+def test_call_runs_after_the_running_turn(scheduler):
+    gate = Gate("a")
+    turn = scheduler.submit("t", ("chat",), gate)
+    result = []
+    caller = threading.Thread(target=lambda: result.append(
+        scheduler.call("t", ("batch",), lambda: "done", CancelToken())))
+    caller.start()
+    caller.join(0.2)
+    assert caller.is_alive()
+    gate.opened.set()
+    caller.join(5)
+    assert result == [(True, "done")]
+    assert _read(turn) == ["a"]
+
+def test_call_gives_up_when_cancelled(scheduler):
+    gate = Gate("a")
+    scheduler.submit("t", ("chat",), gate)
+    token = CancelToken()
+    token.cancel()
+    assert scheduler.call("t", ("batch",), lambda: "done", token) == (False, None)
+    gate.opened.set()
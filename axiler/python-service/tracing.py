@@ -0,0 +1,198 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# Trace of the request being handled by the current thread or task
+_current_trace = contextvars.ContextVar("chatbot_trace", default=None)
+
+class Trace:
+    """
+    Timed spans of one request.
+
+    Span offsets are relative to the start of the trace. Spans may be added
+    from any thread working on the request (graph steps, checkpointer calls).
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.spans = []
+        self.duration = None
+        self._start = time.perf_counter()
+
+    def add_span(self, name: str, start: float, end: float, **attrs):
+        """
+        Record a span.
+
+        Args:
+            name: What was timed, e.g. "node:chatbot" or "checkpoint.put"
+            start: time.perf_counter() when the span started
+            end: time.perf_counter() when the span ended
+        """
+        self.spans.append({
+            "name": name,
+            "offset_ms": round((start - self._start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+            **attrs,
+        })
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter(), **attrs)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def callback(self) -> "TraceCallbackHandler":
+        """Callback handler recording a span per graph step; pass it in the run config's callbacks."""
+        return TraceCallbackHandler(self)
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            **self.attrs,
+            "spans": sorted(self.spans, key=lambda s: s["offset_ms"]),
+        }
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """Records a span for every LangGraph step (node and edge function) of a run."""
+
+    # Called on the thread or task running the step, so timings are not skewed
+    # by a hop through an executor
+    run_inline = True
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self._runs = {}  # run_id -> (span name, step, start)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        # Graph steps carry their node in the metadata; the graph run itself does not
+        if metadata and "langgraph_node" in metadata:
+            name = f"node:{kwargs.get('name') or metadata['langgraph_node']}"
+            parent = self._runs.get(parent_run_id)
+            # A node's runnable runs as a child of the step with the same name
+            if parent is not None and parent[0] == name:
+                return
+            self._runs[run_id] = (name, metadata.get("langgraph_step"), time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+    def _end(self, run_id, **attrs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            name, step, start = run
+            self.trace.add_span(name, start, time.perf_counter(), step=step, **attrs)
+
+class SlowTraceLog:
+    """
+    Keeps the traces of requests slower than a threshold.
+
+    Slow traces are logged as JSON and the most recent ones are kept in memory
+    for the /debug/traces admin endpoint (see profiling.py).
+    """
+
+    def __init__(self):
+        # Requests taking at least this many seconds are captured (0 = tracing disabled)
+        self.threshold = float(os.getenv("TRACE_SLOW_SECONDS", "2"))
+        self._traces = deque(maxlen=int(os.getenv("TRACE_KEEP", "50")))
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def offer(self, trace: Trace):
+        if trace.duration is None or trace.duration < self.threshold:
+            return
+        data = trace.as_dict()
+        with self._lock:
+            self._traces.append(data)
+        logger.warning(f"🐢 Slow {trace.name} ({trace.duration:.2f}s): {json.dumps(data)}")
+
+    def recent(self) -> list:
+        """Captured traces, most recent first."""
+        with self._lock:
+            return list(reversed(self._traces))
+
+# Create a global instance
+slow_traces = SlowTraceLog()
+
+@contextmanager
+def trace_request(name: str, **attrs):
+    """
+    Trace a request handled inside the with-block.
+
+    Yields:
+        The Trace, or None when tracing is disabled
+    """
+    if not slow_traces.enabled:
+        yield None
+        return
+    trace = Trace(name, **attrs)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A generator holding the trace was closed from another context
+            pass
+        trace.finish()
+        slow_traces.offer(trace)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def span(name: str, **attrs):
+    """Record a span in the current request's trace, if there is one."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, **attrs):
+        yield
+
+class TracedSerializer:
+    """Checkpoint serializer wrapper adding a span per (de)serialized value."""
+
+    def __init__(self, serde):
+        self.serde = serde
+
+    def __getattr__(self, name):
+        if name == "serde":
+            raise AttributeError(name)
+        return getattr(self.serde, name)
+
+    def dumps_typed(self, obj):
+        with span("serde.dumps"):
+            return self.serde.dumps_typed(obj)
+
+    def loads_typed(self, data):
+        with span("serde.loads"):
+            return self.serde.loads_typed(data)
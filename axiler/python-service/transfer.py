@@ -0,0 +1,357 @@
+"""
+Bulk export and import of conversations as newline-delimited JSON.
+
+Every line is one message of a thread, in (thread_id, seq) order:
+
+    {"thread_id": "alice_main", "user_id": "alice", "conversation_id": "main",
+     "seq": 1, "role": "human", "content": "Hi", "created_at": "2026-05-01T10:00:00+00:00",
+     "message": {"type": "human", "data": {...}}}
+
+"message" is the complete LangChain message and is only present for threads
+stored in the message log (see message_log.py); other messages are imported
+from their role and content. Summaries are not exported: an imported thread
+is summarized again when it next outgrows the context window.
+"""
+import base64
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict, messages_from_dict
+from langgraph.checkpoint.base import empty_checkpoint
+
+from memory import INSERT_MESSAGE_SQL, memory_manager, preview
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip by the export's server-side cursor
+EXPORT_FETCH_SIZE = 500
+# Bytes of records per ExportConversations chunk
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Walks the (thread_id, seq) primary key from the cursor; the catalog row of
+# each thread supplies the filters
+EXPORT_SQL = """
+SELECT m.thread_id, c.user_id, c.conversation_id, m.seq, m.role, m.content, m.created_at,
+       m.data_type, m.data
+FROM conversation_messages m
+JOIN conversation_catalog c ON c.thread_id = m.thread_id
+WHERE (m.thread_id, m.seq) > (%(thread_id)s, %(seq)s)
+  AND (%(user_id)s = '' OR c.user_id = %(user_id)s)
+  AND (%(since)s::timestamptz IS NULL OR c.last_activity >= %(since)s)
+  AND (%(until)s::timestamptz IS NULL OR c.last_activity < %(until)s)
+ORDER BY m.thread_id, m.seq
+"""
+
+# Messages each thread already has, by seq
+HISTORY_LENGTH_SQL = """
+SELECT thread_id, MAX(seq) FROM conversation_messages
+WHERE thread_id = ANY(%s)
+GROUP BY thread_id
+"""
+
+# Imported threads keep the earliest creation and latest activity
+IMPORT_CATALOG_SQL = """
+INSERT INTO conversation_catalog
+    (thread_id, user_id, conversation_id, first_message, message_count, created_at, last_activity)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (thread_id) DO UPDATE SET
+    message_count = GREATEST(conversation_catalog.message_count, EXCLUDED.message_count),
+    created_at = LEAST(conversation_catalog.created_at, EXCLUDED.created_at),
+    last_activity = GREATEST(conversation_catalog.last_activity, EXCLUDED.last_activity)
+"""
+
+def encode_export_cursor(thread_id: str, seq: int) -> str:
+    """Encode the position after an exported message as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps([thread_id, seq]).encode()).decode()
+
+def decode_export_cursor(cursor: str) -> Tuple[str, int]:
+    """Decode a cursor produced by encode_export_cursor()."""
+    thread_id, seq = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return thread_id, int(seq)
+
+def record_cursor(record: dict) -> str:
+    """Cursor resuming an export after this record."""
+    return encode_export_cursor(record["thread_id"], record["seq"])
+
+def _pool():
+    pool = memory_manager.pool
+    if pool is None:
+        raise RuntimeError("Exporting and importing conversations needs PostgreSQL (DATABASE_URL)")
+    return pool
+
+def export_records(user_id: str = "", since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   cursor: str = "") -> Iterator[dict]:
+    """
+    Stream the messages of the selected threads, in (thread_id, seq) order.
+
+    Rows are read through a server-side cursor, so memory use does not depend
+    on how many threads or messages are exported. The whole export reads one
+    snapshot of the database.
+
+    Args:
+        user_id: Only export this user's threads ("" = every user)
+        since: Only threads last active at or after this time
+        until: Only threads last active before this time
+        cursor: Resume after the record this cursor was taken from (see record_cursor())
+
+    Yields:
+        One record per message (see the module docstring)
+    """
+    after_thread, after_seq = decode_export_cursor(cursor) if cursor else ("", 0)
+    serde = memory_manager.checkpointer.serde
+    params = {"thread_id": after_thread, "seq": after_seq, "user_id": user_id,
+              "since": since, "until": until}
+    with _pool().connection() as conn, conn.transaction():
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+            cur.itersize = EXPORT_FETCH_SIZE
+            cur.execute(EXPORT_SQL, params)
+            for thread_id, user, conversation_id, seq, role, content, created_at, data_type, data in cur:
+                record = {
+                    "thread_id": thread_id,
+                    "user_id": user,
+                    "conversation_id": conversation_id,
+                    "seq": seq,
+                    "role": role,
+                    "content": content,
+                    "created_at": created_at.isoformat(),
+                }
+                if data is not None:
+                    record["message"] = message_to_dict(serde.loads_typed((data_type, bytes(data))))
+                yield record
+
+def dump_record(record: dict) -> str:
+    """One line of the export format, without the newline."""
+    # default=str keeps provider metadata that is not JSON (e.g. enums) readable
+    return json.dumps(record, ensure_ascii=False, default=str)
+
+def export_chunks(records: Iterator[dict], chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[Tuple[bytes, str, int]]:
+    """
+    Group exported records into chunks of whole lines.
+
+    Yields:
+        (newline-delimited records, cursor after the last of them, record count) tuples
+    """
+    lines, size, cursor = [], 0, ""
+    for record in records:
+        line = (dump_record(record) + "\n").encode()
+        lines.append(line)
+        size += len(line)
+        cursor = record_cursor(record)
+        if size >= chunk_bytes:
+            yield b"".join(lines), cursor, len(lines)
+            lines, size = [], 0
+    if lines:
+        yield b"".join(lines), cursor, len(lines)
+
+def resume_point(path: str) -> Tuple[str, int]:
+    """
+    Where an interrupted export to a file continues.
+
+    Returns:
+        (cursor after the last complete record, length of the file up to the
+        end of that record) tuple; ("", 0) when the file holds no complete record
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        block, start = b"", size
+        # Read backwards until the block holds the whole last complete line
+        while start > 0:
+            start = max(0, start - 65536)
+            f.seek(start)
+            block = f.read(size - start)
+            end = block.rfind(b"\n")
+            if end >= 0 and (block.rfind(b"\n", 0, end) >= 0 or start == 0):
+                line = block[block.rfind(b"\n", 0, end) + 1:end]
+                return record_cursor(json.loads(line)), start + end + 1
+    return "", 0
+
+def _message(record: dict):
+    if record.get("message"):
+        return messages_from_dict([record["message"]])[0]
+    message_class = HumanMessage if record["role"] == "human" else AIMessage
+    # Ids let the message log and add_messages tell the imported messages apart
+    return message_class(content=record["content"], id=str(uuid.uuid4()))
+
+class _Thread:
+    """Consecutive records of one thread, waiting to be imported."""
+
+    def __init__(self, record: dict):
+        self.thread_id = record["thread_id"]
+        self.user_id = record["user_id"]
+        self.conversation_id = record["conversation_id"]
+        self.first_seq = record["seq"]
+        self.records = []
+
+    @property
+    def last_seq(self) -> int:
+        return self.first_seq + len(self.records) - 1
+
+class ConversationImporter:
+    """
+    Imports records in the export format.
+
+    Records are grouped by thread. Threads are written in batches, one
+    transaction each: the checkpoint holding the thread's messages, its
+    conversation catalog row and its history rows. Importing is idempotent.
+    Messages a thread already has in its history (by seq) are skipped.
+    Messages that continue an existing thread are appended to its latest
+    checkpoint, so an interrupted import can simply be run again, as can an
+    import of a resumed export. A thread whose checkpoint and history do not
+    hold the same number of messages is not imported. Threads should not be
+    chatting while they are imported.
+    """
+
+    def __init__(self):
+        # A batch is written once it has this many threads or messages
+        self.batch_threads = max(1, int(os.getenv("IMPORT_BATCH_THREADS", "100")))
+        self.batch_messages = max(1, int(os.getenv("IMPORT_BATCH_MESSAGES", "5000")))
+        self._pool = _pool()
+        self._thread = None
+        self._batch = []
+        self._batch_size = 0
+        self._partial = b""
+        self._line = 0
+        self.stats = {"threads": 0, "messages": 0, "skipped": 0, "failed": 0}
+
+    def feed(self, data: bytes):
+        """Import a chunk of newline-delimited records; a line may continue in the next chunk."""
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._add_line(line)
+
+    def add(self, record: dict):
+        """
+        Import one record.
+
+        Raises:
+            ValueError: The record misses a required field
+        """
+        try:
+            record = {
+                **record,
+                "thread_id": str(record["thread_id"]),
+                "user_id": str(record["user_id"]),
+                "conversation_id": str(record["conversation_id"]),
+                "seq": int(record["seq"]),
+                "role": record["role"],
+                "content": record.get("content", ""),
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid record: {e!r}") from e
+        thread = self._thread
+        if thread is None or thread.thread_id != record["thread_id"] or record["seq"] != thread.last_seq + 1:
+            self._end_thread()
+            thread = self._thread = _Thread(record)
+        thread.records.append(record)
+
+    def close(self) -> dict:
+        """Import what is still buffered and return the stats."""
+        if self._partial.strip():
+            self._add_line(self._partial)
+        self._partial = b""
+        self._end_thread()
+        self._write_batch()
+        return dict(self.stats)
+
+    def _add_line(self, line: bytes):
+        self._line += 1
+        if not line.strip():
+            return
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {self._line} is not JSON: {e}") from e
+        try:
+            self.add(record)
+        except ValueError as e:
+            raise ValueError(f"Line {self._line}: {e}") from e
+
+    def _end_thread(self):
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        if any(queued.thread_id == thread.thread_id for queued in self._batch):
+            # Its checkpoint must be written before the thread is read again
+            self._write_batch()
+        self._batch.append(thread)
+        self._batch_size += len(thread.records)
+        if len(self._batch) >= self.batch_threads or self._batch_size >= self.batch_messages:
+            self._write_batch()
+
+    def _write_batch(self):
+        batch, self._batch, self._batch_size = self._batch, [], 0
+        if not batch:
+            return
+        # Existing state is read through the service's checkpointer, so it
+        # also sees queued write-behind writes and resolves message log references
+        checkpointer = memory_manager.checkpointer
+        with self._pool.connection() as conn:
+            lengths = dict(conn.execute(HISTORY_LENGTH_SQL, ([thread.thread_id for thread in batch],)).fetchall())
+        updates = []
+        for thread in batch:
+            config = {"configurable": {"thread_id": thread.thread_id, "checkpoint_ns": ""}}
+            existing = checkpointer.get_tuple(config)
+            messages = list(existing.checkpoint["channel_values"].get("messages", [])) if existing else []
+            length = lengths.get(thread.thread_id, 0)
+            if length != len(messages):
+                logger.error(f"❌ Not importing thread {thread.thread_id}: its history has {length} messages, "
+                             f"its checkpoint {len(messages)}")
+                self.stats["failed"] += 1
+                continue
+            if thread.first_seq > length + 1:
+                logger.error(f"❌ Not importing thread {thread.thread_id}: it has {length} messages, "
+                             f"the records start at message {thread.first_seq}")
+                self.stats["failed"] += 1
+                continue
+            new = thread.records[length + 1 - thread.first_seq:]
+            if not new:
+                self.stats["skipped"] += 1
+                continue
+            updates.append((thread, existing, messages, new))
+
+        with self._pool.connection() as conn, conn.transaction():
+            # A saver bound to this connection writes the whole batch in one
+            # transaction, logging messages like the service's checkpointer
+            saver = memory_manager.bound_checkpointer(conn)
+            for thread, existing, messages, new in updates:
+                self._write_thread(conn, saver, thread, existing, messages, new)
+        for thread, existing, messages, new in updates:
+            self.stats["threads"] += 1
+            self.stats["messages"] += len(new)
+            memory_manager.invalidate_state(thread.thread_id)
+
+    def _write_thread(self, conn, saver, thread: _Thread, existing, messages: list, new: list):
+        # History rows first: logging the messages keeps their created_at
+        created = [datetime.fromisoformat(record["created_at"]) for record in new if record.get("created_at")]
+        first = next((record["content"] for record in thread.records if record["role"] == "human"), "")
+        now = datetime.now().astimezone()
+        conn.execute(IMPORT_CATALOG_SQL, (
+            thread.thread_id, thread.user_id, thread.conversation_id, preview(first), len(messages) + len(new),
+            min(created, default=now), max(created, default=now),
+        ))
+        conn.cursor().executemany(INSERT_MESSAGE_SQL, [
+            (thread.thread_id, record["seq"], record["role"], record["content"],
+             datetime.fromisoformat(record["created_at"]) if record.get("created_at") else now)
+            for record in new
+        ])
+
+        messages = messages + [_message(record) for record in new]
+        checkpoint = empty_checkpoint()
+        config = {"configurable": {"thread_id": thread.thread_id, "checkpoint_ns": ""}}
+        if existing is not None:
+            # Continue the thread's latest checkpoint, keeping its other channels
+            checkpoint["channel_values"] = dict(existing.checkpoint["channel_values"])
+            checkpoint["channel_versions"] = dict(existing.checkpoint["channel_versions"])
+            checkpoint["versions_seen"] = dict(existing.checkpoint["versions_seen"])
+            config = existing.config
+        version = saver.get_next_version(checkpoint["channel_versions"].get("messages"), None)
+        checkpoint["channel_values"]["messages"] = messages
+        checkpoint["channel_versions"]["messages"] = version
+        metadata = {"source": "import", "step": existing.metadata.get("step", 0) + 1 if existing else 0,
+                    "parents": {}}
+        saver.put(config, checkpoint, metadata, {"messages": version})
@@ -0,0 +1,165 @@
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from contextlib import contextmanager
+from multiprocessing.connection import wait
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _worker_main(index: int, port: int, aio: bool):
+    """Entry point of a worker process: one complete gRPC server."""
+    # Ctrl+C reaches the whole process group; workers stop when the
+    # supervisor sends them SIGTERM, so they all drain the same way
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f"%(levelname)s:worker-{index}:%(name)s:%(message)s",
+                        force=True)
+    # Each worker serves its own metrics, on consecutive ports
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    if metrics_port > 0:
+        os.environ["METRICS_PORT"] = str(metrics_port + index)
+    # One compactor is enough for the shared tables
+    if index > 0:
+        os.environ["COMPACTION_INTERVAL"] = "0"
+
+    # Imported here so the supervisor never initializes gRPC itself
+    if aio:
+        from grpc_server import serve_async
+        serve_async(port)
+    else:
+        from grpc_server import serve
+        serve(port)
+
+@contextmanager
+def _reserve_port(port: int):
+    """
+    Bind the port with SO_REUSEPORT while the workers run.
+
+    The socket never listens, so it receives no connections; it makes an
+    unusable port fail before any worker starts, and keeps other programs
+    without SO_REUSEPORT from taking the port between worker restarts.
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("--workers needs SO_REUSEPORT, which this platform does not support")
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        sock.bind(("::", port))
+        yield
+    finally:
+        sock.close()
+
+class Supervisor:
+    """
+    Runs the gRPC server in several worker processes sharing one port.
+
+    The kernel spreads incoming connections over the workers (SO_REUSEPORT).
+    Each worker is a fresh interpreter with its own connection pool, model
+    client and metrics. A worker that exits is restarted, with a growing
+    delay when it keeps failing right after starting. On SIGTERM or Ctrl+C
+    every worker is sent SIGTERM and drains its in-flight RPCs.
+    """
+
+    def __init__(self, port: int, workers: int, aio: bool = False):
+        """
+        Args:
+            port: Port every worker serves on
+            workers: Number of worker processes
+            aio: Run the grpc.aio server in the workers
+        """
+        self.port = port
+        self.workers = workers
+        self.aio = aio
+        # Seconds a worker has to finish draining before it is killed
+        self.shutdown_timeout = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "60"))
+        # A worker that exits sooner than this after starting counts as a failed start
+        self.min_uptime = float(os.getenv("WORKER_MIN_UPTIME", "10"))
+
+        # spawn rather than fork: gRPC and open connections do not survive fork
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = {}  # index -> Process
+        self._started_at = {}
+        self._failed_starts = {}
+        self._restart_at = {}  # index -> monotonic time of its pending restart
+        self._stopping = False
+        self.restarts = 0
+
+    def _start(self, index: int):
+        process = self._context.Process(
+            target=_worker_main, args=(index, self.port, self.aio), name=f"chatbot-worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info(f"👷 Started worker {index} (pid {process.pid})")
+
+    def _on_exit(self, index: int):
+        process = self._processes.pop(index)
+        process.join()
+        uptime = time.monotonic() - self._started_at[index]
+        if self._stopping:
+            logger.info(f"👷 Worker {index} (pid {process.pid}) stopped with exit code {process.exitcode}")
+            return
+        self._failed_starts[index] = self._failed_starts.get(index, 0) + 1 if uptime < self.min_uptime else 0
+        delay = min(30.0, 2 ** self._failed_starts[index] - 1)
+        logger.error(f"❌ Worker {index} (pid {process.pid}) exited with code {process.exitcode} "
+                     f"after {uptime:.1f}s, restarting in {delay:.0f}s")
+        self._restart_at[index] = time.monotonic() + delay
+
+    def _request_stop(self, signum, frame):
+        if not self._stopping:
+            logger.info("🛑 Stopping workers...")
+        self._stopping = True
+
+    def run(self):
+        """Start the workers and supervise them until SIGTERM or Ctrl+C."""
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        with _reserve_port(self.port):
+            logger.info(f"🚀 Serving on port {self.port} with {self.workers} worker processes")
+            for index in range(self.workers):
+                self._start(index)
+            while not self._stopping:
+                sentinels = {process.sentinel: index for index, process in self._processes.items()}
+                if not sentinels:
+                    # Every worker is waiting to be restarted
+                    time.sleep(0.5)
+                for sentinel in wait(list(sentinels), timeout=0.5) if sentinels else ():
+                    self._on_exit(sentinels[sentinel])
+                now = time.monotonic()
+                for index, restart_at in list(self._restart_at.items()):
+                    if restart_at <= now and not self._stopping:
+                        del self._restart_at[index]
+                        self.restarts += 1
+                        self._start(index)
+            self._stop()
+
+    def _stop(self):
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self._processes and time.monotonic() < deadline:
+            sentinels = {process.sentinel: index for index, process in self._processes.items()}
+            for sentinel in wait(list(sentinels), timeout=deadline - time.monotonic()):
+                self._on_exit(sentinels[sentinel])
+        for index, process in list(self._processes.items()):
+            logger.error(f"❌ Worker {index} (pid {process.pid}) did not stop in "
+                         f"{self.shutdown_timeout:.0f}s, killing it")
+            process.kill()
+            process.join()
+        logger.info(f"✅ All workers stopped ({self.restarts} restarts)")
+
+def serve_workers(port: int, workers: int, aio: bool = False):
+    """
+    Serve with several worker processes (see Supervisor).
+
+    Args:
+        port: Port number to serve on
+        workers: Number of worker processes
+        aio: Run the grpc.aio server in the workers
+    """
+    Supervisor(port, workers, aio).run()
@@ -0,0 +1,389 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional, Tuple
+
+import psycopg
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.postgres import PostgresSaver
+
+from metrics import CHECKPOINT_DURATION, CHECKPOINT_FLUSH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Attempts at committing a write on its own before it is dropped
+OP_ATTEMPTS = 3
+
+class _Op:
+    """
+    A queued write: a checkpoint (put), a task's writes (put_writes), or rows
+    that go with them, such as message log rows (executemany of SQL and rows).
+    """
+
+    __slots__ = ("seq", "thread_id", "method", "args", "queued_at")
+
+    def __init__(self, seq: int, thread_id: str, method: str, args: tuple):
+        self.seq = seq
+        self.thread_id = thread_id
+        self.method = method
+        self.args = args
+        self.queued_at = time.monotonic()
+
+class CheckpointWriter:
+    """
+    Background writer committing queued checkpoint writes in batches.
+
+    Writes are applied in the order they were queued, each batch in a single
+    transaction (group commit), at least every `interval` seconds. A batch
+    that fails while the database is unavailable is retried as a whole; one
+    that fails otherwise is committed write by write, and a write that keeps
+    failing is dropped and logged, so it cannot stall the writes behind it.
+    Pending writes are flushed by close(), which also runs at interpreter exit.
+    """
+
+    def __init__(self, pool, saver: PostgresSaver):
+        """
+        Args:
+            pool: Connection pool of the checkpoint tables
+            saver: Checkpointer the writes are meant for; its serializer is used
+        """
+        self.pool = pool
+        self.saver = saver
+        # Seconds a write may wait before it is committed
+        self.interval = float(os.getenv("CHECKPOINT_FLUSH_INTERVAL", "0.05"))
+        # Writes committed per transaction
+        self.batch_size = max(1, int(os.getenv("CHECKPOINT_FLUSH_BATCH", "200")))
+        # Writers block once this many writes are waiting
+        self.max_pending = max(1, int(os.getenv("CHECKPOINT_MAX_PENDING", "10000")))
+        # Called with the thread_id of dropped writes (see _commit_each())
+        self.on_drop = None
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._committed_seq = 0
+        self._last_seq = {}  # thread_id -> seq of its newest queued write
+        self._flush_requested = False
+        self._failures = 0
+        self._last_error = None
+        self._closed = False
+        self._stats = {"queued": 0, "committed": 0, "batches": 0, "failures": 0, "dropped": 0, "read_flushes": 0}
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, thread_id: str, method: str, *args, block: bool = True) -> bool:
+        """
+        Queue a put or put_writes call of the wrapped checkpointer, or an executemany.
+
+        Args:
+            block: Wait while the queue is full; otherwise return False at once
+
+        Returns:
+            True once the write is queued
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Checkpoint writer is closed")
+            while len(self._queue) >= self.max_pending:
+                # Back-pressure: the database is not keeping up
+                self._flush_requested = True
+                self._cond.notify_all()
+                if not block:
+                    return False
+                self._cond.wait()
+            self._seq += 1
+            self._queue.append(_Op(self._seq, thread_id, method, args))
+            self._last_seq[thread_id] = self._seq
+            self._stats["queued"] += 1
+            # Wake the writer to schedule the flush of a new oldest write, or to commit a full batch
+            if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    async def aenqueue(self, thread_id: str, method: str, *args):
+        """enqueue() for the event loop: only waits, in a worker thread, when the queue is full."""
+        if not self.enqueue(thread_id, method, *args, block=False):
+            await asyncio.to_thread(self.enqueue, thread_id, method, *args)
+
+    def has_pending(self, thread_id: Optional[str] = None) -> bool:
+        with self._cond:
+            if thread_id is None:
+                return bool(self._queue)
+            return self._last_seq.get(thread_id, 0) > self._committed_seq
+
+    def flush(self, thread_id: Optional[str] = None, timeout: Optional[float] = None):
+        """
+        Wait until queued writes are committed.
+
+        Args:
+            thread_id: Only wait for the writes of this thread (None = all)
+            timeout: Seconds to wait (None = until committed)
+
+        Raises:
+            RuntimeError: The database became unavailable while waiting, or the timeout expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._seq if thread_id is None else self._last_seq.get(thread_id, 0)
+            if target <= self._committed_seq:
+                return
+            self._stats["read_flushes"] += 1
+            failures = self._stats["failures"]
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._committed_seq < target:
+                if self._stats["failures"] != failures:
+                    # Other failures are resolved by committing the batch write by write
+                    if self._closed or isinstance(self._last_error, psycopg.OperationalError):
+                        raise RuntimeError(f"Checkpoint flush failed: {self._last_error}")
+                    failures = self._stats["failures"]
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise RuntimeError("Timed out waiting for pending checkpoint writes")
+                self._cond.wait(remaining)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Sleep until a flush is due: the oldest write is `interval` old,
+                # a batch is full, a reader needs its thread, or we are closing
+                while True:
+                    if self._queue and (self._flush_requested or self._closed
+                                        or len(self._queue) >= self.batch_size):
+                        break
+                    if self._closed:
+                        return
+                    if self._queue:
+                        wait = self._queue[0].queued_at + self.interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                self._flush_requested = False
+                batch = [self._queue[i] for i in range(min(self.batch_size, len(self._queue)))]
+
+            try:
+                self._commit(batch)
+            except Exception as e:
+                with self._cond:
+                    self._failures += 1
+                    self._stats["failures"] += 1
+                    self._last_error = e
+                    self._cond.notify_all()
+                    closed = self._closed
+                logger.error(f"❌ Error committing {len(batch)} checkpoint writes: {str(e)}")
+                # Give up on shutdown so exit is not blocked forever
+                if closed:
+                    logger.error(f"❌ Dropping {len(self._queue)} pending checkpoint writes on shutdown")
+                    return
+                done, dropped = (0, 0) if isinstance(e, psycopg.OperationalError) else self._commit_each(batch)
+                if done:
+                    self._done(batch[:done], dropped)
+                else:
+                    # The database is unavailable: retry the same writes
+                    time.sleep(min(5.0, 0.1 * 2 ** min(self._failures, 6)))
+                continue
+
+            self._done(batch)
+            with self._cond:
+                self._stats["batches"] += 1
+
+    def _commit_each(self, batch: list) -> Tuple[int, int]:
+        """
+        Commit the writes of a failed batch one at a time, dropping those that keep failing.
+
+        Later writes of a thread build on its earlier ones (a checkpoint refers
+        to the message log rows and parent checkpoint queued before it), so
+        they are dropped along with a failed write of their thread.
+
+        Returns:
+            How many writes from the start of the batch were committed or
+            dropped, and how many of those were dropped; the rest are left
+            queued once the database becomes unavailable
+        """
+        failed = set()
+        dropped = 0
+        for i, op in enumerate(batch):
+            if op.thread_id in failed:
+                logger.error(f"❌ Dropping checkpoint {op.method} of thread_id {op.thread_id} "
+                             f"after a failed write of the thread")
+                dropped += 1
+                continue
+            for attempt in range(1, OP_ATTEMPTS + 1):
+                try:
+                    self._commit([op])
+                    break
+                except psycopg.OperationalError:
+                    return i, dropped
+                except Exception as e:
+                    if attempt < OP_ATTEMPTS:
+                        time.sleep(0.1 * 2 ** attempt)
+                        continue
+                    logger.error(f"❌ Dropping checkpoint {op.method} of thread_id {op.thread_id} "
+                                 f"after {attempt} failed attempts: {str(e)}")
+                    failed.add(op.thread_id)
+                    dropped += 1
+                    if self.on_drop is not None:
+                        self.on_drop(op.thread_id)
+        return len(batch), dropped
+
+    def _done(self, ops: list, dropped: int = 0):
+        """Remove committed (or dropped) writes from the head of the queue."""
+        with self._cond:
+            for _ in ops:
+                self._queue.popleft()
+            self._committed_seq = ops[-1].seq
+            for thread_id in {op.thread_id for op in ops}:
+                if self._last_seq.get(thread_id, 0) <= self._committed_seq:
+                    del self._last_seq[thread_id]
+            self._failures = 0
+            self._stats["committed"] += len(ops) - dropped
+            self._stats["dropped"] += dropped
+            self._cond.notify_all()
+
+    def _commit(self, batch: list):
+        start = time.perf_counter()
+        with self.pool.connection() as conn, conn.transaction():
+            # A saver bound to this connection runs every write in the same transaction
+            saver = PostgresSaver(conn, serde=self.saver.serde)
+            for op in batch:
+                if op.method == "executemany":
+                    conn.cursor().executemany(*op.args)
+                else:
+                    getattr(saver, op.method)(*op.args)
+        CHECKPOINT_DURATION.observe(time.perf_counter() - start, operation="flush")
+        CHECKPOINT_FLUSH_SIZE.observe(len(batch))
+
+    def stats(self) -> dict:
+        """Queue depth and lag (age of the oldest pending write, in seconds) plus counters since start."""
+        with self._cond:
+            lag = time.monotonic() - self._queue[0].queued_at if self._queue else 0.0
+            return {**self._stats, "pending": len(self._queue), "lag_seconds": round(lag, 3)}
+
+    def close(self, timeout: float = 30):
+        """Commit every pending write and stop the writer thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            pending = len(self._queue)
+            self._cond.notify_all()
+        if pending:
+            logger.info(f"💾 Flushing {pending} pending checkpoint writes")
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"❌ Checkpoint writes still pending after {timeout:.0f}s")
+
+def _thread_id(config) -> Optional[str]:
+    return (config or {}).get("configurable", {}).get("thread_id")
+
+def _next_config(config, checkpoint) -> dict:
+    # The config PostgresSaver.put returns for the stored checkpoint
+    return {
+        "configurable": {
+            "thread_id": config["configurable"]["thread_id"],
+            "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+            "checkpoint_id": checkpoint["id"],
+        }
+    }
+
+class WriteBehindSaver(BaseCheckpointSaver):
+    """
+    Checkpointer wrapper deferring writes to a CheckpointWriter.
+
+    put/put_writes (and their async variants) return as soon as the write is
+    queued. Reads of a thread with pending writes first wait for them to be
+    committed, so a thread always reads its own writes. Reads and deletes are
+    delegated to the wrapped saver, which may be sync or async.
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver, writer: CheckpointWriter):
+        self.saver = saver
+        self.writer = writer
+        super().__init__(serde=saver.serde)
+
+    @property
+    def serde(self):
+        return self.saver.serde
+
+    @serde.setter
+    def serde(self, serde):
+        # Wrappers of this saver (see metrics.TimedCheckpointer) replace the
+        # serializer of the saver doing the reads
+        self.saver.serde = serde
+
+    def __getattr__(self, name):
+        if name == "saver":
+            raise AttributeError(name)
+        return getattr(self.saver, name)
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    @staticmethod
+    def _copy(checkpoint):
+        # channel_values is copied because the graph keeps using the checkpoint
+        return {**checkpoint, "channel_values": checkpoint["channel_values"].copy()}
+
+    def get_tuple(self, config):
+        self.writer.flush(_thread_id(config))
+        return self.saver.get_tuple(config)
+
+    def list(self, config, **kwargs):
+        self.writer.flush(_thread_id(config))
+        return self.saver.list(config, **kwargs)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        checkpoint = self._copy(checkpoint)
+        self.writer.enqueue(_thread_id(config), "put", config, checkpoint, metadata, new_versions)
+        return _next_config(config, checkpoint)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self.writer.enqueue(_thread_id(config), "put_writes", config, list(writes), task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        self.writer.flush(thread_id)
+        return self.saver.delete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.saver.get_next_version(current, channel)
+
+    def get_delta_channel_history(self, *, config, channels):
+        self.writer.flush(_thread_id(config))
+        return self.saver.get_delta_channel_history(config=config, channels=channels)
+
+    async def _aflush(self, thread_id: Optional[str]):
+        if self.writer.has_pending(thread_id):
+            await asyncio.to_thread(self.writer.flush, thread_id)
+
+    async def aget_tuple(self, config):
+        await self._aflush(_thread_id(config))
+        return await self.saver.aget_tuple(config)
+
+    async def alist(self, config, **kwargs):
+        await self._aflush(_thread_id(config))
+        async for item in self.saver.alist(config, **kwargs):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        checkpoint = self._copy(checkpoint)
+        await self.writer.aenqueue(_thread_id(config), "put", config, checkpoint, metadata, new_versions)
+        return _next_config(config, checkpoint)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await self.writer.aenqueue(_thread_id(config), "put_writes", config, list(writes), task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await self._aflush(thread_id)
+        return await self.saver.adelete_thread(thread_id)
+
+    async def aget_delta_channel_history(self, *, config, channels):
+        await self._aflush(_thread_id(config))
+        return await self.saver.aget_delta_channel_history(config=config, channels=channels)